@@ -1,11 +1,32 @@
+import { readFile } from "node:fs/promises";
+import path from "node:path";
 import { DuckDBInstance, DuckDBConnection } from "@duckdb/node-api";
 
 if (!process.env.HOME || process.env.HOME === "") {
   process.env.HOME = "/tmp";
 }
 
+// Local read replica published by `python -m ingestion.replica sync`. When
+// set, queries read its current snapshot instead of MotherDuck.
+const replicaDir = process.env.DUCKDB_REPLICA_DIR;
+
+// Name the tables are read under: the --database_name the replica was synced
+// from (its snapshots are named after it), also the alias of the share.
+export const databaseName = process.env.DATABASE_NAME || "duckdb_stats";
+
 let connectionPromise: Promise<DuckDBConnection> | null = null;
 
+// The instance of the replica snapshot queries currently open on, with the
+// number of queries running on it
+interface Replica {
+  snapshot: string;
+  ready: Promise<{ instance: DuckDBInstance; connection: DuckDBConnection }>;
+  active: number;
+  retired: boolean;
+}
+
+let replica: Replica | null = null;
+
 async function createConnection(): Promise<DuckDBConnection> {
   const token = process.env.MOTHERDUCK_TOKEN;
   if (!token) {
@@ -17,11 +38,70 @@ async function createConnection(): Promise<DuckDBConnection> {
   });
   const connection = await instance.connect();
   await connection.run(
-    "ATTACH IF NOT EXISTS 'md:_share/duckdb_stats/1eb684bf-faff-4860-8e7d-92af4ff9a410' AS duckdb_stats"
+    `ATTACH IF NOT EXISTS 'md:_share/duckdb_stats/1eb684bf-faff-4860-8e7d-92af4ff9a410' AS ${databaseName}`
   );
   return connection;
 }
 
+async function openReplica(snapshot: string) {
+  const instance = await DuckDBInstance.create(":memory:");
+  const connection = await instance.connect();
+  await connection.run(`ATTACH '${snapshot}' AS ${databaseName} (READ_ONLY)`);
+  return { instance, connection };
+}
+
+function closeReplica(retired: Replica) {
+  retired.ready
+    .then(({ instance, connection }) => {
+      connection.closeSync();
+      instance.closeSync();
+    })
+    .catch(() => {});
+}
+
+async function currentSnapshot(dir: string): Promise<string> {
+  const name = await readFile(path.join(dir, "CURRENT"), "utf8");
+  return path.join(dir, name.trim());
+}
+
+async function acquireReplica(dir: string): Promise<Replica> {
+  // Snapshots are immutable and CURRENT is switched atomically: a new
+  // snapshot gets a new instance, queries in flight finish on the old one,
+  // which is closed (with its file handle) once the last of them is done
+  const snapshot = await currentSnapshot(dir);
+  let current = replica;
+  if (!current || current.snapshot !== snapshot) {
+    const previous = current;
+    const opened: Replica = {
+      snapshot,
+      ready: openReplica(snapshot),
+      active: 0,
+      retired: false,
+    };
+    opened.ready.catch(() => {
+      if (replica === opened) {
+        replica = null;
+      }
+    });
+    replica = current = opened;
+    if (previous) {
+      previous.retired = true;
+      if (previous.active === 0) {
+        closeReplica(previous);
+      }
+    }
+  }
+  current.active += 1;
+  return current;
+}
+
+function releaseReplica(released: Replica) {
+  released.active -= 1;
+  if (released.retired && released.active === 0) {
+    closeReplica(released);
+  }
+}
+
 export async function getConnection(): Promise<DuckDBConnection> {
   if (!connectionPromise) {
     connectionPromise = createConnection().catch((err) => {
@@ -33,6 +113,17 @@ export async function getConnection(): Promise<DuckDBConnection> {
 }
 
 export async function query<T>(sql: string): Promise<T[]> {
+  if (replicaDir) {
+    const current = await acquireReplica(replicaDir);
+    try {
+      const { connection } = await current.ready;
+      const reader = await connection.runAndReadAll(sql);
+      return reader.getRowObjectsJson() as T[];
+    } finally {
+      releaseReplica(current);
+    }
+  }
+
   const conn = await getConnection();
   const reader = await conn.runAndReadAll(sql);
   return reader.getRowObjectsJson() as T[];
@@ -1,4 +1,4 @@
-import { query } from "./motherduck";
+import { databaseName, query } from "./motherduck";
 import type {
   WeeklyDownload,
   MonthlyDownload,
@@ -12,89 +12,95 @@ import type {
   DashboardData,
 } from "./types";
 
+// Every query reads the small serving tables maintained incrementally by the
+// dbt project (transform/pypi_metrics/models/serving), never pypi_daily_stats.
+
 export async function getWeeklyTimeSeries(): Promise<WeeklyDownload[]> {
   return query<WeeklyDownload>(`
-    WITH last_4_weeks AS (
-      SELECT DISTINCT DATE_TRUNC('week', download_date) AS week_start_date
-      FROM duckdb_stats.main.pypi_daily_stats
-      WHERE DATE_TRUNC('week', download_date) >= DATE_TRUNC('week', CURRENT_DATE - INTERVAL '4 weeks')
-      ORDER BY week_start_date DESC
+    WITH weekly AS (
+      SELECT week_start_date, SUM(weekly_downloads) AS weekly_downloads
+      FROM ${databaseName}.main.pypi_weekly_downloads
+      GROUP BY week_start_date
     )
     SELECT
-      DATE_TRUNC('week', download_date)::VARCHAR AS week_start_date,
-      SUM(daily_download_sum)::INT AS weekly_downloads
-    FROM duckdb_stats.main.pypi_daily_stats
-    WHERE DATE_TRUNC('week', download_date) != (SELECT week_start_date FROM last_4_weeks LIMIT 1)
-    GROUP BY DATE_TRUNC('week', download_date)
-    ORDER BY week_start_date ASC
+      week_start_date::TIMESTAMP::VARCHAR AS week_start_date,
+      weekly_downloads::INT AS weekly_downloads
+    FROM weekly
+    WHERE week_start_date != (
+      SELECT MAX(week_start_date)
+      FROM weekly
+      WHERE week_start_date >= DATE_TRUNC('week', CURRENT_DATE - INTERVAL '4 weeks')
+    )
+    ORDER BY weekly.week_start_date ASC
   `);
 }
 
 export async function getLastTwoWeeks(): Promise<WeeklyDownload[]> {
   return query<WeeklyDownload>(`
-    WITH last_4_weeks AS (
-      SELECT DISTINCT DATE_TRUNC('week', download_date) AS week_start_date
-      FROM duckdb_stats.main.pypi_daily_stats
-      WHERE DATE_TRUNC('week', download_date) >= DATE_TRUNC('week', CURRENT_DATE - INTERVAL '4 weeks')
-      ORDER BY week_start_date DESC
-    ),
-    weekly AS (
+    SELECT week_start_date, weekly_downloads
+    FROM (
+      SELECT
+        last_week_start_date::TIMESTAMP::VARCHAR AS week_start_date,
+        last_week_downloads::INT AS weekly_downloads,
+        1 AS position
+      FROM ${databaseName}.main.pypi_kpis
+      UNION ALL
       SELECT
-        DATE_TRUNC('week', download_date)::VARCHAR AS week_start_date,
-        SUM(daily_download_sum)::INT AS weekly_downloads
-      FROM duckdb_stats.main.pypi_daily_stats
-      WHERE DATE_TRUNC('week', download_date) != (SELECT week_start_date FROM last_4_weeks LIMIT 1)
-      GROUP BY DATE_TRUNC('week', download_date)
-      ORDER BY week_start_date DESC
+        previous_week_start_date::TIMESTAMP::VARCHAR,
+        previous_week_downloads::INT,
+        2
+      FROM ${databaseName}.main.pypi_kpis
     )
-    SELECT * FROM weekly LIMIT 2
+    WHERE week_start_date IS NOT NULL
+    ORDER BY position
   `);
 }
 
 export async function getMonthlyDownloads(): Promise<MonthlyDownload[]> {
   return query<MonthlyDownload>(`
     SELECT
-      CONCAT(
-        date_part('year', date_trunc('month', download_date)),
-        '-',
-        LPAD(CAST(date_part('month', date_trunc('month', download_date)) AS VARCHAR), 2, '0')
-      ) AS year_month,
-      SUM(daily_download_sum)::INT AS monthly_downloads
-    FROM duckdb_stats.main.pypi_daily_stats
-    GROUP BY date_trunc('month', download_date)
-    ORDER BY date_trunc('month', download_date) DESC
+      strftime(month_start_date, '%Y-%m') AS year_month,
+      SUM(monthly_downloads)::INT AS monthly_downloads
+    FROM ${databaseName}.main.pypi_monthly_downloads
+    GROUP BY month_start_date
+    ORDER BY month_start_date DESC
     LIMIT 6
   `);
 }
 
 export async function getLastTwoMonths(): Promise<MonthlyDownload[]> {
   return query<MonthlyDownload>(`
-    SELECT
-      CONCAT(
-        date_part('year', date_trunc('month', download_date)),
-        '-',
-        LPAD(CAST(date_part('month', date_trunc('month', download_date)) AS VARCHAR), 2, '0')
-      ) AS year_month,
-      SUM(daily_download_sum)::INT AS monthly_downloads
-    FROM duckdb_stats.main.pypi_daily_stats
-    GROUP BY date_trunc('month', download_date)
-    ORDER BY date_trunc('month', download_date) DESC
-    LIMIT 2 OFFSET 1
+    SELECT year_month, monthly_downloads
+    FROM (
+      SELECT
+        strftime(last_month_start_date, '%Y-%m') AS year_month,
+        last_month_downloads::INT AS monthly_downloads,
+        1 AS position
+      FROM ${databaseName}.main.pypi_kpis
+      UNION ALL
+      SELECT
+        strftime(previous_month_start_date, '%Y-%m'),
+        previous_month_downloads::INT,
+        2
+      FROM ${databaseName}.main.pypi_kpis
+    )
+    WHERE year_month IS NOT NULL
+    ORDER BY position
   `);
 }
 
 export async function getTotalDownloads(): Promise<number> {
   const rows = await query<TotalDownloads>(`
-    SELECT SUM(daily_download_sum)::BIGINT AS total_downloads
-    FROM duckdb_stats.main.pypi_daily_stats
+    SELECT total_downloads::BIGINT AS total_downloads
+    FROM ${databaseName}.main.pypi_kpis
   `);
   return Number(rows[0]?.total_downloads ?? 0);
 }
 
 export async function getRefreshDate(): Promise<string> {
   const rows = await query<RefreshDate>(`
-    SELECT MAX(download_date)::VARCHAR AS max_date
-    FROM duckdb_stats.main.pypi_daily_stats
+    SELECT refresh_date::VARCHAR AS max_date
+    FROM ${databaseName}.main.pypi_kpis
   `);
   return rows[0]?.max_date ?? "";
 }
@@ -103,55 +109,43 @@ function dateFilter(days: number): string {
   return days > 0 ? `WHERE download_date >= CURRENT_DATE - INTERVAL '${days} days'` : "";
 }
 
-export async function getDuckDBVersions(days: number): Promise<VersionDownload[]> {
-  return query<VersionDownload>(`
+// Top 10 values of a breakdown dimension over a dashboard period (0 = all time)
+function breakdownQuery(dimension: string, alias: string, days: number): string {
+  return `
     SELECT
-      version AS duckdb_version,
-      SUM(daily_download_sum)::INT AS total_downloads
-    FROM duckdb_stats.main.pypi_daily_stats
-    ${dateFilter(days)}
-    GROUP BY version
+      value AS ${alias},
+      SUM(downloads)::INT AS total_downloads
+    FROM ${databaseName}.main.pypi_period_breakdowns
+    WHERE period_days = ${days} AND dimension = '${dimension}'
+    GROUP BY value
     ORDER BY total_downloads DESC
     LIMIT 10
-  `);
+  `;
+}
+
+export async function getDuckDBVersions(days: number): Promise<VersionDownload[]> {
+  return query<VersionDownload>(breakdownQuery("version", "duckdb_version", days));
 }
 
 export async function getPythonVersions(days: number): Promise<PythonVersionDownload[]> {
-  return query<PythonVersionDownload>(`
-    SELECT
-      python_version,
-      SUM(daily_download_sum)::INT AS total_downloads
-    FROM duckdb_stats.main.pypi_daily_stats
-    ${dateFilter(days)}
-    GROUP BY python_version
-    ORDER BY total_downloads DESC
-    LIMIT 10
-  `);
+  return query<PythonVersionDownload>(breakdownQuery("python_version", "python_version", days));
 }
 
 export async function getTopCountries(days: number): Promise<CountryDownload[]> {
-  return query<CountryDownload>(`
-    SELECT
-      country_code,
-      SUM(daily_download_sum)::INT AS total_downloads
-    FROM duckdb_stats.main.pypi_daily_stats
-    ${dateFilter(days)}
-    GROUP BY country_code
-    ORDER BY total_downloads DESC
-    LIMIT 10
-  `);
+  return query<CountryDownload>(breakdownQuery("country_code", "country_code", days));
 }
 
 export async function getVersionAdoption(): Promise<VersionAdoption[]> {
   return query<VersionAdoption>(`
     SELECT
       download_date::VARCHAR AS download_date,
-      version,
-      SUM(daily_download_sum)::INT AS downloads
-    FROM duckdb_stats.main.pypi_daily_stats
-    WHERE version NOT LIKE '%dev%'
-      AND (version LIKE '1.2%' OR version LIKE '1.3%' OR version LIKE '1.4%')
-    GROUP BY download_date, version
+      value AS version,
+      SUM(downloads)::INT AS downloads
+    FROM ${databaseName}.main.pypi_dimension_daily_downloads
+    WHERE dimension = 'version'
+      AND value NOT LIKE '%dev%'
+      AND (value LIKE '1.2%' OR value LIKE '1.3%' OR value LIKE '1.4%')
+    GROUP BY download_date, value
     ORDER BY download_date ASC
   `);
 }
@@ -160,8 +154,8 @@ export async function getDailyDownloads(days: number): Promise<DailyDownload[]>
   return query<DailyDownload>(`
     SELECT
       download_date::VARCHAR AS download_date,
-      SUM(daily_download_sum)::INT AS daily_downloads
-    FROM duckdb_stats.main.pypi_daily_stats
+      SUM(daily_downloads)::INT AS daily_downloads
+    FROM ${databaseName}.main.pypi_daily_downloads
     ${dateFilter(days)}
     GROUP BY download_date
     ORDER BY download_date ASC
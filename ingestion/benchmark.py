@@ -0,0 +1,358 @@
+"""
+Offline benchmark of the ingestion pipeline.
+
+Generates a synthetic `file_downloads` dataset with the schema of the public
+PyPI table (nested `file` / `details` structs, skewed project, country, Python
+and system distributions) and runs the real pipeline on it, with a local
+Parquet file standing in for `bigquery_scan` and a local DuckDB file standing
+in for MotherDuck. Neither GCP nor MotherDuck credentials are needed, so runs
+are repeatable and comparable across code changes.
+
+    python -m ingestion.benchmark generate --rows 10000000
+    python -m ingestion.benchmark run --rows 10000000 --window_days 1 --workers 4
+
+`run` reports rows/s, peak RSS and per-stage wall time. Peak RSS is
+process-wide, generate the source with `generate` first to keep the generation
+out of the measurement.
+"""
+
+import os
+import re
+import time
+from datetime import date, timedelta
+from typing import Dict, Optional
+
+import duckdb
+import fire
+from loguru import logger
+from pydantic import BaseModel
+
+from ingestion.bigquery import build_bigquery_filter
+from ingestion.duck import MotherDuckBigQueryLoader
+from ingestion.instrumentation import RunRecorder, RunReport, peak_rss_bytes
+from ingestion.models import PypiJobParameters
+from ingestion.pipeline import report_run, run_pipeline
+from ingestion.quality import load_rules
+from ingestion.session import LoaderSession
+
+DEFAULT_SOURCE_PATH = "benchmark/file_downloads_{rows}.parquet"
+DEFAULT_DESTINATION_PATH = "benchmark/destination.duckdb"
+
+# Value pools, most frequent first: draws are skewed towards the head of each
+# list, like the real download distributions.
+_HEAD_PROJECTS = ["duckdb", "boto3", "urllib3", "requests", "numpy", "pandas"]
+_COUNTRIES = ["US", "CN", "DE", "IE", "GB", "FR", "JP", "IN", "SG", "BR", "CA", "FI"]
+_VERSIONS = ["1.1.3", "1.1.2", "1.0.0", "0.10.3", "0.9.2", "0.8.1", "0.7.1"]
+_PYTHONS = ["3.11.9", "3.12.4", "3.10.14", "3.9.19", "3.8.18", "3.13.0", "3.7.17"]
+_SYSTEMS = [
+    ("Linux", "6.1.0-18-amd64"),
+    ("Linux", "5.15.0-1057-aws"),
+    ("Windows", "10"),
+    ("Darwin", "23.4.0"),
+    ("Linux", "4.14.336-257.562.amzn2.x86_64"),
+]
+_CPUS = ["x86_64", "aarch64", "AMD64", "arm64"]
+_INSTALLERS = [
+    ("pip", "24.0"),
+    ("uv", "0.4.18"),
+    ("poetry", "1.8.3"),
+    ("bandersnatch", "6.5.0"),
+]
+_TLS_CIPHERS = ["TLS_AES_128_GCM_SHA256", "ECDHE-RSA-AES128-GCM-SHA256"]
+
+
+class BenchmarkResult(BaseModel):
+    """Outcome of one benchmark run"""
+
+    rows: int
+    elapsed_seconds: float
+    peak_rss_bytes: int
+    stage_seconds: Dict[str, float]
+    report: RunReport
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+
+def _sql_list(values: list) -> str:
+    return "[" + ", ".join(f"'{v}'" for v in values) + "]"
+
+
+def _pick(values: list, draw: str, skew: float) -> str:
+    """Element of a SQL list literal chosen by a uniform draw in [0, 1); a
+    `skew` above 1 concentrates the choice on the first elements."""
+    return f"{_sql_list(values)}[1 + floor({len(values)} * pow({draw}, {skew}))::INT]"
+
+
+def generate_downloads(
+    path: str,
+    rows: int,
+    start_date: str = "2023-01-01",
+    days: int = 7,
+    projects: int = 1000,
+    seed: float = 0.42,
+) -> str:
+    """
+    Write `rows` synthetic download rows spread over `days` days from
+    `start_date` to a Parquet file, with the column layout of
+    `bigquery-public-data.pypi.file_downloads`. The project is drawn from
+    `projects` names with a heavy head (`duckdb` first) and a long tail.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tail = [f"pypi-project-{i}" for i in range(max(projects - len(_HEAD_PROJECTS), 0))]
+    project_pool = (_HEAD_PROJECTS + tail)[:projects]
+    span_us = days * 24 * 3600 * 1_000_000
+
+    conn = duckdb.connect(database=":memory:")
+    try:
+        conn.execute(f"SELECT setseed({seed})")
+        conn.execute(f"""
+            COPY (
+                WITH draws AS (
+                    SELECT
+                        TIMESTAMPTZ '{start_date} 00:00:00+00'
+                            + to_microseconds((random() * {span_us})::BIGINT)
+                            AS timestamp,
+                        {_pick(project_pool, "random()", 6)} AS project,
+                        {_pick(_VERSIONS, "random()", 2)} AS version,
+                        {_pick(_COUNTRIES, "random()", 2)} AS country_code,
+                        {_pick(_PYTHONS, "random()", 1.5)} AS python,
+                        floor({len(_SYSTEMS)} * pow(random(), 1.5))::INT AS system_idx,
+                        floor({len(_INSTALLERS)} * pow(random(), 3))::INT
+                            AS installer_idx,
+                        {_pick(_CPUS, "random()", 2)} AS cpu,
+                        random() AS r
+                    FROM range({rows})
+                ),
+                rows AS (
+                    SELECT
+                        *,
+                        project || '-' || version
+                            || '-py3-none-manylinux2014_x86_64.whl' AS filename,
+                        {_sql_list([s[0] for s in _SYSTEMS])}[system_idx + 1]
+                            AS system_name,
+                        {_sql_list([s[1] for s in _SYSTEMS])}[system_idx + 1]
+                            AS system_release,
+                        {_sql_list([i[0] for i in _INSTALLERS])}[installer_idx + 1]
+                            AS installer_name,
+                        {_sql_list([i[1] for i in _INSTALLERS])}[installer_idx + 1]
+                            AS installer_version
+                    FROM draws
+                )
+                SELECT
+                    timestamp,
+                    CASE WHEN r < 0.01 THEN NULL ELSE country_code END AS country_code,
+                    '/packages/' || left(md5(filename), 2) || '/'
+                        || substr(md5(filename), 3, 2) || '/' || md5(filename) || '/'
+                        || filename AS url,
+                    project,
+                    {{
+                        'filename': filename,
+                        'project': project,
+                        'version': version,
+                        'type': 'bdist_wheel'
+                    }} AS file,
+                    {{
+                        'installer': {{
+                            'name': installer_name, 'version': installer_version
+                        }},
+                        'python': CASE WHEN r < 0.03 THEN NULL ELSE python END,
+                        'implementation': {{'name': 'CPython', 'version': python}},
+                        'distro': {{
+                            'name': 'Ubuntu',
+                            'version': '22.04',
+                            'id': 'jammy',
+                            'libc': {{'lib': 'glibc', 'version': '2.35'}}
+                        }},
+                        'system': {{'name': system_name, 'release': system_release}},
+                        'cpu': cpu,
+                        'openssl_version': 'OpenSSL 3.0.2 15 Mar 2022',
+                        'setuptools_version': '69.5.1',
+                        'rustc_version': NULL
+                    }} AS details,
+                    CASE WHEN r < 0.9 THEN 'TLSv1.3' ELSE 'TLSv1.2' END AS tls_protocol,
+                    {_pick(_TLS_CIPHERS, "r", 4)} AS tls_cipher
+                FROM rows
+            ) TO '{path}' (FORMAT PARQUET, COMPRESSION 'ZSTD')
+        """)
+    finally:
+        conn.close()
+
+    logger.info(f"Generated {rows:,} synthetic download rows in {path}")
+    return path
+
+
+def bigquery_filter_to_duckdb(filter_str: str) -> str:
+    """Translate a row restriction built by `build_bigquery_filter` (BigQuery
+    standard SQL) to a DuckDB WHERE clause."""
+    filter_str = re.sub(r'TIMESTAMP\("([^"]*)"\)', r"TIMESTAMP '\1'", filter_str)
+    return re.sub(r'"([^"]*)"', r"'\1'", filter_str)
+
+
+class LocalSourceLoader(MotherDuckBigQueryLoader):
+    """
+    The MotherDuck loader with its BigQuery scan replaced by a read of a local
+    Parquet file, and MotherDuck replaced by a local DuckDB file attached under
+    the MotherDuck database name. Every other step (temp tables, validation,
+    transactions, copy modes, sinks) is the production code.
+    """
+
+    def __init__(
+        self,
+        source_path: str,
+        destination_path: str,
+        motherduck_database: str,
+        motherduck_table: str,
+        recorder: RunRecorder | None = None,
+        **loader_kwargs,
+    ):
+        super().__init__(
+            motherduck_database=motherduck_database,
+            motherduck_table=motherduck_table,
+            project_id="offline-benchmark",
+            attach_motherduck=False,
+            recorder=recorder,
+            bigquery_extension=False,
+            **loader_kwargs,
+        )
+        self.source_path = source_path
+        self.conn.execute(
+            f"ATTACH IF NOT EXISTS '{destination_path}' AS {motherduck_database}"
+        )
+
+    def _bigquery_scan_sql(
+        self, table: str, filter_str: str, columns: list[str]
+    ) -> str:
+        return f"""
+            SELECT {", ".join(columns)}
+            FROM read_parquet('{self.source_path}')
+            WHERE {bigquery_filter_to_duckdb(filter_str)}
+        """
+
+
+def run_benchmark(
+    source_path: str,
+    destination_path: str,
+    params: PypiJobParameters,
+    session: LoaderSession | None = None,
+) -> BenchmarkResult:
+    """Run the pipeline for `params` against the local stand-ins and measure it.
+    `params.destination` must be `md` (the local stand-in). Runs may share a
+    `session`, as the jobs of a driver script do."""
+    if params.destinations != ["md"]:
+        raise ValueError("Benchmarks write to the local md stand-in only")
+
+    recorder = RunRecorder(profile_queries=params.profile_queries)
+    loader = LocalSourceLoader(
+        source_path,
+        destination_path,
+        params.database_name,
+        params.table_name,
+        recorder=recorder,
+        quality_rules=load_rules(params.quality_rules)
+        if params.quality_rules
+        else None,
+        profile_table=params.quality_profile_table,
+        session=session,
+        layout=params.layout,
+        dimension_encoding=params.ingestion_profile == "compact",
+        sample_table=params.sample_table if params.sample_fraction else None,
+        sample_fraction=params.sample_fraction,
+    )
+    started = time.perf_counter()
+    status = "failed"
+    try:
+        run_pipeline(params, recorder, loader=loader)
+        status = "ok"
+    finally:
+        elapsed = time.perf_counter() - started
+        report_run(params, recorder, status)
+
+    # Rows in the requested range of the source, whatever the load mode wrote
+    rows = loader.conn.execute(f"""
+        SELECT COUNT(*) FROM read_parquet('{source_path}')
+        WHERE {bigquery_filter_to_duckdb(build_bigquery_filter(params))}
+    """).fetchone()[0]
+    loader.conn.close()
+
+    stage_seconds: Dict[str, float] = {}
+    for stage in recorder.stages:
+        stage_seconds[stage.stage] = (
+            stage_seconds.get(stage.stage, 0.0) + stage.wall_seconds
+        )
+
+    return BenchmarkResult(
+        rows=rows,
+        elapsed_seconds=elapsed,
+        peak_rss_bytes=peak_rss_bytes(),
+        stage_seconds=stage_seconds,
+        report=recorder.report(params.model_dump(), status),
+    )
+
+
+def generate(
+    rows: int = 1_000_000,
+    path: Optional[str] = None,
+    start_date: str = "2023-01-01",
+    days: int = 7,
+    projects: int = 1000,
+):
+    """CLI: generate the synthetic source dataset."""
+    generate_downloads(
+        path or DEFAULT_SOURCE_PATH.format(rows=rows),
+        rows,
+        start_date=start_date,
+        days=days,
+        projects=projects,
+    )
+
+
+def run(
+    rows: int = 1_000_000,
+    source_path: Optional[str] = None,
+    destination_path: str = DEFAULT_DESTINATION_PATH,
+    start_date: str = "2023-01-01",
+    days: int = 7,
+    fresh: bool = True,
+    **job_kwargs,
+):
+    """
+    CLI: benchmark one pipeline configuration. Extra flags are passed to
+    PypiJobParameters (e.g. --window_days, --workers, --copy_mode, --streaming,
+    --ingestion_profile, --rollup, --pypi_project, --report_path).
+    """
+    source_path = source_path or DEFAULT_SOURCE_PATH.format(rows=rows)
+    if not os.path.exists(source_path):
+        generate(rows, source_path, start_date=start_date, days=days)
+    job_kwargs.setdefault(
+        "manifest_path",
+        os.path.join(os.path.dirname(destination_path), "manifest.duckdb"),
+    )
+    if fresh:
+        for path in (destination_path, job_kwargs["manifest_path"]):
+            if os.path.exists(path):
+                os.remove(path)
+    os.makedirs(os.path.dirname(destination_path) or ".", exist_ok=True)
+
+    end_date = (date.fromisoformat(start_date) + timedelta(days=days)).isoformat()
+    params = PypiJobParameters(
+        start_date=start_date,
+        end_date=end_date,
+        gcp_project="offline-benchmark",
+        destination="md",
+        **job_kwargs,
+    )
+    result = run_benchmark(source_path, destination_path, params)
+
+    logger.info(
+        f"Benchmark: {result.rows:,} rows in {result.elapsed_seconds:.2f}s "
+        f"({result.rows_per_second:,.0f} rows/s), "
+        f"peak RSS {result.peak_rss_bytes / 1024 / 1024:,.0f} MiB"
+    )
+    for stage, seconds in sorted(result.stage_seconds.items(), key=lambda s: -s[1]):
+        logger.info(f"  {stage}: {seconds:.2f}s")
+
+
+if __name__ == "__main__":
+    fire.Fire({"generate": generate, "run": run})
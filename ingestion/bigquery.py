@@ -1,3 +1,5 @@
+from datetime import date, timedelta
+
 from ingestion.models import PypiJobParameters
 
 PYPI_PUBLIC_TABLE = "bigquery-public-data.pypi.file_downloads"
@@ -13,13 +15,73 @@ COLUMNS = [
     "tls_cipher",
 ]
 
+# Narrow, flattened projection of the fields read by the dbt model
+# `pypi_daily_stats` (transform/pypi_metrics/models/pypi_daily_stats.sql).
+# Nested struct fields are selected individually so the heavy `details` and
+# `file` STRUCTs are never materialized whole.
+LEAN_COLUMNS = [
+    "timestamp",
+    "country_code",
+    "project",
+    "file.version AS version",
+    "details.system.name AS system_name",
+    "details.system.release AS system_release",
+    "details.cpu AS cpu",
+    "details.python AS python",
+]
+
+# Lean projection plus the TLS attributes, all flat strings, for the
+# dimension-encoded storage of `ingestion.dimensions`
+COMPACT_COLUMNS = LEAN_COLUMNS + ["tls_protocol", "tls_cipher"]
+
+COLUMN_PROFILES = {
+    "raw": COLUMNS,
+    "lean": LEAN_COLUMNS,
+    "compact": COMPACT_COLUMNS,
+}
+
+
+def get_columns(profile: str) -> list[str]:
+    """Return the bigquery_scan projection for an ingestion profile."""
+    if profile not in COLUMN_PROFILES:
+        raise ValueError(
+            f"Unknown ingestion profile '{profile}', "
+            f"use one of {', '.join(COLUMN_PROFILES)}"
+        )
+    return COLUMN_PROFILES[profile]
+
 
 def build_bigquery_filter(params: PypiJobParameters) -> str:
     """Build a BigQuery Storage Read API row restriction filter for PyPI file downloads.
     This filter is passed directly to bigquery_scan's filter parameter.
+    Several projects are read with a single IN restriction, i.e. one scan session.
     """
+    projects = [f'"{project}"' for project in params.projects]
+    if len(projects) == 1:
+        project_filter = f"project = {projects[0]}"
+    else:
+        project_filter = f"project IN ({', '.join(projects)})"
     return (
-        f'project = "{params.pypi_project}" '
+        f"{project_filter} "
         f'AND {params.timestamp_column} >= TIMESTAMP("{params.start_date}") '
         f'AND {params.timestamp_column} < TIMESTAMP("{params.end_date}")'
     )
+
+
+def split_date_range(
+    start_date: str, end_date: str, window_days: int = 1
+) -> list[tuple[str, str]]:
+    """Split the half-open range [start_date, end_date) into consecutive windows
+    of `window_days` days. The last window is truncated at end_date.
+    """
+    if window_days < 1:
+        raise ValueError("window_days must be >= 1")
+
+    start = date.fromisoformat(start_date)
+    end = date.fromisoformat(end_date)
+    windows = []
+    while start < end:
+        window_end = min(start + timedelta(days=window_days), end)
+        windows.append((start.isoformat(), window_end.isoformat()))
+        start = window_end
+    return windows
@@ -0,0 +1,267 @@
+"""
+Dimension encoding of the low-cardinality download attributes.
+
+With the "compact" ingestion profile the destination table keeps `timestamp`
+and `project` and stores every other attribute as the integer id of its value
+in a dimension table `pypi_dim_<attribute>` (id, value, derived columns) next
+to it. Small dense integers bitpack far better than strings and group, join
+and compare without hashing strings.
+
+The version dimension holds the PEP 440 components of each version and a
+`sort_key` ordering them as pip does, and the python dimension the
+major.minor `python_version`, so "latest N versions" or adoption ordering
+never parse strings at query time:
+
+    SELECT value FROM pypi_dim_version WHERE is_valid
+    ORDER BY sort_key DESC LIMIT 5
+
+New values are appended by `update_dimensions` before each write; ids are
+never reassigned, so existing rows keep their meaning. `{table}_decoded` is a
+view of the destination table with the values joined back.
+"""
+
+from typing import Dict, Optional, Tuple
+
+import duckdb
+
+DIMENSION_PREFIX = "pypi_dim_"
+
+# Loose PEP 440 version pattern (packaging's VERSION_PATTERN), matched
+# case-insensitively against the whole value
+PEP440_PATTERN = (
+    r"^\s*v?(?:(\d+)!)?(\d+(?:\.\d+)*)"
+    r"(?:[-_.]?(a|b|c|rc|alpha|beta|pre|preview)[-_.]?(\d+)?)?"
+    r"(?:-(\d+)|[-_.]?(post|rev|r)[-_.]?(\d+)?)?"
+    r"(?:[-_.]?(dev)[-_.]?(\d+)?)?"
+    r"(?:\+([a-z0-9]+(?:[-_.][a-z0-9]+)*))?\s*$"
+)
+_PEP440_GROUPS = [
+    "epoch",
+    "release",
+    "pre_l",
+    "pre_n",
+    "post_n1",
+    "post_l",
+    "post_n2",
+    "dev_l",
+    "dev_n",
+    "local",
+]
+
+
+def _number(group: str, default: str = "NULL") -> str:
+    return f"COALESCE(NULLIF(v.{group}, '')::BIGINT, {default})"
+
+
+_RELEASE = (
+    "CASE WHEN v.release = '' THEN NULL "
+    "ELSE list_transform(string_split(v.release, '.'), x -> x::BIGINT) END"
+)
+_PRE_PHASE = """CASE lower(v.pre_l)
+        WHEN '' THEN NULL
+        WHEN 'alpha' THEN 'a'
+        WHEN 'beta' THEN 'b'
+        WHEN 'a' THEN 'a'
+        WHEN 'b' THEN 'b'
+        ELSE 'rc'
+    END"""
+_POST = f"""CASE
+        WHEN v.post_n1 != '' THEN v.post_n1::BIGINT
+        WHEN v.post_l != '' THEN {_number("post_n2", "0")}
+    END"""
+_DEV = f"CASE WHEN v.dev_l != '' THEN {_number('dev_n', '0')} END"
+
+# Derived columns of the version dimension, as (type, expression) over the
+# groups `v` of PEP440_PATTERN. NULL components for non PEP 440 versions.
+VERSION_COLUMNS: Dict[str, Tuple[str, str]] = {
+    "is_valid": ("BOOLEAN", "v.release != ''"),
+    "epoch": ("BIGINT", f"CASE WHEN v.release != '' THEN {_number('epoch', '0')} END"),
+    "release": ("BIGINT[]", _RELEASE),
+    "major": ("BIGINT", f"({_RELEASE})[1]"),
+    "minor": ("BIGINT", f"({_RELEASE})[2]"),
+    "micro": ("BIGINT", f"({_RELEASE})[3]"),
+    "pre_phase": ("VARCHAR", _PRE_PHASE),  # a, b or rc
+    "pre_number": (
+        "BIGINT",
+        f"CASE WHEN v.pre_l != '' THEN {_number('pre_n', '0')} END",
+    ),
+    "post_number": ("BIGINT", _POST),
+    "dev_number": ("BIGINT", _DEV),
+    "local": ("VARCHAR", "NULLIF(v.local, '')"),
+    "is_prerelease": (
+        "BOOLEAN",
+        "v.release != '' AND (v.pre_l != '' OR v.dev_l != '')",
+    ),
+    # PEP 440 ordering: trailing zeros of the release are not significant,
+    # X.devN < X.aN < X.bN < X.rcN < X < X.postN, dev releases of a pre or
+    # post release come right before it; the local label is ignored
+    "sort_key": (
+        (
+            "STRUCT(epoch BIGINT, release BIGINT[], pre_rank INTEGER, "
+            "pre_number BIGINT, post_number BIGINT, dev_number BIGINT)"
+        ),
+        f"""CASE WHEN v.release != '' THEN {{
+            'epoch': {_number("epoch", "0")},
+            'release': list_transform(
+                string_split(regexp_replace(v.release, '(\\.0+)+$', ''), '.'),
+                x -> x::BIGINT
+            ),
+            'pre_rank': CASE
+                WHEN v.pre_l = '' AND v.post_n1 = '' AND v.post_l = ''
+                    AND v.dev_l != '' THEN -1
+                WHEN v.pre_l = '' THEN 3
+                ELSE CASE ({_PRE_PHASE}) WHEN 'a' THEN 0 WHEN 'b' THEN 1 ELSE 2 END
+            END,
+            'pre_number': {_number("pre_n", "0")},
+            'post_number': COALESCE({_POST}, -1),
+            'dev_number': COALESCE({_DEV}, 9223372036854775807)
+        }} END""",
+    ),
+}
+
+# Encoded attribute -> derived columns of its dimension table. The attribute
+# names are the flattened columns of the compact ingestion profile.
+DIMENSIONS: Dict[str, Dict[str, Tuple[str, str]]] = {
+    "country_code": {},
+    "version": VERSION_COLUMNS,
+    "system_name": {},
+    "system_release": {},
+    "cpu": {},
+    "python": {
+        "python_version": (
+            "VARCHAR",
+            "CONCAT(SPLIT_PART(value, '.', 1), '.', SPLIT_PART(value, '.', 2))",
+        )
+    },
+    "tls_protocol": {},
+    "tls_cipher": {},
+}
+
+
+def dimension_table(database: Optional[str], attribute: str) -> str:
+    """Reference of a dimension table, relative to the current database (or
+    that of a view) without `database`."""
+    schema = f"{database}.main" if database else "main"
+    return f"{schema}.{DIMENSION_PREFIX}{attribute}"
+
+
+def create_dimensions(conn: duckdb.DuckDBPyConnection, database: str):
+    for attribute, columns in DIMENSIONS.items():
+        derived = "".join(f", {name} {type_}" for name, (type_, _) in columns.items())
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {dimension_table(database, attribute)} (
+                id INTEGER PRIMARY KEY,
+                value VARCHAR NOT NULL UNIQUE
+                {derived}
+            )
+        """)
+
+
+def update_dimensions(
+    conn: duckdb.DuckDBPyConnection, source: str, database: str
+) -> Dict[str, int]:
+    """
+    Append the values of `source` missing from the dimension tables, with the
+    next ids in value order. Concurrent writers must be serialized by the
+    caller (ids are allocated from the current maximum).
+
+    Returns:
+        Number of new values per attribute, for the attributes that had some
+    """
+    added = {}
+    for attribute, columns in DIMENSIONS.items():
+        table = dimension_table(database, attribute)
+        derived = "".join(f", {expr} AS {name}" for name, (_, expr) in columns.items())
+        parsed = (
+            f", regexp_extract(value, '{PEP440_PATTERN}', {_PEP440_GROUPS}, 'i') AS v"
+            if attribute == "version"
+            else ""
+        )
+        result = conn.execute(f"""
+            INSERT INTO {table}
+            SELECT
+                (SELECT COALESCE(MAX(id), 0) FROM {table})
+                    + row_number() OVER (ORDER BY value) AS id,
+                value
+                {derived}
+            FROM (
+                SELECT value {parsed}
+                FROM (
+                    SELECT DISTINCT {attribute} AS value FROM {source}
+                    WHERE {attribute} IS NOT NULL
+                ) AS s
+                WHERE NOT EXISTS (SELECT 1 FROM {table} d WHERE d.value = s.value)
+            )
+        """).fetchone()
+        if result and result[0]:
+            added[attribute] = result[0]
+    return added
+
+
+def encode_sql(source: str, database: str, where: Optional[str] = None) -> str:
+    """SELECT of the rows of `source` (alias `t` in `where`) with each
+    attribute replaced by `<attribute>_id`, the id of its value."""
+    ids = ",\n".join(
+        f"    {attribute}.id AS {attribute}_id" for attribute in DIMENSIONS
+    )
+    joins = "\n".join(
+        f"LEFT JOIN {dimension_table(database, attribute)} AS {attribute} "
+        f"ON {attribute}.value = t.{attribute}"
+        for attribute in DIMENSIONS
+    )
+    return f"""
+SELECT
+    t.timestamp,
+    t.project,
+{ids}
+FROM {source} AS t
+{joins}
+{f"WHERE {where}" if where else ""}
+"""
+
+
+def decode_sql(table_ref: str, database: Optional[str] = None) -> str:
+    """SELECT of an encoded table with the values joined back under the
+    attribute names, plus `python_version`."""
+    values = ",\n".join(
+        f"    {attribute}.value AS {attribute}" for attribute in DIMENSIONS
+    )
+    joins = "\n".join(
+        f"LEFT JOIN {dimension_table(database, attribute)} AS {attribute} "
+        f"ON {attribute}.id = t.{attribute}_id"
+        for attribute in DIMENSIONS
+    )
+    return f"""
+SELECT
+    t.timestamp,
+    t.project,
+{values},
+    python.python_version
+FROM {table_ref} AS t
+{joins}
+"""
+
+
+def latest_versions(
+    conn: duckdb.DuckDBPyConnection,
+    table_ref: str,
+    database: str,
+    project: str,
+    limit: int = 5,
+    include_prereleases: bool = False,
+) -> list[str]:
+    """Latest `limit` downloaded versions of `project` in PEP 440 order, from
+    an encoded table."""
+    prereleases = "" if include_prereleases else "AND NOT d.is_prerelease"
+    rows = conn.execute(
+        f"""
+        SELECT d.value
+        FROM {dimension_table(database, "version")} AS d
+        WHERE d.is_valid {prereleases}
+        AND d.id IN (SELECT version_id FROM {table_ref} WHERE project = ?)
+        ORDER BY d.sort_key DESC
+        LIMIT {limit}
+        """,
+        [project],
+    ).fetchall()
+    return [row[0] for row in rows]
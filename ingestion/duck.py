@@ -1,12 +1,32 @@
-import duckdb
-import os
+import copy
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable
 from loguru import logger
-
-
-class DataQualityError(Exception):
-    """Raised when data quality checks fail after loading from BigQuery."""
-
-    pass
+from ingestion.dimensions import (
+    create_dimensions,
+    decode_sql,
+    encode_sql,
+    update_dimensions,
+)
+from ingestion.instrumentation import RunRecorder, instrumented
+from ingestion.layout import order_by, sort_key
+from ingestion.models import COPY_MODES, WindowStats
+from ingestion.quality import (
+    DEFAULT_RULES,
+    DataQualityError,  # noqa: F401 (re-exported, raised by _validate_data)
+    QualityProfile,
+    QualityRule,
+    build_profile_sql,
+    evaluate,
+    history_days,
+    parse_profile_rows,
+)
+from ingestion.rollup import build_daily_rollup_sql
+from ingestion.sample import build_sample_sql
+from ingestion.session import LoaderSession
+from ingestion.sinks import Sink
 
 
 class MotherDuckBigQueryLoader:
@@ -24,26 +44,68 @@ class MotherDuckBigQueryLoader:
         motherduck_database: str,
         motherduck_table: str,
         project_id: str,
+        attach_motherduck: bool = True,
+        recorder: RunRecorder | None = None,
+        bigquery_extension: bool = True,
+        quality_rules: list[QualityRule] | None = None,
+        profile_table: str | None = None,
+        session: LoaderSession | None = None,
+        offline: bool = False,
+        layout: str = "project_date",
+        dimension_encoding: bool = False,
+        sample_table: str | None = None,
+        sample_fraction: float = 0.01,
     ):
+        """
+        Without `session`, the loader opens its own database, loads the
+        bigquery extension (from the local cache only when `offline`) and
+        attaches MotherDuck when `attach_motherduck`. With a shared `session`,
+        it takes a cursor and a temp table of its own from it, and those three
+        arguments are the session's.
+
+        `layout` is the write order of the destination tables, see
+        `ingestion.layout`. With `dimension_encoding`, the attributes of the
+        compact profile are written as ids of dimension tables, see
+        `ingestion.dimensions`.
+
+        With `sample_table`, every load also replaces its days of that table
+        with a stratified sample of `sample_fraction` of its rows, see
+        `ingestion.sample`.
+        """
         self.motherduck_database = motherduck_database
         self.motherduck_table = motherduck_table
         self.project_id = project_id
+        self.window_label = None
+        self.recorder = recorder or RunRecorder()
+        self.quality_rules = quality_rules or DEFAULT_RULES
+        # MotherDuck table keeping the per-day quality profile, None to skip it
+        self.profile_table = profile_table
+        sort_key(layout, "timestamp")  # fail early on an unknown layout
+        self.layout = layout
+        self.dimension_encoding = dimension_encoding
+        if sample_table:
+            build_sample_sql("t", sample_fraction)  # fail early on a bad fraction
+        self.sample_table = sample_table
+        self.sample_fraction = sample_fraction
 
-        self.conn = duckdb.connect(database=":memory:")
-
-        self.conn.execute("INSTALL bigquery FROM community;")
-        self.conn.execute("LOAD bigquery;")
-
-        self.conn.execute("SET bq_experimental_filter_pushdown = true")
-        self.conn.execute("SET preserve_insertion_order = FALSE")
-
-        if not os.environ.get("motherduck_token"):
-            raise ValueError(
-                "MotherDuck token is required. Set the environment variable 'MOTHERDUCK_TOKEN'."
+        if session is None:
+            self.session = LoaderSession(
+                attach_motherduck=attach_motherduck,
+                bigquery_extension=bigquery_extension,
+                offline=offline,
+                recorder=self.recorder,
             )
+            self.conn = self.session.conn
+            self.temp_table = "memory.temp_table"
+        else:
+            self.session = session
+            self.conn = session.cursor()
+            self.temp_table = session.temp_table()
+        self._ddl_lock = self.session.ddl_lock
+        self.recorder.enable_profiling(self.conn)
 
-        self.conn.execute("ATTACH 'md:'")
-        self.conn.execute(f"CREATE DATABASE IF NOT EXISTS {self.motherduck_database}")
+        if self.session.attach_motherduck:
+            self.session.create_database(self.motherduck_database)
 
     def load_from_bigquery_to_motherduck(
         self,
@@ -54,10 +116,22 @@ class MotherDuckBigQueryLoader:
         start_date: str,
         end_date: str,
         chunk_size: int = 100000,
+        copy_mode: str = "bulk",
+        rollup_table: str | None = None,
+        profile: str = "raw",
     ) -> int:
         """
         Load data from BigQuery to MotherDuck via a local temp table.
 
+        When `rollup_table` is set, the daily rollup of the loaded rows is also
+        written to that table (see `_write_daily_rollup`), from the same temp
+        table; `profile` is the ingestion profile of `columns`.
+
+        copy_mode "merge" keeps the rows already in MotherDuck and only inserts
+        the missing ones (see `_merge_into_motherduck`); the other modes delete
+        the date range first and copy the whole temp table, in one transaction
+        so that readers see either the old or the new rows of the range.
+
         Returns:
             Total number of rows loaded to MotherDuck
         """
@@ -71,84 +145,608 @@ class MotherDuckBigQueryLoader:
 
         logger.info(f"Loaded {loaded_rows:,} rows from BigQuery")
 
-        self._validate_data(timestamp_column, start_date, end_date)
+        quality = self._validate_data(timestamp_column, start_date, end_date)
+        self._update_dimensions()
 
-        logger.info(f"Deleting existing data for date range {start_date} to {end_date}")
-        self._delete_existing_data(timestamp_column, start_date, end_date)
+        if copy_mode == "merge":
+            logger.info(f"Merging data for date range {start_date} to {end_date}")
+            merged_rows = self._merge_into_motherduck(
+                timestamp_column, start_date, end_date
+            )
+            self._record_quality_profile(quality)
+            logger.info(f"Merged {merged_rows:,} new rows into MotherDuck")
+            return merged_rows
 
-        logger.info("Copying data to MotherDuck")
-        copied_rows = self._copy_to_motherduck(chunk_size)
+        projects = list(quality.project_rows()) or None
+        self.conn.execute("BEGIN TRANSACTION")
+        try:
+            logger.info(
+                f"Deleting existing data for date range {start_date} to {end_date}"
+            )
+            self._delete_existing_data(timestamp_column, start_date, end_date, projects)
+
+            logger.info("Copying data to MotherDuck")
+            copied_rows = self._copy_to_motherduck(
+                chunk_size, copy_mode, timestamp_column
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        self._record_quality_profile(quality)
+        self._write_sample(timestamp_column, start_date, end_date, projects)
+
+        if rollup_table:
+            self._write_daily_rollup(
+                self.temp_table, rollup_table, profile, start_date, end_date, projects
+            )
 
         logger.info(f"Transferred {copied_rows:,} rows to MotherDuck")
         return copied_rows
 
+    def load_rollup_from_bigquery(
+        self,
+        table: str,
+        filter_str: str,
+        columns: list[str],
+        start_date: str,
+        end_date: str,
+        rollup_table: str,
+        profile: str = "raw",
+        projects: list[str] | None = None,
+    ) -> int:
+        """
+        Aggregate bigquery_scan output straight into the daily rollup table,
+        without storing the raw download rows anywhere.
+
+        The raw-row data quality checks are skipped in this mode, as the rows
+        are never materialized.
+
+        Returns:
+            Number of rollup rows written
+        """
+        logger.info("Starting BigQuery to MotherDuck daily rollup job")
+        scan_sql = self._bigquery_scan_sql(table, filter_str, columns)
+        return self._write_daily_rollup(
+            f"({scan_sql})", rollup_table, profile, start_date, end_date, projects
+        )
+
+    def get_high_water_mark(self, timestamp_column: str, project: str):
+        """Return the latest loaded timestamp for a project as a naive UTC
+        datetime, or None when the MotherDuck table does not exist yet or holds
+        no row for the project. A TIMESTAMPTZ column is converted to UTC in
+        SQL, so the mark does not depend on the session TimeZone."""
+        column = self.conn.execute(
+            """
+            SELECT data_type
+            FROM duckdb_columns()
+            WHERE database_name = ? AND table_name = ? AND column_name = ?
+            """,
+            [self.motherduck_database, self.motherduck_table, timestamp_column],
+        ).fetchone()
+        if column is None:
+            return None
+
+        high_water_mark = f"MAX({timestamp_column})"
+        if column[0] == "TIMESTAMP WITH TIME ZONE":
+            high_water_mark = f"timezone('UTC', {high_water_mark})"
+        result = self.conn.execute(
+            f"""
+            SELECT {high_water_mark}
+            FROM {self.motherduck_database}.main.{self.motherduck_table}
+            WHERE project = ?
+            """,
+            [project],
+        ).fetchone()
+        return result[0] if result else None
+
+    def load_from_bigquery_to_sinks(
+        self,
+        table: str,
+        filter_str: str,
+        columns: list[str],
+        timestamp_column: str,
+        start_date: str,
+        end_date: str,
+        sinks: list[Sink],
+    ) -> int:
+        """
+        Load data from BigQuery once into a local temp table and fan it out to
+        every sink (MotherDuck, local DuckDB file, partitioned Parquet, ...).
+
+        Returns:
+            Total number of rows loaded from BigQuery
+        """
+        logger.info(f"Starting BigQuery transfer job to {len(sinks)} sinks")
+        for sink in sinks:
+            sink.setup(self.conn)
+
+        loaded_rows = self._load_from_bigquery(table, filter_str, columns)
+
+        if loaded_rows == 0:
+            logger.warning("No data was loaded from BigQuery")
+            return 0
+
+        logger.info(f"Loaded {loaded_rows:,} rows from BigQuery")
+
+        quality = self._validate_data(timestamp_column, start_date, end_date)
+
+        for sink in sinks:
+            self._write_sink(sink, timestamp_column, start_date, end_date)
+        self._record_quality_profile(quality)
+
+        return loaded_rows
+
+    @instrumented("stream")
+    def stream_from_bigquery_to_motherduck(
+        self,
+        table: str,
+        filter_str: str,
+        columns: list[str],
+        timestamp_column: str,
+        start_date: str,
+        end_date: str,
+        memory_limit: str | None = None,
+        projects: list[str] | None = None,
+    ) -> int:
+        """
+        Stream rows from bigquery_scan straight into the destination table,
+        without materializing them in a local temp table.
+
+        The delete, the insert and the data quality checks run in a single
+        transaction: the checks are computed on the rows just written and a
+        failure rolls the whole window back. Peak memory is bounded by
+        `memory_limit` (e.g. "2GB") rather than by the size of the window.
+        Rows are written in scan order: sorting by the layout would buffer the
+        whole window, `layout compact` sorts the range afterwards.
+        `projects` scopes the delete and the checks to the projects of the
+        scan filter. Only the md destination is streamed to, the local and
+        Parquet sinks read the scan through a temp table.
+
+        Returns:
+            Total number of rows written to the destination
+        """
+        logger.info("Starting streaming BigQuery to MotherDuck transfer job")
+        destination = f"{self.motherduck_database}.main.{self.motherduck_table}"
+        scan_sql = self._bigquery_scan_sql(table, filter_str, columns)
+
+        if memory_limit:
+            self.conn.execute(f"SET memory_limit = '{memory_limit}'")
+
+        self.conn.execute(f"USE {self.motherduck_database}")
+        with self._ddl_lock:
+            self.conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {destination} AS
+                {scan_sql}
+                LIMIT 0
+            """)
+        self._create_profile_table()
+
+        self.conn.execute("BEGIN TRANSACTION")
+        try:
+            self._delete_existing_data(timestamp_column, start_date, end_date, projects)
+
+            logger.info(f"Running streaming bigquery_scan on {table}")
+            result = self.conn.execute(f"""
+                INSERT INTO {destination}
+                {scan_sql}
+            """).fetchone()
+            written_rows = result[0] if result else 0
+
+            if written_rows == 0:
+                logger.warning("No data was streamed from BigQuery")
+                self.conn.execute("ROLLBACK")
+                return 0
+
+            # The rows just written are read back within the transaction, only
+            # those of the scanned projects: the table holds other projects too
+            project_filter = ""
+            if projects:
+                projects_sql = ", ".join(f"'{project}'" for project in projects)
+                project_filter = f"AND project IN ({projects_sql})"
+            quality = self._validate_data(
+                timestamp_column,
+                start_date,
+                end_date,
+                relation=f"""(
+                    SELECT * FROM {destination}
+                    WHERE {timestamp_column} >= '{start_date}'
+                    AND {timestamp_column} < '{end_date}'
+                    {project_filter}
+                )""",
+            )
+            # Same transaction: the profile is kept only if the rows are
+            self._record_quality_profile(quality)
+            self.conn.execute("COMMIT")
+        except Exception as e:
+            logger.error(f"Error streaming data to MotherDuck: {e}")
+            self.conn.execute("ROLLBACK")
+            raise
+
+        logger.info(f"Streamed {written_rows:,} rows to MotherDuck")
+        return written_rows
+
+    def load_partitioned(
+        self,
+        table: str,
+        windows: list[tuple[str, str, str]],
+        columns: list[str],
+        timestamp_column: str,
+        workers: int = 4,
+        chunk_size: int = 100000,
+        copy_mode: str = "bulk",
+        streaming: bool = False,
+        memory_limit: str | None = None,
+        sinks: list[Sink] | None = None,
+        projects: list[str] | None = None,
+        on_window_loaded: Callable[[WindowStats], None] | None = None,
+    ) -> list[WindowStats]:
+        """
+        Load several date windows concurrently, each one through its own cursor
+        and temp table, and commit every window independently.
+
+        Args:
+            windows: (start_date, end_date, filter_str) tuples, one per window
+            streaming: Write each window straight from bigquery_scan, see
+                `stream_from_bigquery_to_motherduck`
+            sinks: Write each window to these sinks instead of the MotherDuck
+                table of the loader
+            projects: Projects selected by the window filters, used to scope
+                the delete of streaming loads
+            on_window_loaded: Called from the calling thread after each window
+                commits, e.g. to record it in a run manifest
+
+        Returns:
+            Per-window stats, in window order. Windows that failed are logged and
+            the first error is re-raised once all other windows have finished.
+        """
+        logger.info(f"Loading {len(windows)} windows with {workers} workers")
+        if streaming and sinks:
+            raise ValueError("Streaming loads write to the MotherDuck table only")
+        for sink in sinks or []:
+            sink.setup(self.conn)
+
+        results: dict[int, WindowStats] = {}
+        errors: list[Exception] = []
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(
+                    self._load_window,
+                    table,
+                    filter_str,
+                    columns,
+                    timestamp_column,
+                    start_date,
+                    end_date,
+                    chunk_size,
+                    copy_mode,
+                    streaming,
+                    memory_limit,
+                    sinks,
+                    projects,
+                ): idx
+                for idx, (start_date, end_date, filter_str) in enumerate(windows)
+            }
+            for future in as_completed(futures):
+                start_date, end_date, _ = windows[futures[future]]
+                try:
+                    stats = future.result()
+                except Exception as e:
+                    logger.error(f"Window {start_date} to {end_date} failed: {e}")
+                    errors.append(e)
+                    continue
+
+                results[futures[future]] = stats
+                logger.info(
+                    f"Window {start_date} to {end_date}: {stats.rows:,} rows in "
+                    f"{stats.elapsed_seconds:.1f}s "
+                    f"({stats.rows_per_second:,.0f} rows/s, "
+                    f"{stats.bytes_per_second / 1024 / 1024:,.2f} MiB/s)"
+                )
+                if on_window_loaded:
+                    on_window_loaded(stats)
+
+        if errors:
+            raise errors[0]
+
+        return [results[idx] for idx in sorted(results)]
+
+    def _write_sink(
+        self, sink: Sink, timestamp_column: str, start_date: str, end_date: str
+    ) -> int:
+        """Write the temp table to a sink, recorded as a `sink:<name>` stage."""
+        with self.recorder.stage(
+            f"sink:{sink.name}", conn=self.conn, window=self.window_label
+        ) as metrics:
+            metrics.rows = sink.write(
+                self.conn, self.temp_table, timestamp_column, start_date, end_date
+            )
+        return metrics.rows
+
+    def _window_loader(self, start_date: str) -> "MotherDuckBigQueryLoader":
+        """Return a shallow copy of this loader bound to a fresh cursor and its
+        own temp table, so that windows can run concurrently on one database."""
+        window_loader = copy.copy(self)
+        window_loader.conn = self.conn.cursor()
+        window_loader.window_label = start_date
+        self.recorder.enable_profiling(window_loader.conn)
+        window_loader.temp_table = f"{self.temp_table}_{start_date.replace('-', '_')}"
+        return window_loader
+
+    def _load_window(
+        self,
+        table: str,
+        filter_str: str,
+        columns: list[str],
+        timestamp_column: str,
+        start_date: str,
+        end_date: str,
+        chunk_size: int,
+        copy_mode: str,
+        streaming: bool = False,
+        memory_limit: str | None = None,
+        sinks: list[Sink] | None = None,
+        projects: list[str] | None = None,
+    ) -> WindowStats:
+        """Load, validate and replace a single date window in one transaction."""
+        window_loader = self._window_loader(start_date)
+        started = time.perf_counter()
+        try:
+            if streaming:
+                written_rows = window_loader.stream_from_bigquery_to_motherduck(
+                    table,
+                    filter_str,
+                    columns,
+                    timestamp_column,
+                    start_date,
+                    end_date,
+                    memory_limit,
+                    projects,
+                )
+                return WindowStats(
+                    start_date=start_date,
+                    end_date=end_date,
+                    rows=written_rows,
+                    bytes=0,
+                    elapsed_seconds=time.perf_counter() - started,
+                )
+
+            loaded_rows = window_loader._load_from_bigquery(table, filter_str, columns)
+            if loaded_rows == 0:
+                logger.warning(f"No data for window {start_date} to {end_date}")
+                return WindowStats(
+                    start_date=start_date,
+                    end_date=end_date,
+                    rows=0,
+                    bytes=0,
+                    elapsed_seconds=time.perf_counter() - started,
+                )
+
+            quality = window_loader._validate_data(
+                timestamp_column, start_date, end_date
+            )
+            loaded_bytes = window_loader._temp_table_bytes(loaded_rows)
+            checksum = quality.checksum
+            project_rows = quality.project_rows()
+
+            if sinks:
+                for sink in sinks:
+                    window_loader._write_sink(
+                        sink, timestamp_column, start_date, end_date
+                    )
+                window_loader._record_quality_profile(quality)
+                return WindowStats(
+                    start_date=start_date,
+                    end_date=end_date,
+                    rows=loaded_rows,
+                    bytes=loaded_bytes,
+                    elapsed_seconds=time.perf_counter() - started,
+                    checksum=checksum,
+                    project_rows=project_rows,
+                )
+
+            # Concurrent windows creating the table in their own transactions
+            # would conflict at commit, create it before opening them
+            window_loader._update_dimensions()
+            window_loader._create_destination_table()
+            window_loader.conn.execute("BEGIN TRANSACTION")
+            try:
+                window_loader._delete_existing_data(
+                    timestamp_column, start_date, end_date, list(project_rows) or None
+                )
+                copied_rows = window_loader._copy_to_motherduck(
+                    chunk_size, copy_mode, timestamp_column
+                )
+                window_loader.conn.execute("COMMIT")
+            except Exception:
+                window_loader.conn.execute("ROLLBACK")
+                raise
+            window_loader._record_quality_profile(quality)
+            window_loader._write_sample(
+                timestamp_column, start_date, end_date, list(project_rows) or None
+            )
+
+            return WindowStats(
+                start_date=start_date,
+                end_date=end_date,
+                rows=copied_rows,
+                bytes=loaded_bytes,
+                elapsed_seconds=time.perf_counter() - started,
+                checksum=checksum,
+                project_rows=project_rows,
+            )
+        finally:
+            window_loader.conn.execute(
+                f"DROP TABLE IF EXISTS {window_loader.temp_table}"
+            )
+            window_loader.conn.close()
+
+    @instrumented("table_bytes")
+    def _temp_table_bytes(self, rows: int, sample_percent: float = 1) -> int:
+        """Approximate payload size of the temp table, as its rows rendered to
+        text, extrapolated from a system sample (whole vectors) of
+        `sample_percent` of them. 0 when the sample is empty."""
+        result = self.conn.execute(f"""
+            SELECT COUNT(*), SUM(strlen(CAST(t AS VARCHAR)))
+            FROM {self.temp_table} t
+            USING SAMPLE {sample_percent} PERCENT (system)
+        """).fetchone()
+        if not result or not result[0]:
+            return 0
+        sampled_rows, sampled_bytes = result
+        return int(sampled_bytes * rows / sampled_rows)
+
+    def _bigquery_scan_sql(
+        self, table: str, filter_str: str, columns: list[str]
+    ) -> str:
+        """SELECT statement reading `columns` from a BigQuery table with the
+        row restriction pushed down to the Storage Read API."""
+        columns_sql = ", ".join(columns)
+        escaped_filter = filter_str.replace("'", "''")
+        return f"""
+            SELECT {columns_sql}
+            FROM bigquery_scan('{table}',
+                billing_project='{self.project_id}',
+                filter='{escaped_filter}')
+        """
+
+    @instrumented("bigquery_scan")
     def _load_from_bigquery(
         self, table: str, filter_str: str, columns: list[str]
     ) -> int:
         """Load data from BigQuery into a local temp table using bigquery_scan."""
         try:
-            columns_sql = ", ".join(columns)
-            escaped_filter = filter_str.replace("'", "''")
             query = f"""
-                CREATE OR REPLACE TABLE memory.temp_table AS
-                SELECT {columns_sql}
-                FROM bigquery_scan('{table}',
-                    billing_project='{self.project_id}',
-                    filter='{escaped_filter}')
+                CREATE OR REPLACE TABLE {self.temp_table} AS
+                {self._bigquery_scan_sql(table, filter_str, columns)}
             """
             logger.info(f"Running bigquery_scan on {table}")
-            self.conn.execute(query)
-
-            result = self.conn.execute(
-                "SELECT COUNT(*) FROM memory.temp_table"
-            ).fetchone()
+            # CREATE TABLE AS returns the number of rows it inserted
+            result = self.conn.execute(query).fetchone()
             return result[0] if result else 0
 
         except Exception as e:
             logger.error(f"Error loading data from BigQuery: {e}")
             raise
 
+    @instrumented("validate")
     def _validate_data(
-        self, timestamp_column: str, start_date: str, end_date: str
-    ):
-        """Run SQL-based data quality checks on the loaded data."""
-        stats = self.conn.execute(f"""
-            SELECT
-                COUNT(*) as total_rows,
-                COUNT({timestamp_column}) as non_null_timestamps,
-                COUNT(project) as non_null_projects,
-                MIN({timestamp_column}) as min_ts,
-                MAX({timestamp_column}) as max_ts
-            FROM memory.temp_table
-        """).fetchone()
+        self,
+        timestamp_column: str,
+        start_date: str,
+        end_date: str,
+        relation: str | None = None,
+    ) -> QualityProfile:
+        """Run the quality rules on the loaded data in one aggregate pass and
+        return the per-day, per-project profile.
+
+        `relation` defaults to the temp table; streaming loads pass the freshly
+        written destination range instead.
+        """
+        relation = relation or self.temp_table
+        query, metrics = build_profile_sql(
+            relation, self.quality_rules, timestamp_column, start_date, end_date
+        )
+        profile = QualityProfile(
+            timestamp_column=timestamp_column,
+            start_date=start_date,
+            end_date=end_date,
+            days=parse_profile_rows(self.conn.execute(query).fetchall(), metrics),
+            history=self._quality_history(start_date),
+        )
 
-        total_rows, non_null_ts, non_null_proj, min_ts, max_ts = stats
+        for warning in evaluate(profile, self.quality_rules):
+            logger.warning(f"Data quality warning: {warning}")
 
-        if total_rows == 0:
-            raise DataQualityError("No rows loaded from BigQuery")
+        for project, rows in profile.project_rows().items():
+            logger.info(f"Loaded {rows:,} rows for project {project}")
+        logger.info(
+            f"Data quality OK: {profile.rows:,} rows over {len(profile.days)} "
+            f"day/project groups, {len(self.quality_rules)} rules checked"
+        )
+        return profile
 
-        null_ts_pct = (total_rows - non_null_ts) / total_rows * 100
-        null_proj_pct = (total_rows - non_null_proj) / total_rows * 100
+    def _profile_table_ref(self) -> str:
+        return f"{self.motherduck_database}.main.{self.profile_table}"
 
-        if null_ts_pct > 5:
-            raise DataQualityError(
-                f"{null_ts_pct:.1f}% of timestamp values are null (threshold: 5%)"
-            )
-        if null_proj_pct > 5:
-            raise DataQualityError(
-                f"{null_proj_pct:.1f}% of project values are null (threshold: 5%)"
-            )
+    def _profile_table_exists(self) -> bool:
+        return self.conn.execute(f"""
+            SELECT COUNT(*) > 0
+            FROM duckdb_tables()
+            WHERE database_name = '{self.motherduck_database}'
+            AND table_name = '{self.profile_table}'
+        """).fetchone()[0]
 
-        logger.info(
-            f"Data quality OK: {total_rows:,} rows, "
-            f"timestamp range [{min_ts} to {max_ts}], "
-            f"null rates: timestamp={null_ts_pct:.1f}%, project={null_proj_pct:.1f}%"
+    def _quality_history(self, start_date: str) -> dict[str, float]:
+        """Median daily rows per project over the days before `start_date`,
+        from the profile table, for the row count anomaly rule."""
+        days = history_days(self.quality_rules)
+        if not self.profile_table or not days or not self._profile_table_exists():
+            return {}
+        return dict(
+            self.conn.execute(f"""
+                SELECT project, MEDIAN(rows)
+                FROM {self._profile_table_ref()}
+                WHERE download_date >= '{start_date}'::DATE - INTERVAL {days} DAY
+                AND download_date < '{start_date}'::DATE
+                GROUP BY project
+            """).fetchall()
         )
 
+    def _create_profile_table(self):
+        if not self.profile_table:
+            return
+        with self._ddl_lock:
+            self.conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self._profile_table_ref()} (
+                    download_date DATE,
+                    project VARCHAR,
+                    rows BIGINT,
+                    min_timestamp TIMESTAMPTZ,
+                    max_timestamp TIMESTAMPTZ,
+                    metrics JSON,
+                    loaded_at TIMESTAMP DEFAULT current_timestamp,
+                    PRIMARY KEY (download_date, project)
+                )
+            """)
+
+    def _record_quality_profile(self, profile: QualityProfile):
+        """Upsert the profile of the days fully covered by the load, so that
+        each window refreshes its own days of the profile table."""
+        days = profile.full_days()
+        if not self.profile_table or not days:
+            return
+        self._create_profile_table()
+        self.conn.executemany(
+            f"""
+            INSERT OR REPLACE INTO {self._profile_table_ref()}
+                (download_date, project, rows, min_timestamp, max_timestamp, metrics)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            [
+                [
+                    day.download_date,
+                    day.project,
+                    day.rows,
+                    day.min_timestamp,
+                    day.max_timestamp,
+                    json.dumps(day.metrics),
+                ]
+                for day in days
+            ],
+        )
+        logger.info(f"Recorded {len(days)} day profiles to {self._profile_table_ref()}")
+
+    @instrumented("delete")
     def _delete_existing_data(
-        self, timestamp_column: str, start_date: str, end_date: str
+        self,
+        timestamp_column: str,
+        start_date: str,
+        end_date: str,
+        projects: list[str] | None = None,
     ):
-        """Delete existing data from MotherDuck in the specified date range."""
+        """Delete existing data from MotherDuck in the specified date range,
+        restricted to `projects` when given so other packages are kept."""
         try:
             table_exists = self.conn.execute(f"""
                 SELECT COUNT(*) > 0 
@@ -168,50 +766,286 @@ class MotherDuckBigQueryLoader:
             DELETE FROM {self.motherduck_database}.main.{self.motherduck_table} 
             WHERE {timestamp_column} >= '{start_date}' AND {timestamp_column} < '{end_date}'
             """
+            if projects:
+                projects_sql = ", ".join(f"'{project}'" for project in projects)
+                delete_query += f"AND project IN ({projects_sql})"
             self.conn.execute(delete_query)
-            logger.info(
-                f"Deleted existing data for range {start_date} to {end_date}"
-            )
+            logger.info(f"Deleted existing data for range {start_date} to {end_date}")
 
         except Exception as e:
             logger.error(f"Error deleting existing data: {e}")
             raise
 
-    def _copy_to_motherduck(self, chunk_size: int) -> int:
-        """Copy data from temp table to MotherDuck in chunks."""
+    @instrumented("copy")
+    def _copy_to_motherduck(
+        self,
+        chunk_size: int,
+        copy_mode: str = "bulk",
+        timestamp_column: str = "timestamp",
+    ) -> int:
+        """
+        Copy data from temp table to MotherDuck, in layout order.
+
+        Every write of the destination table is sorted this way (see
+        `ingestion.layout`), so each row group covers a narrow range of days
+        and its min/max statistics (zone maps) let the range DELETE of a later
+        replace skip every row group outside the replaced days: the replace
+        cost follows the size of the window rather than of the whole history.
+        "bulk" sorts the window as a whole, "chunked" only each chunk.
+
+        copy_mode:
+        - "bulk": a single INSERT ... SELECT that streams the temp table to
+          MotherDuck in one pass (one scan, one round trip)
+        - "chunked": one INSERT per rowid range of `chunk_size` rows
+
+        "merge" is not a copy: single-scan loads run it through
+        `_merge_into_motherduck` instead.
+        """
+        if copy_mode == "merge":
+            raise ValueError("copy_mode merge only runs as a single scan")
+        if copy_mode not in COPY_MODES:
+            raise ValueError(
+                f"Unknown copy_mode '{copy_mode}', use {', '.join(COPY_MODES)}"
+            )
+
         try:
-            self.conn.execute(f"USE {self.motherduck_database}")
+            self._create_destination_table()
+
+            if copy_mode == "bulk":
+                return self._bulk_copy(timestamp_column)
+
+            return self._chunked_copy(chunk_size, timestamp_column)
+
+        except Exception as e:
+            logger.error(f"Error copying data to MotherDuck: {e}")
+            raise
+
+    def _create_destination_table(self):
+        """Create the MotherDuck table from the temp table schema if missing,
+        and the `_decoded` view of an encoded table."""
+        destination = f"{self.motherduck_database}.main.{self.motherduck_table}"
+        self.conn.execute(f"USE {self.motherduck_database}")
+        with self._ddl_lock:
             self.conn.execute(f"""
-                CREATE TABLE IF NOT EXISTS 
-                    {self.motherduck_database}.main.{self.motherduck_table} AS 
-                SELECT * FROM memory.temp_table LIMIT 0
+                CREATE TABLE IF NOT EXISTS {destination} AS
+                SELECT * FROM {self._copy_source()} LIMIT 0
             """)
+            if self.dimension_encoding:
+                # Relative references, resolved in the database of the view
+                self.conn.execute(f"""
+                    CREATE VIEW IF NOT EXISTS {destination}_decoded AS
+                    {decode_sql(f"main.{self.motherduck_table}")}
+                """)
 
-            total_rows = self.conn.execute(
-                "SELECT COUNT(*) FROM memory.temp_table"
-            ).fetchone()[0]
+    def _copy_source(self, rows: tuple[int, int] | None = None) -> str:
+        """Relation written to the destination: the temp table, or its rows
+        with ids in place of the attribute values when encoding dimensions.
+        `rows` restricts it to a rowid range."""
+        where = f"rowid BETWEEN {rows[0]} AND {rows[1]}" if rows else None
+        if self.dimension_encoding:
+            where = f"t.{where}" if where else None
+            return f"({encode_sql(self.temp_table, self.motherduck_database, where)})"
+        return f"{self.temp_table} WHERE {where}" if where else self.temp_table
 
-            if total_rows == 0:
-                return 0
+    @instrumented("dimensions")
+    def _update_dimensions(self):
+        """Add the new attribute values of the temp table to the dimension
+        tables, before the transaction writing the destination: windows append
+        one at a time, and each commits on its own."""
+        if not self.dimension_encoding:
+            return
+        self.conn.execute(f"USE {self.motherduck_database}")
+        with self._ddl_lock:
+            create_dimensions(self.conn, self.motherduck_database)
+            added = update_dimensions(
+                self.conn, self.temp_table, self.motherduck_database
+            )
+        if added:
+            logger.info(
+                "New dimension values: "
+                + ", ".join(f"{count} {name}" for name, count in added.items())
+            )
+
+    @instrumented("merge")
+    def _merge_into_motherduck(
+        self, timestamp_column: str, start_date: str, end_date: str
+    ) -> int:
+        """
+        Idempotently merge the temp table into MotherDuck: insert only the rows
+        of [start_date, end_date) that are not already there.
+
+        EXCEPT ALL is a multiset difference, so identical download rows (which
+        are legitimate) are counted, and re-running the same window is a no-op.
+        """
+        destination = f"{self.motherduck_database}.main.{self.motherduck_table}"
+        try:
+            self._create_destination_table()
+
+            result = self.conn.execute(f"""
+                INSERT INTO {destination}
+                SELECT * FROM (
+                    SELECT * FROM {self._copy_source()}
+                    EXCEPT ALL
+                    SELECT * FROM {destination}
+                    WHERE {timestamp_column} >= '{start_date}'
+                    AND {timestamp_column} < '{end_date}'
+                )
+                {order_by(self.layout, timestamp_column)}
+            """).fetchone()
+            return result[0] if result else 0
+
+        except Exception as e:
+            logger.error(f"Error merging data into MotherDuck: {e}")
+            raise
 
-            logger.info(f"Total rows to copy: {total_rows:,}")
+    @instrumented("rollup")
+    def _write_daily_rollup(
+        self,
+        source: str,
+        rollup_table: str,
+        profile: str,
+        start_date: str,
+        end_date: str,
+        projects: list[str] | None = None,
+    ) -> int:
+        """Replace the [start_date, end_date) days of the rollup table with the
+        daily aggregation of `source`, in one transaction."""
+        destination = f"{self.motherduck_database}.main.{rollup_table}"
+        rollup_sql = build_daily_rollup_sql(source, profile)
+        project_filter = ""
+        if projects:
+            projects_sql = ", ".join(f"'{project}'" for project in projects)
+            project_filter = f"AND project IN ({projects_sql})"
 
-            for chunk_start in range(0, total_rows, chunk_size):
-                chunk_end = min(chunk_start + chunk_size - 1, total_rows - 1)
+        try:
+            self.conn.execute(f"USE {self.motherduck_database}")
+            with self._ddl_lock:
                 self.conn.execute(f"""
-                    INSERT INTO {self.motherduck_database}.main.{self.motherduck_table}
-                    SELECT * FROM memory.temp_table 
-                    WHERE rowid BETWEEN {chunk_start} AND {chunk_end}
+                    CREATE TABLE IF NOT EXISTS {destination} AS
+                    SELECT * FROM ({rollup_sql}) WHERE false
                 """)
 
-                chunk_num = (chunk_start // chunk_size) + 1
-                total_chunks = (total_rows + chunk_size - 1) // chunk_size
-                logger.info(
-                    f"Chunk {chunk_num}/{total_chunks} ({chunk_end - chunk_start + 1} rows)"
-                )
+            self.conn.execute("BEGIN TRANSACTION")
+            try:
+                self.conn.execute(f"""
+                    DELETE FROM {destination}
+                    WHERE download_date >= '{start_date}'
+                    AND download_date < '{end_date}'
+                    {project_filter}
+                """)
+                result = self.conn.execute(f"""
+                    INSERT INTO {destination}
+                    SELECT * FROM ({rollup_sql})
+                    {order_by(self.layout, "download_date")}
+                """).fetchone()
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
 
-            return total_rows
+            written_rows = result[0] if result else 0
+            logger.info(f"Wrote {written_rows:,} daily rollup rows to {destination}")
+            return written_rows
 
         except Exception as e:
-            logger.error(f"Error copying data to MotherDuck: {e}")
+            logger.error(f"Error writing daily rollup: {e}")
+            raise
+
+    @instrumented("sample")
+    def _write_sample(
+        self,
+        timestamp_column: str,
+        start_date: str,
+        end_date: str,
+        projects: list[str] | None = None,
+    ) -> int:
+        """Replace the [start_date, end_date) days of the sample table with a
+        stratified sample of the temp table, in one transaction. Attribute
+        values are kept as loaded, also when the destination encodes them."""
+        if not self.sample_table:
+            return 0
+        destination = f"{self.motherduck_database}.main.{self.sample_table}"
+        sample_sql = build_sample_sql(
+            self.temp_table, self.sample_fraction, timestamp_column
+        )
+        project_filter = ""
+        if projects:
+            projects_sql = ", ".join(f"'{project}'" for project in projects)
+            project_filter = f"AND project IN ({projects_sql})"
+
+        self.conn.execute(f"USE {self.motherduck_database}")
+        with self._ddl_lock:
+            self.conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {destination} AS
+                SELECT * FROM ({sample_sql}) WHERE false
+            """)
+
+        self.conn.execute("BEGIN TRANSACTION")
+        try:
+            self.conn.execute(f"""
+                DELETE FROM {destination}
+                WHERE download_date >= '{start_date}'
+                AND download_date < '{end_date}'
+                {project_filter}
+            """)
+            result = self.conn.execute(f"""
+                INSERT INTO {destination}
+                SELECT * FROM ({sample_sql})
+                {order_by(self.layout, timestamp_column)}
+            """).fetchone()
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
             raise
+
+        sampled_rows = result[0] if result else 0
+        logger.info(f"Wrote {sampled_rows:,} sampled rows to {destination}")
+        return sampled_rows
+
+    def _bulk_copy(self, timestamp_column: str = "timestamp") -> int:
+        """Stream the whole temp table to MotherDuck with one INSERT ... SELECT."""
+        started = time.perf_counter()
+        result = self.conn.execute(f"""
+            INSERT INTO {self.motherduck_database}.main.{self.motherduck_table}
+            SELECT * FROM {self._copy_source()}
+            {order_by(self.layout, timestamp_column)}
+        """).fetchone()
+        total_rows = result[0] if result else 0
+
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"Bulk copied {total_rows:,} rows in {elapsed:.1f}s"
+            + (f" ({total_rows / elapsed:,.0f} rows/s)" if elapsed else "")
+        )
+        return total_rows
+
+    def _chunked_copy(
+        self, chunk_size: int, timestamp_column: str = "timestamp"
+    ) -> int:
+        """Copy the temp table to MotherDuck in rowid-range chunks, each one
+        sorted in layout order (the temp table itself cannot be sorted first,
+        the transaction already writes to MotherDuck)."""
+        total_rows = self.conn.execute(
+            f"SELECT COUNT(*) FROM {self.temp_table}"
+        ).fetchone()[0]
+
+        if total_rows == 0:
+            return 0
+
+        logger.info(f"Total rows to copy: {total_rows:,}")
+
+        for chunk_start in range(0, total_rows, chunk_size):
+            chunk_end = min(chunk_start + chunk_size - 1, total_rows - 1)
+            self.conn.execute(f"""
+                INSERT INTO {self.motherduck_database}.main.{self.motherduck_table}
+                SELECT * FROM {self._copy_source((chunk_start, chunk_end))}
+                {order_by(self.layout, timestamp_column)}
+            """)
+
+            chunk_num = (chunk_start // chunk_size) + 1
+            total_chunks = (total_rows + chunk_size - 1) // chunk_size
+            logger.info(
+                f"Chunk {chunk_num}/{total_chunks} ({chunk_end - chunk_start + 1} rows)"
+            )
+
+        return total_rows
@@ -0,0 +1,322 @@
+"""
+Partitioned Parquet export of a table, by year and month of a date column,
+in the `{path}/{table}/year=Y/month=M/` layout of the dbt
+`export_partition_data` macro.
+
+Every partition gets a `_manifest.json` (rows, min/max date, files and sizes,
+content hash) and the table an index `{path}/{table}/_manifest.json` of all
+its partitions. An export compares the partitions of the requested range with
+the index and only rewrites the changed ones, several at a time, so its cost
+follows the changed data. Readers plan their reads from the index (see
+`partition_files`) without listing the bucket.
+
+    python -m ingestion.export run --path s3://bucket/exports \
+        --start_date 2024-05-01 --end_date 2024-06-01
+"""
+
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import duckdb
+import fire
+from loguru import logger
+
+from ingestion.layout import order_by
+from ingestion.models import ExportFile, PartitionManifest
+from ingestion.session import LoaderSession
+
+MANIFEST_NAME = "_manifest.json"
+
+
+def table_root(path: str, table: str) -> str:
+    return f"{path.rstrip('/')}/{table}"
+
+
+def partition_dir(path: str, table: str, year: int, month: int) -> str:
+    return f"{table_root(path, table)}/year={year}/month={month}"
+
+
+def read_index(
+    conn: duckdb.DuckDBPyConnection, path: str, table: str
+) -> Dict[Tuple[int, int], PartitionManifest]:
+    """Manifests of the exported partitions by (year, month), empty before the
+    first export."""
+    index_path = f"{table_root(path, table)}/{MANIFEST_NAME}"
+    try:
+        row = conn.execute("SELECT content FROM read_text(?)", [index_path]).fetchone()
+    except duckdb.IOException:
+        row = None
+    if row is None:
+        return {}
+    manifests = [PartitionManifest(**entry) for entry in json.loads(row[0])]
+    return {(m.year, m.month): m for m in manifests}
+
+
+def partition_files(
+    manifests: List[PartitionManifest],
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+) -> List[str]:
+    """Files holding [start_date, end_date), for readers planning a scan from
+    the index, e.g. `read_parquet(partition_files(...))`."""
+    start = date.fromisoformat(start_date) if start_date else date.min
+    end = date.fromisoformat(end_date) if end_date else date.max
+    return [
+        file.path
+        for m in sorted(manifests, key=lambda m: (m.year, m.month))
+        if m.max_date >= start and m.min_date < end
+        for file in m.files
+    ]
+
+
+def plan_partitions(
+    conn: duckdb.DuckDBPyConnection,
+    source: str,
+    table: str,
+    date_column: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+) -> List[PartitionManifest]:
+    """
+    Current statistics of the year/month partitions of `source` overlapping
+    [start_date, end_date), in one aggregate pass. Partitions are always taken
+    whole, the range only selects which ones.
+    """
+    conditions = []
+    if start_date:
+        conditions.append(f"{date_column} >= DATE_TRUNC('month', DATE '{start_date}')")
+    if end_date:
+        conditions.append(
+            f"{date_column} < DATE_TRUNC('month', DATE '{end_date}' - INTERVAL 1 DAY)"
+            " + INTERVAL 1 MONTH"
+        )
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    rows = conn.execute(f"""
+        SELECT
+            YEAR({date_column}) AS year,
+            MONTH({date_column}) AS month,
+            COUNT(*) AS rows,
+            MIN({date_column})::DATE AS min_date,
+            MAX({date_column})::DATE AS max_date,
+            SUM(hash(t))::VARCHAR AS content_hash
+        FROM {source} AS t
+        {where}
+        GROUP BY ALL
+        ORDER BY year, month
+    """).fetchall()
+    return [
+        PartitionManifest(
+            table=table,
+            year=year,
+            month=month,
+            rows=count,
+            min_date=min_date,
+            max_date=max_date,
+            content_hash=content_hash,
+        )
+        for year, month, count, min_date, max_date, content_hash in rows
+    ]
+
+
+def _write_json(conn: duckdb.DuckDBPyConnection, value, path: str, array: bool):
+    """Write JSON to a local or remote path through DuckDB's file systems."""
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump(value, f)
+    try:
+        conn.execute(f"""
+            COPY (SELECT * FROM read_json('{f.name}', format = 'auto'))
+            TO '{path}' (FORMAT JSON, ARRAY {str(array).lower()})
+        """)
+    finally:
+        os.remove(f.name)
+
+
+def export_partition(
+    conn: duckdb.DuckDBPyConnection,
+    source: str,
+    path: str,
+    partition: PartitionManifest,
+    date_column: str,
+    layout: str = "project_date",
+    row_group_size: int = 1000000,
+    compression: str = "zstd",
+) -> PartitionManifest:
+    """Rewrite one partition as a single sorted Parquet file, then its
+    manifest."""
+    directory = partition_dir(path, partition.table, partition.year, partition.month)
+    if "://" not in directory:
+        os.makedirs(directory, exist_ok=True)
+    month_start = date(partition.year, partition.month, 1)
+
+    stats = conn.execute(f"""
+        COPY (
+            SELECT * FROM {source}
+            WHERE {date_column} >= DATE '{month_start}'
+            AND {date_column} < DATE '{month_start}' + INTERVAL 1 MONTH
+            {order_by(layout, date_column)}
+        )
+        TO '{directory}/data_0.parquet'
+        (FORMAT PARQUET, COMPRESSION '{compression}',
+         ROW_GROUP_SIZE {row_group_size}, RETURN_STATS true)
+    """).fetchall()
+
+    manifest = partition.model_copy(
+        update={
+            "files": [
+                ExportFile(path=filename, rows=count, size_bytes=size_bytes)
+                for filename, count, size_bytes, *_ in stats
+            ],
+            "row_group_size": row_group_size,
+            "compression": compression,
+            "exported_at": datetime.now(timezone.utc),
+        }
+    )
+    _write_json(
+        conn, manifest.model_dump(mode="json"), f"{directory}/{MANIFEST_NAME}", False
+    )
+    return manifest
+
+
+def export_table(
+    conn: duckdb.DuckDBPyConnection,
+    source: str,
+    path: str,
+    table: str,
+    date_column: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    workers: int = 4,
+    layout: str = "project_date",
+    row_group_size: int = 1000000,
+    compression: str = "zstd",
+    force: bool = False,
+) -> List[PartitionManifest]:
+    """
+    Export the partitions of `source` overlapping [start_date, end_date) whose
+    row count or content hash differ from the index (all of them with
+    `force`), `workers` at a time, each through its own cursor. The index is
+    rewritten last, so readers see either the previous or the new one.
+
+    Returns:
+        Manifests of the exported partitions
+    """
+    if path.startswith("s3://"):
+        conn.execute("CREATE SECRET IF NOT EXISTS (TYPE s3, PROVIDER credential_chain)")
+
+    index = read_index(conn, path, table)
+    partitions = plan_partitions(conn, source, table, date_column, start_date, end_date)
+    dirty = [
+        p
+        for p in partitions
+        if force
+        or (p.year, p.month) not in index
+        or index[(p.year, p.month)].content_hash != p.content_hash
+        or index[(p.year, p.month)].rows != p.rows
+    ]
+    logger.info(
+        f"Exporting {len(dirty)} of {len(partitions)} partitions of {source} "
+        f"to {table_root(path, table)}"
+    )
+    if not dirty:
+        return []
+
+    exported: List[PartitionManifest] = []
+    errors: List[Exception] = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        cursors = []
+        futures = {}
+        for partition in dirty:
+            cursor = conn.cursor()
+            cursors.append(cursor)
+            future = pool.submit(
+                export_partition,
+                cursor,
+                source,
+                path,
+                partition,
+                date_column,
+                layout,
+                row_group_size,
+                compression,
+            )
+            futures[future] = partition
+        for future in as_completed(futures):
+            partition = futures[future]
+            try:
+                manifest = future.result()
+            except Exception as e:
+                logger.error(
+                    f"Export of {partition.year}-{partition.month:02d} failed: {e}"
+                )
+                errors.append(e)
+                continue
+            exported.append(manifest)
+            logger.info(
+                f"Exported {partition.year}-{partition.month:02d}: "
+                f"{manifest.rows:,} rows, "
+                f"{sum(f.size_bytes for f in manifest.files) / 1024 / 1024:,.1f} MiB"
+            )
+        for cursor in cursors:
+            cursor.close()
+
+    # Successful partitions are indexed even if others failed, so a rerun
+    # only retries the failed ones
+    index.update({(m.year, m.month): m for m in exported})
+    _write_json(
+        conn,
+        [m.model_dump(mode="json") for _, m in sorted(index.items())],
+        f"{table_root(path, table)}/{MANIFEST_NAME}",
+        True,
+    )
+    if errors:
+        raise errors[0]
+    return sorted(exported, key=lambda m: (m.year, m.month))
+
+
+def run(
+    path: str = os.environ.get("TRANSFORM_S3_PATH_OUTPUT", "data"),
+    table: str = "pypi_daily_stats",
+    date_column: str = "download_date",
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    database_name: str = "duckdb_stats",
+    local_path: Optional[str] = None,
+    workers: int = 4,
+    memory_limit: Optional[str] = None,
+    layout: str = "project_date",
+    row_group_size: int = 1000000,
+    compression: str = "zstd",
+    force: bool = False,
+):
+    """CLI: export the changed partitions of a MotherDuck table, or of a table
+    of the local DuckDB file `local_path`. `memory_limit` (e.g. "4GB") bounds
+    all workers together, sorts beyond it spill to disk."""
+    with LoaderSession(
+        attach_motherduck=local_path is None, bigquery_extension=False
+    ) as session:
+        if local_path:
+            session.conn.execute(f"ATTACH '{local_path}' AS {database_name}")
+        if memory_limit:
+            session.conn.execute(f"SET memory_limit = '{memory_limit}'")
+        export_table(
+            session.conn,
+            f"{database_name}.main.{table}",
+            path,
+            table,
+            date_column,
+            start_date=start_date,
+            end_date=end_date,
+            workers=workers,
+            layout=layout,
+            row_group_size=row_group_size,
+            compression=compression,
+            force=force,
+        )
+
+
+if __name__ == "__main__":
+    fire.Fire({"run": run})
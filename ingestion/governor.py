@@ -0,0 +1,205 @@
+"""
+Resource governor of the ingestion DuckDB session.
+
+Sizes the session and the loads from the host instead of fixed defaults:
+- `memory_limit` a fraction of the memory available to the process (cgroup
+  limit or MemAvailable), `threads` its cores (cgroup CPU quota or affinity),
+  and a `temp_directory` so that sorts and joins beyond the limit spill to
+  disk rather than get the process killed
+- date windows sized so that `workers` concurrent temp tables fit the memory
+  limit, predicted from the rows per day and bytes per row of the windows
+  already loaded (run manifest history, then each committed window)
+- write batches (`--copy_mode chunked`) of a bounded share of the limit
+"""
+
+import math
+import os
+import re
+import tempfile
+from datetime import datetime
+from typing import Optional
+
+import duckdb
+from loguru import logger
+
+from ingestion.models import HostResources, WindowStats
+
+# Approximate in-memory bytes per row of each ingestion profile, before any
+# window was measured
+DEFAULT_BYTES_PER_ROW = {"raw": 1200, "lean": 250, "compact": 300}
+# A window holds its temp table and a sort of it (layout-ordered writes)
+MEMORY_OVERHEAD = 2.0
+
+_UNITS = {
+    "b": 1,
+    "kb": 1000,
+    "mb": 1000**2,
+    "gb": 1000**3,
+    "tb": 1000**4,
+    "kib": 1024,
+    "mib": 1024**2,
+    "gib": 1024**3,
+    "tib": 1024**4,
+}
+
+
+def parse_size(size: str) -> int:
+    """Bytes of a DuckDB size setting, e.g. "2GB" or "512 MiB"."""
+    match = re.fullmatch(r"\s*([\d.]+)\s*([a-zA-Z]*)\s*", size)
+    unit = match.group(2).lower() if match else None
+    if unit not in _UNITS:
+        raise ValueError(f"Invalid size '{size}'")
+    return int(float(match.group(1)) * _UNITS[unit])
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _cgroup_memory() -> Optional[int]:
+    for path in (
+        "/sys/fs/cgroup/memory.max",  # cgroup v2
+        "/sys/fs/cgroup/memory/memory.limit_in_bytes",  # cgroup v1
+    ):
+        value = _read(path)
+        # v1 reports "no limit" as a huge page-aligned number
+        if value and value.isdigit() and int(value) < 1 << 60:
+            return int(value)
+    return None
+
+
+def _available_memory() -> int:
+    meminfo = _read("/proc/meminfo") or ""
+    match = re.search(r"^MemAvailable:\s+(\d+) kB", meminfo, re.MULTILINE)
+    if match:
+        return int(match.group(1)) * 1024
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+
+
+def _cgroup_cpus() -> Optional[int]:
+    value = _read("/sys/fs/cgroup/cpu.max")  # "<quota> <period>" or "max ..."
+    if value and not value.startswith("max"):
+        quota, period = value.split()[:2]
+        return max(1, math.floor(int(quota) / int(period)))
+    return None
+
+
+def detect_resources() -> HostResources:
+    """Memory and cores the process may use, container limits included."""
+    memory = _available_memory()
+    cgroup_memory = _cgroup_memory()
+    if cgroup_memory:
+        memory = min(memory, cgroup_memory)
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else 0
+    cpus = cpus or os.cpu_count() or 1
+    cgroup_cpus = _cgroup_cpus()
+    if cgroup_cpus:
+        cpus = min(cpus, cgroup_cpus)
+    return HostResources(memory_bytes=memory, cpus=cpus)
+
+
+class ResourceGovernor:
+    """
+    Configures a DuckDB session for the host and sizes the windows and write
+    batches of a load from what the previous windows actually held. Windows
+    are predicted from an exponentially weighted average of the observed
+    rows per day and bytes per row, so a project whose traffic grows gets
+    shorter windows rather than an out-of-memory kill.
+    """
+
+    def __init__(
+        self,
+        resources: Optional[HostResources] = None,
+        memory_limit: Optional[str] = None,
+        memory_fraction: float = 0.75,
+        temp_directory: Optional[str] = None,
+        profile: str = "raw",
+        max_window_days: int = 31,
+        smoothing: float = 0.5,
+    ):
+        """
+        `memory_limit` (e.g. "2GB") overrides `memory_fraction` of the
+        detected memory. `smoothing` is the weight of the latest window in the
+        running averages.
+        """
+        self.resources = resources or detect_resources()
+        self.memory_limit_bytes = (
+            parse_size(memory_limit)
+            if memory_limit
+            else int(self.resources.memory_bytes * memory_fraction)
+        )
+        self.temp_directory = temp_directory or os.path.join(
+            tempfile.gettempdir(), "duckdb_spill"
+        )
+        self.max_window_days = max_window_days
+        self.smoothing = smoothing
+        self.bytes_per_row = float(DEFAULT_BYTES_PER_ROW.get(profile, 1200))
+        self.rows_per_day: Optional[float] = None
+
+    def configure(self, conn: duckdb.DuckDBPyConnection):
+        """Apply memory limit, threads and spill directory to the database of
+        `conn` (settings are shared by all its cursors)."""
+        os.makedirs(self.temp_directory, exist_ok=True)
+        conn.execute(f"SET memory_limit = '{self.memory_limit_bytes // 1024**2}MiB'")
+        conn.execute(f"SET threads = {self.resources.cpus}")
+        conn.execute(f"SET temp_directory = '{self.temp_directory}'")
+        logger.info(
+            f"Governor: memory_limit {self.memory_limit_bytes / 1024**3:,.1f} GiB, "
+            f"{self.resources.cpus} threads, spilling to {self.temp_directory}"
+        )
+
+    def seed(self, rows_per_day: Optional[float]):
+        """Start from the rows per day of earlier runs, when known."""
+        if rows_per_day:
+            self.rows_per_day = rows_per_day
+
+    def observe(self, stats: WindowStats):
+        """Update the averages with a committed window."""
+        days = _days(stats.start_date, stats.end_date)
+        if stats.rows <= 0 or days <= 0:
+            return
+        self.rows_per_day = self._smooth(self.rows_per_day, stats.rows / days)
+        # Streaming windows are not measured
+        if stats.bytes:
+            self.bytes_per_row = self._smooth(
+                self.bytes_per_row, stats.bytes / stats.rows
+            )
+
+    def workers(self, requested: int) -> int:
+        """Concurrent windows: as requested, fewer when that many one-day
+        windows would not fit in memory. Windows mostly wait on the BigQuery
+        stream, so cores are not the limit."""
+        workers = max(1, requested)
+        if self.rows_per_day:
+            day_bytes = self.rows_per_day * self.bytes_per_row * MEMORY_OVERHEAD
+            workers = max(1, min(workers, int(self.memory_limit_bytes // day_bytes)))
+        return workers
+
+    def window_days(self, workers: int) -> int:
+        """Days per window so that `workers` windows fit the memory limit. One
+        day until a first window was measured."""
+        if not self.rows_per_day:
+            return 1
+        window_budget = self.memory_limit_bytes / max(workers, 1)
+        day_bytes = self.rows_per_day * self.bytes_per_row * MEMORY_OVERHEAD
+        return max(1, min(self.max_window_days, int(window_budget // day_bytes)))
+
+    def chunk_size(self, share: float = 0.1) -> int:
+        """Rows per write batch, `share` of the memory limit."""
+        rows = int(self.memory_limit_bytes * share / self.bytes_per_row)
+        return max(10_000, min(rows, 5_000_000))
+
+    def _smooth(self, average: Optional[float], value: float) -> float:
+        if average is None:
+            return value
+        return self.smoothing * value + (1 - self.smoothing) * average
+
+
+def _days(start_date: str, end_date: str) -> float:
+    return (
+        datetime.fromisoformat(end_date) - datetime.fromisoformat(start_date)
+    ).total_seconds() / 86400
@@ -0,0 +1,205 @@
+import functools
+import json
+import resource
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+import duckdb
+from loguru import logger
+from pydantic import BaseModel
+
+# Scalar metrics kept from DuckDB's JSON profiling output (the operator tree is
+# dropped to keep reports small)
+PROFILE_METRICS = [
+    "latency",
+    "cpu_time",
+    "rows_returned",
+    "total_bytes_read",
+    "total_bytes_written",
+    "system_peak_buffer_memory",
+    "system_peak_temp_dir_size",
+]
+
+
+class StageMetrics(BaseModel):
+    """Measurements of one stage of a loader run"""
+
+    stage: str
+    window: Optional[str] = None
+    started_at: datetime
+    wall_seconds: float = 0.0
+    rows: Optional[int] = None
+    bytes: Optional[int] = None
+    # ru_maxrss high-water mark of the whole process at the end of the stage,
+    # not the stage's own peak: later stages repeat the peak of a heavier one
+    process_peak_rss_bytes: int = 0
+    status: str = "ok"
+    duckdb_profile: Dict[str, Any] = {}
+
+
+class RunReport(BaseModel):
+    """Machine-readable report of a pipeline run"""
+
+    run_id: str
+    started_at: datetime
+    finished_at: datetime
+    status: str
+    total_seconds: float
+    peak_rss_bytes: int
+    params: Dict[str, Any]
+    stages: List[StageMetrics]
+
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of the process so far (ru_maxrss is in KiB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RunRecorder:
+    """
+    Collects per-stage wall time, rows, bytes, the process peak RSS so far
+    and, when `profile_queries` is set, DuckDB profiling metrics of the last
+    statement of each stage. Safe to share between the cursors of concurrent
+    windows.
+    """
+
+    def __init__(self, profile_queries: bool = False):
+        self.run_id = uuid.uuid4().hex
+        self.started_at = datetime.now()
+        self.profile_queries = profile_queries
+        self.stages: list[StageMetrics] = []
+        self._lock = threading.Lock()
+
+    def enable_profiling(self, conn: duckdb.DuckDBPyConnection):
+        if self.profile_queries:
+            conn.execute("SET enable_profiling = 'no_output'")
+
+    @contextmanager
+    def stage(
+        self,
+        name: str,
+        conn: duckdb.DuckDBPyConnection | None = None,
+        window: str | None = None,
+    ) -> Iterator[StageMetrics]:
+        metrics = StageMetrics(stage=name, window=window, started_at=datetime.now())
+        started = time.perf_counter()
+        try:
+            yield metrics
+        except Exception:
+            metrics.status = "failed"
+            raise
+        finally:
+            metrics.wall_seconds = time.perf_counter() - started
+            metrics.process_peak_rss_bytes = peak_rss_bytes()
+            if conn is not None and self.profile_queries and metrics.status == "ok":
+                metrics.duckdb_profile = self._last_profile(conn)
+                if metrics.bytes is None:
+                    metrics.bytes = max(
+                        metrics.duckdb_profile.get("total_bytes_read", 0),
+                        metrics.duckdb_profile.get("total_bytes_written", 0),
+                    )
+            with self._lock:
+                self.stages.append(metrics)
+
+    def _last_profile(self, conn: duckdb.DuckDBPyConnection) -> dict:
+        try:
+            profile = json.loads(conn.get_profiling_information(format="json"))
+        except Exception as e:
+            logger.warning(f"Could not read DuckDB profiling output: {e}")
+            return {}
+        return {key: profile[key] for key in PROFILE_METRICS if key in profile}
+
+    def report(self, params: dict, status: str = "ok") -> RunReport:
+        finished_at = datetime.now()
+        return RunReport(
+            run_id=self.run_id,
+            started_at=self.started_at,
+            finished_at=finished_at,
+            status=status,
+            total_seconds=(finished_at - self.started_at).total_seconds(),
+            peak_rss_bytes=peak_rss_bytes(),
+            params=params,
+            stages=sorted(self.stages, key=lambda s: s.started_at),
+        )
+
+
+def instrumented(stage: str):
+    """Record a loader method as a stage of `self.recorder`. An int returned by
+    the method is recorded as the stage row count."""
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.recorder.stage(
+                stage, conn=self.conn, window=self.window_label
+            ) as metrics:
+                result = method(self, *args, **kwargs)
+                if isinstance(result, int):
+                    metrics.rows = result
+                return result
+
+        return wrapper
+
+    return decorator
+
+
+def write_report(report: RunReport, path: str):
+    """Write the run report as JSON."""
+    with open(path, "w") as f:
+        f.write(report.model_dump_json(indent=2))
+    logger.info(f"Run report written to {path}")
+
+
+def append_report(report: RunReport, metrics_db_path: str):
+    """Append the run report to the `run_stages` table of a local DuckDB file,
+    one row per stage, to track durations and volumes across runs."""
+    if not report.stages:
+        return
+
+    conn = duckdb.connect(database=metrics_db_path)
+    try:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS run_stages (
+                run_id VARCHAR,
+                run_started_at TIMESTAMP,
+                run_status VARCHAR,
+                stage VARCHAR,
+                "window" VARCHAR,
+                started_at TIMESTAMP,
+                wall_seconds DOUBLE,
+                rows BIGINT,
+                bytes BIGINT,
+                process_peak_rss_bytes BIGINT,
+                status VARCHAR,
+                duckdb_profile JSON,
+                params JSON
+            )
+        """)
+        conn.executemany(
+            "INSERT INTO run_stages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                [
+                    report.run_id,
+                    report.started_at,
+                    report.status,
+                    s.stage,
+                    s.window,
+                    s.started_at,
+                    s.wall_seconds,
+                    s.rows,
+                    s.bytes,
+                    s.process_peak_rss_bytes,
+                    s.status,
+                    json.dumps(s.duckdb_profile),
+                    json.dumps(report.params),
+                ]
+                for s in report.stages
+            ],
+        )
+        logger.info(f"Run {report.run_id} appended to {metrics_db_path}")
+    finally:
+        conn.close()
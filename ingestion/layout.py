@@ -0,0 +1,147 @@
+"""
+Physical layout of the destination tables.
+
+DuckDB and MotherDuck keep min/max statistics (zone maps) per column and row
+group, and skip the row groups a filter cannot match. Writes sorted by the
+layout key keep each row group on a narrow range of projects and days, so the
+date-range and project predicates of the dashboard queries and of the day
+replaces prune everything else, however much history the table holds.
+
+Every load appends its own sorted row groups at the end of the table, and
+replaces leave deleted rows behind; `compact` periodically rewrites a date
+range into full row groups in global sort order:
+
+    python -m ingestion.layout compact --start_date 2024-05-01 --end_date 2024-06-01
+    python -m ingestion.layout compact --table pypi_daily_stats \
+        --date_column download_date --start_date 2024-05-01 --end_date 2024-06-01
+"""
+
+from typing import Optional
+
+import duckdb
+import fire
+from loguru import logger
+
+from ingestion.session import LoaderSession
+
+LAYOUTS = ("project_date", "timestamp", "none")
+
+
+def sort_key(layout: str, timestamp_column: str) -> Optional[str]:
+    """
+    Write order of a layout, None for unsorted writes:
+    - "project_date": project, then download day, then timestamp
+    - "timestamp": timestamp only
+    - "none": insertion order (cheapest load, no pruning guarantee)
+    """
+    if layout == "project_date":
+        return f"project, {timestamp_column}::DATE, {timestamp_column}"
+    if layout == "timestamp":
+        return timestamp_column
+    if layout == "none":
+        return None
+    raise ValueError(f"Unknown layout '{layout}', use {', '.join(LAYOUTS)}")
+
+
+def order_by(layout: str, timestamp_column: str) -> str:
+    """ORDER BY clause of a layout, empty for unsorted writes."""
+    key = sort_key(layout, timestamp_column)
+    return f"ORDER BY {key}" if key else ""
+
+
+def compact(
+    conn: duckdb.DuckDBPyConnection,
+    table_ref: str,
+    date_column: str,
+    layout: str = "project_date",
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+) -> int:
+    """
+    Rewrite the [start_date, end_date) rows of `table_ref` (database.schema.table)
+    in layout order, or the whole table when no range is given.
+
+    A range is copied to a staging table next to the table, then deleted and
+    inserted back sorted, all in one transaction: readers see either the
+    original rows or the compacted ones. Loads of the same range must not run
+    concurrently, their rows could be written twice.
+
+    Returns:
+        Number of rows rewritten
+    """
+    ordering = order_by(layout, date_column)
+    if not ordering:
+        raise ValueError("Compaction needs a sorted layout")
+
+    if start_date is None and end_date is None:
+        logger.info(f"Compacting the whole of {table_ref}")
+        conn.execute(f"""
+            CREATE OR REPLACE TABLE {table_ref} AS
+            SELECT * FROM {table_ref}
+            {ordering}
+        """)
+        rows = conn.execute(f"SELECT COUNT(*) FROM {table_ref}").fetchone()[0]
+        logger.info(f"Compacted {rows:,} rows of {table_ref}")
+        return rows
+
+    conditions = []
+    if start_date is not None:
+        conditions.append(f"{date_column} >= '{start_date}'")
+    if end_date is not None:
+        conditions.append(f"{date_column} < '{end_date}'")
+    range_filter = " AND ".join(conditions)
+    staging = f"{table_ref}__compaction"
+
+    logger.info(f"Compacting {table_ref} from {start_date} to {end_date}")
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        conn.execute(f"""
+            CREATE OR REPLACE TABLE {staging} AS
+            SELECT * FROM {table_ref} WHERE {range_filter}
+        """)
+        conn.execute(f"DELETE FROM {table_ref} WHERE {range_filter}")
+        result = conn.execute(f"""
+            INSERT INTO {table_ref}
+            SELECT * FROM {staging}
+            {ordering}
+        """).fetchone()
+        conn.execute(f"DROP TABLE {staging}")
+        conn.execute("COMMIT")
+    except Exception as e:
+        logger.error(f"Error compacting {table_ref}: {e}")
+        conn.execute("ROLLBACK")
+        raise
+
+    rows = result[0] if result else 0
+    logger.info(f"Compacted {rows:,} rows of {table_ref}")
+    return rows
+
+
+def compact_table(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    table: str = "pypi_file_downloads",
+    date_column: str = "timestamp",
+    database_name: str = "duckdb_stats",
+    layout: str = "project_date",
+    local_path: Optional[str] = None,
+):
+    """CLI: compact a MotherDuck table, or a table of the local DuckDB file
+    `local_path`, over [start_date, end_date) (the whole table by default)."""
+    with LoaderSession(
+        attach_motherduck=local_path is None, bigquery_extension=False
+    ) as session:
+        if local_path:
+            session.conn.execute(f"ATTACH '{local_path}' AS {database_name}")
+        compact(
+            session.conn,
+            f"{database_name}.main.{table}",
+            date_column,
+            layout=layout,
+            start_date=start_date,
+            end_date=end_date,
+        )
+
+
+if __name__ == "__main__":
+    fire.Fire({"compact": compact_table})
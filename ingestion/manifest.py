@@ -0,0 +1,130 @@
+from datetime import date, timedelta
+
+import duckdb
+from loguru import logger
+from ingestion.models import WindowStats
+
+
+class RunManifest:
+    """
+    Durable local record of the date windows already loaded to a destination.
+
+    Backed by a small DuckDB file so that a rerun after a failure can skip the
+    windows that already committed instead of paying the BigQuery scan again.
+    """
+
+    def __init__(self, path: str, target: str):
+        self.path = path
+        self.target = target
+        self.conn = duckdb.connect(database=path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS completed_windows (
+                target VARCHAR,
+                project VARCHAR,
+                start_date DATE,
+                end_date DATE,
+                rows BIGINT,
+                checksum VARCHAR,
+                completed_at TIMESTAMP DEFAULT current_timestamp,
+                PRIMARY KEY (target, project, start_date, end_date)
+            )
+        """)
+
+    def record(self, project: str, stats: WindowStats):
+        """Mark a window as completed for a project, replacing any previous
+        record of it, with the project's own rows: 0 if the window had none of
+        them, NULL when the window did not count rows per project (streaming)."""
+        if stats.project_rows:
+            rows = stats.project_rows.get(project, 0)
+        else:
+            rows = 0 if stats.rows == 0 else None
+        self.conn.execute(
+            """
+            INSERT OR REPLACE INTO completed_windows
+                (target, project, start_date, end_date, rows, checksum, completed_at)
+            VALUES (?, ?, ?, ?, ?, ?, current_timestamp)
+            """,
+            [
+                self.target,
+                project,
+                stats.start_date,
+                stats.end_date,
+                rows,
+                stats.checksum,
+            ],
+        )
+
+    def rows_per_day(self, projects: list[str], limit: int = 30) -> float | None:
+        """Median rows per day of the latest `limit` windows of `projects`
+        together with counted rows, None before any such window was recorded."""
+        placeholders = ", ".join("?" for _ in projects)
+        result = self.conn.execute(
+            f"""
+            SELECT MEDIAN(rows_per_day) FROM (
+                SELECT start_date, SUM(rows / (end_date - start_date)) AS rows_per_day
+                FROM completed_windows
+                WHERE target = ? AND project IN ({placeholders})
+                AND rows IS NOT NULL
+                GROUP BY start_date
+                ORDER BY start_date DESC
+                LIMIT {limit}
+            )
+            """,
+            [self.target, *projects],
+        ).fetchone()
+        return result[0] if result else None
+
+    def completed_days(self, project: str) -> set[date]:
+        """Days covered by the windows already loaded for a project."""
+        rows = self.conn.execute(
+            """
+            SELECT DISTINCT UNNEST(
+                generate_series(start_date, end_date - 1, INTERVAL 1 DAY)
+            )::DATE
+            FROM completed_windows
+            WHERE target = ? AND project = ?
+            """,
+            [self.target, project],
+        ).fetchall()
+        return {row[0] for row in rows}
+
+    def pending(
+        self, projects: str | list[str], windows: list[tuple[str, str]]
+    ) -> list[tuple[str, str]]:
+        """Trim `windows` to the days not yet covered by a completed window of
+        every one of `projects`. Days are matched rather than windows, so a
+        resume with another window size skips the days already committed: a
+        window partly covered is narrowed to its runs of uncovered days."""
+        if isinstance(projects, str):
+            projects = [projects]
+        done = set.intersection(*(self.completed_days(project) for project in projects))
+        remaining = []
+        for start_date, end_date in windows:
+            day, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+            run_start = None
+            while day < end:
+                if day in done and run_start is not None:
+                    remaining.append((run_start.isoformat(), day.isoformat()))
+                    run_start = None
+                elif day not in done and run_start is None:
+                    run_start = day
+                day += timedelta(days=1)
+            if run_start is not None:
+                remaining.append((run_start.isoformat(), end.isoformat()))
+        if remaining != windows:
+            skipped = _days(windows) - _days(remaining)
+            logger.info(
+                f"Resuming {', '.join(projects)}: skipping {skipped} completed "
+                f"days, {len(remaining)} windows remaining"
+            )
+        return remaining
+
+    def close(self):
+        self.conn.close()
+
+
+def _days(windows: list[tuple[str, str]]) -> int:
+    return sum(
+        (date.fromisoformat(end) - date.fromisoformat(start)).days
+        for start, end in windows
+    )
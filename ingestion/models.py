@@ -1,5 +1,11 @@
-from pydantic import BaseModel
-from typing import Union, List
+from datetime import date, datetime
+from pydantic import BaseModel, field_validator, model_validator
+from typing import Any, Dict, Optional, Union, List
+
+
+# Write modes of the temp table to the destination: bulk (one INSERT ... SELECT),
+# chunked (one INSERT per rowid range), merge (insert only the missing rows)
+COPY_MODES = ("bulk", "chunked", "merge")
 
 
 class PypiJobParameters(BaseModel):
@@ -7,9 +13,155 @@ class PypiJobParameters(BaseModel):
 
     start_date: str = "2019-04-01"
     end_date: str = "2023-11-30"
-    pypi_project: str = "duckdb"
+    pypi_project: Union[List[str], str] = "duckdb"  # one or several projects
     database_name: str = "duckdb_stats"
     table_name: str = "pypi_file_downloads"
     gcp_project: str
     timestamp_column: str = "timestamp"
+    ingestion_profile: str = (
+        "raw"  # raw (all columns), lean (dbt fields, flattened) or compact (encoded)
+    )
     destination: Union[List[str], str] = ["local"]  # local, s3, md
+    local_path: Optional[str] = (
+        None  # local DuckDB file, default {database_name}.duckdb
+    )
+    parquet_path: str = "data"  # partitioned Parquet root for s3, local dir or s3://
+    window_days: Optional[int] = None  # split the range into windows, None = one scan
+    workers: int = 4  # concurrent windows when window_days is set
+    resume: bool = False  # skip windows already recorded in the run manifest
+    manifest_path: str = "ingestion_manifest.duckdb"
+    streaming: bool = False  # write straight from bigquery_scan, no local temp table
+    memory_limit: Optional[str] = None  # DuckDB memory budget, e.g. "2GB"
+    copy_mode: str = "bulk"  # bulk, chunked (rowid ranges) or merge (single scan only)
+    incremental: bool = False  # scan from the destination high-water mark and merge
+    overlap_hours: int = 24  # late-arrival overlap re-scanned before the mark
+    rollup: str = "none"  # daily rollup: none, only (instead of raw rows) or both
+    rollup_table: str = "pypi_daily_stats"
+    report_path: Optional[str] = None  # write a JSON run report to this path
+    metrics_db: Optional[str] = None  # append per-stage metrics to this DuckDB file
+    profile_queries: bool = False  # attach DuckDB profiling metrics to each stage
+    quality_rules: Optional[str] = None  # JSON data quality rules, None = defaults
+    quality_profile_table: Optional[str] = "pypi_daily_profile"  # per-day profile in md
+    offline: bool = False  # load the cached bigquery extension, never INSTALL it
+    layout: str = "project_date"  # write order: project_date, timestamp or none
+    adaptive: bool = False  # size DuckDB, windows (up to window_days) and batches
+    temp_directory: Optional[str] = None  # spill directory of adaptive runs
+    sample_fraction: float = 0.0  # share of each (project, day, country) sampled
+    sample_table: str = "pypi_file_downloads_sample"
+
+    @field_validator("copy_mode")
+    @classmethod
+    def _check_copy_mode(cls, copy_mode: str) -> str:
+        if copy_mode not in COPY_MODES:
+            raise ValueError(
+                f"Unknown copy_mode '{copy_mode}', use {', '.join(COPY_MODES)}"
+            )
+        return copy_mode
+
+    @model_validator(mode="after")
+    def _check_merge_scan(self) -> "PypiJobParameters":
+        # Windows and streaming replace their range, they never merge
+        if self.copy_mode == "merge" and (self.window_days or self.streaming):
+            raise ValueError("copy_mode merge only runs as a single scan")
+        return self
+
+    @property
+    def projects(self) -> List[str]:
+        """Projects as a list, also accepting a comma separated string."""
+        if isinstance(self.pypi_project, str):
+            return [p.strip() for p in self.pypi_project.split(",") if p.strip()]
+        return list(self.pypi_project)
+
+    @property
+    def destinations(self) -> List[str]:
+        """Destinations as a list, also accepting a comma separated string."""
+        if isinstance(self.destination, str):
+            return [d.strip() for d in self.destination.split(",") if d.strip()]
+        return list(self.destination)
+
+
+class WindowStats(BaseModel):
+    """Outcome of loading a single date window"""
+
+    start_date: str
+    end_date: str
+    rows: int
+    bytes: int  # approximate payload size, 0 when not measured (streaming)
+    elapsed_seconds: float
+    checksum: Optional[str] = None
+    project_rows: Dict[str, int] = {}  # rows per project, empty when not counted
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+
+class HostResources(BaseModel):
+    """Memory and cores available to the ingestion process"""
+
+    memory_bytes: int
+    cpus: int
+
+
+class SampleEstimate(BaseModel):
+    """Scaled aggregate of the stratified sample for one group"""
+
+    group: Dict[str, Any]  # group_by expression -> value
+    estimate: float
+    std_error: float
+    lower: float  # confidence interval bounds
+    upper: float
+    sample_rows: int  # sampled rows the estimate is computed from
+
+
+class SchedulerParameters(BaseModel):
+    """Parameters of the long-running ingestion scheduler"""
+
+    queue_path: str = "ingestion_queue.duckdb"  # local DuckDB file of the task queue
+    workers: int = 4  # concurrent (project, day) tasks
+    backfill_workers: int = (
+        1  # of which at most this many on days older than fresh_days
+    )
+    fresh_days: int = 3  # days before today enqueued on every tick, loaded first
+    settle_hours: int = 24  # reload a fresh day once, after late arrivals settled
+    max_attempts: int = 5  # then the task is left failed
+    backoff_seconds: int = 60  # retry delay, doubled on every failed attempt
+    max_backoff_seconds: int = 3600
+    poll_seconds: int = 300  # idle wait between two looks at the queue
+    once: bool = False  # exit when no task is ready instead of polling
+
+
+class QueueTask(BaseModel):
+    """One day of one project in the scheduler queue"""
+
+    project: str
+    day: date
+    attempts: int = 0
+
+
+class ExportFile(BaseModel):
+    """One Parquet file of an exported partition"""
+
+    path: str
+    rows: int
+    size_bytes: int
+
+
+class PartitionManifest(BaseModel):
+    """Content of one exported year/month partition"""
+
+    table: str
+    year: int
+    month: int
+    rows: int
+    min_date: date
+    max_date: date
+    content_hash: str  # order-independent hash of the rows, to detect changes
+    files: List[ExportFile] = []
+    row_group_size: Optional[int] = None
+    compression: Optional[str] = None
+    exported_at: Optional[datetime] = None
@@ -1,30 +1,286 @@
-from ingestion.bigquery import build_bigquery_filter, PYPI_PUBLIC_TABLE, COLUMNS
-from datetime import datetime
+from ingestion.bigquery import (
+    build_bigquery_filter,
+    split_date_range,
+    get_columns,
+    PYPI_PUBLIC_TABLE,
+)
+from datetime import datetime, timedelta
 from loguru import logger
 from ingestion.duck import MotherDuckBigQueryLoader
+from ingestion.governor import ResourceGovernor
+from ingestion.instrumentation import RunRecorder, append_report, write_report
+from ingestion.manifest import RunManifest
+from ingestion.quality import load_rules
+from ingestion.session import LoaderSession
+from ingestion.sinks import Sink, build_sinks
 import fire
 from ingestion.models import PypiJobParameters
 
 
-def main(params: PypiJobParameters):
-    start_time = datetime.now()
+def load_windows(
+    loader: MotherDuckBigQueryLoader,
+    params: PypiJobParameters,
+    window_days: int,
+    sinks: list[Sink] | None = None,
+    governor: ResourceGovernor | None = None,
+):
+    """Load the date range window by window, recording each committed window in
+    the run manifest and skipping already-completed ones when resuming.
 
-    loader = MotherDuckBigQueryLoader(
-        motherduck_database=params.database_name,
-        motherduck_table=params.table_name,
-        project_id=params.gcp_project,
+    With a `governor`, windows of up to `window_days` are sized batch by batch
+    from the rows of the windows loaded so far, see `ResourceGovernor`."""
+    manifest = RunManifest(
+        params.manifest_path, target=f"{params.database_name}.{params.table_name}"
     )
+    try:
+
+        def record_window(stats):
+            for project in params.projects:
+                manifest.record(project, stats)
+            if governor:
+                governor.observe(stats)
+
+        def load(date_windows, workers, chunk_size=100000):
+            windows = []
+            for start_date, end_date in date_windows:
+                window_params = params.model_copy(
+                    update={"start_date": start_date, "end_date": end_date}
+                )
+                windows.append(
+                    (start_date, end_date, build_bigquery_filter(window_params))
+                )
+            return loader.load_partitioned(
+                table=PYPI_PUBLIC_TABLE,
+                windows=windows,
+                columns=get_columns(params.ingestion_profile),
+                timestamp_column=params.timestamp_column,
+                workers=workers,
+                chunk_size=chunk_size,
+                copy_mode=params.copy_mode,
+                streaming=params.streaming,
+                memory_limit=None if governor else params.memory_limit,
+                sinks=sinks,
+                projects=params.projects,
+                on_window_loaded=record_window,
+            )
+
+        if governor is None:
+            date_windows = split_date_range(
+                params.start_date, params.end_date, window_days
+            )
+            if params.resume:
+                date_windows = manifest.pending(params.projects, date_windows)
+            if not date_windows:
+                logger.info("All windows already loaded, nothing to do")
+                return
+            stats = load(date_windows, params.workers)
+        else:
+            governor.max_window_days = window_days
+            governor.seed(manifest.rows_per_day(params.projects))
+            stats = []
+            start_date = params.start_date
+            while start_date < params.end_date:
+                # One batch of concurrent windows, sized from the last ones
+                workers = governor.workers(params.workers)
+                days = governor.window_days(workers)
+                date_windows = split_date_range(start_date, params.end_date, days)
+                date_windows = date_windows[:workers]
+                logger.info(
+                    f"Governor: {len(date_windows)} windows of {days} days "
+                    f"from {start_date}"
+                )
+                stats += load(date_windows, len(date_windows), governor.chunk_size())
+                start_date = date_windows[-1][1]
+
+        logger.info(
+            f"Loaded {sum(s.rows for s in stats):,} rows in {len(stats)} windows"
+        )
+    finally:
+        manifest.close()
+
 
-    bq_filter = build_bigquery_filter(params)
+def apply_high_water_mark(
+    params: PypiJobParameters, high_water_mark: datetime | None
+) -> PypiJobParameters:
+    """Move start_date up to the high-water mark (naive UTC, see
+    `get_high_water_mark`) minus the late-arrival overlap, never earlier than
+    the requested start_date."""
+    if high_water_mark is None:
+        logger.info(f"No data loaded yet for {', '.join(params.projects)}, full range")
+        return params
 
-    loader.load_from_bigquery_to_motherduck(
-        table=PYPI_PUBLIC_TABLE,
-        filter_str=bq_filter,
-        columns=COLUMNS,
-        timestamp_column=params.timestamp_column,
-        start_date=params.start_date,
-        end_date=params.end_date,
+    incremental_start = high_water_mark - timedelta(hours=params.overlap_hours)
+    if incremental_start <= datetime.fromisoformat(params.start_date):
+        return params
+
+    start_date = incremental_start.strftime("%Y-%m-%d %H:%M:%S")
+    logger.info(
+        f"High-water mark for {', '.join(params.projects)} is {high_water_mark}, "
+        f"scanning from {start_date} ({params.overlap_hours}h overlap)"
     )
+    return params.model_copy(update={"start_date": start_date})
+
+
+def run_pipeline(
+    params: PypiJobParameters,
+    recorder: RunRecorder,
+    loader: MotherDuckBigQueryLoader | None = None,
+    session: LoaderSession | None = None,
+):
+    destinations = params.destinations
+    if session and "md" in destinations and not session.attach_motherduck:
+        raise ValueError("The md destination needs a session attached to MotherDuck")
+    columns = get_columns(params.ingestion_profile)
+    quality_rules = load_rules(params.quality_rules) if params.quality_rules else None
+    # The quality profile lives next to the data, only when md is a destination
+    profile_table = params.quality_profile_table if "md" in destinations else None
+    if loader is None:
+        loader = MotherDuckBigQueryLoader(
+            motherduck_database=params.database_name,
+            motherduck_table=params.table_name,
+            project_id=params.gcp_project,
+            attach_motherduck="md" in destinations,
+            recorder=recorder,
+            quality_rules=quality_rules,
+            profile_table=profile_table,
+            session=session,
+            offline=params.offline,
+            layout=params.layout,
+            dimension_encoding=params.ingestion_profile == "compact",
+            sample_table=params.sample_table if params.sample_fraction else None,
+            sample_fraction=params.sample_fraction,
+        )
+
+    governor = None
+    if params.adaptive:
+        if params.resume:
+            # Resumes match the recorded windows, adaptive windows move
+            raise ValueError("Adaptive loads size their windows, they do not resume")
+        governor = ResourceGovernor(
+            memory_limit=params.memory_limit,
+            temp_directory=params.temp_directory,
+            profile=params.ingestion_profile,
+        )
+        governor.configure(loader.conn)
+
+    # MotherDuck alone keeps the loader's own write paths (streaming, copy modes),
+    # any other combination fans out one BigQuery scan to the configured sinks
+    sinks = None if destinations == ["md"] else build_sinks(params)
+    if sinks and params.streaming:
+        raise ValueError("Streaming loads only support the md destination")
+    if params.ingestion_profile == "compact" and (sinks or params.streaming):
+        # The dimension tables live in md, next to the encoded rows
+        raise ValueError("The compact profile only runs md loads via a temp table")
+    if params.sample_fraction and (
+        sinks or params.streaming or params.incremental or params.rollup == "only"
+    ):
+        # Sampled days are replaced whole, from the temp table of an md load
+        raise ValueError("The sample is only written by md loads via a temp table")
+
+    if params.incremental:
+        if "md" not in destinations:
+            raise ValueError("Incremental loads read the high-water mark from md")
+        if params.window_days or params.resume:
+            raise ValueError("Incremental loads run as a single scan, not windows")
+        # The scan is shared by all projects, so it starts at the oldest mark
+        marks = [
+            loader.get_high_water_mark(params.timestamp_column, project)
+            for project in params.projects
+        ]
+        params = apply_high_water_mark(params, None if None in marks else min(marks))
+        if params.start_date >= params.end_date:
+            logger.info("Destination is already up to date, nothing to do")
+            return
+
+    window_days = params.window_days or (1 if params.resume else None)
+    if governor:
+        # The governor picks the window size, up to window_days
+        window_days = params.window_days or governor.max_window_days
+    if params.rollup != "none" and (
+        sinks or window_days or params.streaming or params.incremental
+    ):
+        # Daily counts need whole days, read in one scan and written to md
+        raise ValueError("Daily rollup only runs with a single-scan md load")
+
+    if window_days:
+        load_windows(loader, params, window_days, sinks, governor)
+    elif sinks:
+        loader.load_from_bigquery_to_sinks(
+            table=PYPI_PUBLIC_TABLE,
+            filter_str=build_bigquery_filter(params),
+            columns=columns,
+            timestamp_column=params.timestamp_column,
+            start_date=params.start_date,
+            end_date=params.end_date,
+            sinks=sinks,
+        )
+    elif params.streaming:
+        loader.stream_from_bigquery_to_motherduck(
+            table=PYPI_PUBLIC_TABLE,
+            filter_str=build_bigquery_filter(params),
+            columns=columns,
+            timestamp_column=params.timestamp_column,
+            start_date=params.start_date,
+            end_date=params.end_date,
+            memory_limit=params.memory_limit,
+            projects=params.projects,
+        )
+    elif params.rollup == "only":
+        loader.load_rollup_from_bigquery(
+            table=PYPI_PUBLIC_TABLE,
+            filter_str=build_bigquery_filter(params),
+            columns=columns,
+            start_date=params.start_date,
+            end_date=params.end_date,
+            rollup_table=params.rollup_table,
+            profile=params.ingestion_profile,
+            projects=params.projects,
+        )
+    else:
+        bq_filter = build_bigquery_filter(params)
+
+        loader.load_from_bigquery_to_motherduck(
+            table=PYPI_PUBLIC_TABLE,
+            filter_str=bq_filter,
+            columns=columns,
+            timestamp_column=params.timestamp_column,
+            start_date=params.start_date,
+            end_date=params.end_date,
+            copy_mode="merge" if params.incremental else params.copy_mode,
+            rollup_table=params.rollup_table if params.rollup == "both" else None,
+            profile=params.ingestion_profile,
+        )
+
+
+def report_run(params: PypiJobParameters, recorder: RunRecorder, status: str):
+    """Log the per-stage summary and emit the JSON run report / metrics rows."""
+    report = recorder.report(params.model_dump(), status)
+    for stage in report.stages:
+        logger.info(
+            f"Stage {stage.stage}"
+            + (f" [{stage.window}]" if stage.window else "")
+            + f": {stage.wall_seconds:.2f}s"
+            + (f", {stage.rows:,} rows" if stage.rows is not None else "")
+            + f", process peak RSS {stage.process_peak_rss_bytes / 1024 / 1024:,.0f} MiB"
+        )
+    if params.report_path:
+        write_report(report, params.report_path)
+    if params.metrics_db:
+        append_report(report, params.metrics_db)
+
+
+def main(params: PypiJobParameters, session: LoaderSession | None = None):
+    """Run one ingestion job. Driver scripts running several jobs pass a shared
+    `session` to pay the extension load and MotherDuck attach only once."""
+    start_time = datetime.now()
+    recorder = RunRecorder(profile_queries=params.profile_queries)
+
+    status = "failed"
+    try:
+        run_pipeline(params, recorder, session=session)
+        status = "ok"
+    finally:
+        report_run(params, recorder, status)
 
     end_time = datetime.now()
     elapsed = (end_time - start_time).total_seconds()
@@ -0,0 +1,335 @@
+import json
+from abc import ABC, abstractmethod
+from datetime import date, datetime, timedelta
+from typing import Annotated, Dict, List, Literal, Optional, Union
+
+from pydantic import BaseModel, Field, TypeAdapter
+
+
+class DataQualityError(Exception):
+    """Raised when data quality checks fail."""
+
+    pass
+
+
+class DayProfile(BaseModel):
+    """Rule metrics of the rows of one project on one day"""
+
+    download_date: Optional[date]
+    project: Optional[str]
+    rows: int
+    min_timestamp: Optional[datetime] = None
+    max_timestamp: Optional[datetime] = None
+    row_hash: Optional[int] = None  # sum of the row hashes
+    metrics: Dict[str, int] = {}
+
+
+class QualityProfile(BaseModel):
+    """Result of the single aggregate pass over a loaded window"""
+
+    timestamp_column: str
+    start_date: str
+    end_date: str
+    days: List[DayProfile]
+    # Median daily rows per project over the days preceding the window, read
+    # from the profile table
+    history: Dict[str, float] = {}
+
+    @property
+    def rows(self) -> int:
+        return sum(day.rows for day in self.days)
+
+    def total(self, metric: str) -> int:
+        return sum(day.metrics.get(metric, 0) for day in self.days)
+
+    def pct(self, metric: str) -> float:
+        return self.total(metric) / self.rows * 100 if self.rows else 0.0
+
+    @property
+    def checksum(self) -> Optional[str]:
+        """Order-independent checksum of the rows, None without rows."""
+        hashes = [day.row_hash for day in self.days if day.row_hash is not None]
+        return str(sum(hashes)) if hashes else None
+
+    def project_rows(self) -> Dict[str, int]:
+        """Rows per project, to route a multi-project scan: each project's
+        range is replaced without touching the others."""
+        counts: Dict[str, int] = {}
+        for day in self.days:
+            if day.project is not None:
+                counts[day.project] = counts.get(day.project, 0) + day.rows
+        return dict(sorted(counts.items()))
+
+    def full_days(self) -> List[DayProfile]:
+        """Days entirely inside [start_date, end_date) with a project, the only
+        ones comparable with history and stored in the profile table."""
+        start = datetime.fromisoformat(self.start_date)
+        end = datetime.fromisoformat(self.end_date)
+        return [
+            day
+            for day in self.days
+            if day.download_date is not None
+            and day.project is not None
+            and datetime.combine(day.download_date, datetime.min.time()) >= start
+            and datetime.combine(
+                day.download_date + timedelta(days=1), datetime.min.time()
+            )
+            <= end
+        ]
+
+
+class QualityRule(BaseModel, ABC):
+    """
+    A declarative check. `aggregates` returns the named SQL aggregates the rule
+    needs, computed per day and project together with those of every other
+    rule in a single pass; `check` returns a failure message or None.
+    """
+
+    severity: Literal["error", "warn"] = "error"
+
+    def aggregates(
+        self, timestamp_column: str, start_date: str, end_date: str
+    ) -> Dict[str, str]:
+        return {}
+
+    @abstractmethod
+    def check(self, profile: QualityProfile) -> Optional[str]:
+        pass
+
+
+class NullRateRule(QualityRule):
+    rule: Literal["null_rate"] = "null_rate"
+    column: str
+    max_pct: float = 5.0
+
+    @property
+    def metric(self) -> str:
+        return f"nulls_{self.column}"
+
+    def aggregates(self, timestamp_column, start_date, end_date):
+        return {self.metric: f"COUNT(*) - COUNT({self.column})"}
+
+    def check(self, profile):
+        pct = profile.pct(self.metric)
+        if pct > self.max_pct:
+            return (
+                f"{pct:.1f}% of {self.column} values are null "
+                f"(threshold: {self.max_pct:g}%)"
+            )
+        return None
+
+
+class DomainRule(QualityRule):
+    """Non-null values of `column` must be in `values` or fully match `pattern`."""
+
+    rule: Literal["domain"] = "domain"
+    column: str
+    values: Optional[List[str]] = None
+    pattern: Optional[str] = None
+    max_pct: float = 0.0
+
+    @property
+    def metric(self) -> str:
+        return f"out_of_domain_{self.column}"
+
+    def aggregates(self, timestamp_column, start_date, end_date):
+        if self.values is not None:
+            values_sql = ", ".join(f"'{v}'" for v in self.values)
+            allowed = f"{self.column} IN ({values_sql})"
+        elif self.pattern is not None:
+            allowed = f"regexp_full_match({self.column}, '{self.pattern}')"
+        else:
+            raise ValueError(f"Domain rule on {self.column} needs values or pattern")
+        return {
+            self.metric: f"COUNT(*) FILTER (WHERE {self.column} IS NOT NULL AND NOT {allowed})"
+        }
+
+    def check(self, profile):
+        pct = profile.pct(self.metric)
+        if pct > self.max_pct:
+            return (
+                f"{pct:.2f}% of {self.column} values are outside their domain "
+                f"(threshold: {self.max_pct:g}%)"
+            )
+        return None
+
+
+class TimestampRangeRule(QualityRule):
+    """Every row must fall in the loaded [start_date, end_date) range."""
+
+    rule: Literal["timestamp_range"] = "timestamp_range"
+
+    def aggregates(self, timestamp_column, start_date, end_date):
+        return {
+            "out_of_range": f"""COUNT(*) FILTER (
+                WHERE {timestamp_column} < '{start_date}'
+                OR {timestamp_column} >= '{end_date}')"""
+        }
+
+    def check(self, profile):
+        out_of_range = profile.total("out_of_range")
+        if out_of_range:
+            return (
+                f"{out_of_range:,} rows have a {profile.timestamp_column} outside "
+                f"[{profile.start_date}, {profile.end_date})"
+            )
+        return None
+
+
+class DuplicateRule(QualityRule):
+    """
+    Share of rows identical to another row of the same day and project.
+    Rows are compared by hash, so the count is exact up to 64-bit collisions.
+
+    This is the one aggregate of the pass that is not constant-size: the
+    distinct count keeps a hash set of the row hashes of each day and
+    project, so it costs memory (and spills to `temp_directory`) in
+    proportion to the rows of the window. An approximate count would not do:
+    HyperLogLog's ~2% error exceeds the default 1% threshold. Rules files
+    that leave this rule out skip the cost.
+    """
+
+    rule: Literal["duplicates"] = "duplicates"
+    max_pct: float = 1.0
+    severity: Literal["error", "warn"] = "warn"
+
+    def aggregates(self, timestamp_column, start_date, end_date):
+        return {"duplicates": "COUNT(*) - COUNT(DISTINCT hash(t))"}
+
+    def check(self, profile):
+        pct = profile.pct("duplicates")
+        if pct > self.max_pct:
+            return f"{pct:.2f}% of rows are duplicates (threshold: {self.max_pct:g}%)"
+        return None
+
+
+class RowCountAnomalyRule(QualityRule):
+    """
+    Daily rows of each project must stay within [min_ratio, max_ratio] times
+    the median of the previous `history_days` days in the profile table. Days
+    partially covered by the load and projects without history are skipped.
+    """
+
+    rule: Literal["row_count_anomaly"] = "row_count_anomaly"
+    history_days: int = 28
+    min_ratio: float = 0.2
+    max_ratio: float = 5.0
+    severity: Literal["error", "warn"] = "warn"
+
+    def check(self, profile):
+        anomalies = []
+        for day in profile.full_days():
+            baseline = profile.history.get(day.project)
+            if not baseline:
+                continue
+            ratio = day.rows / baseline
+            if not self.min_ratio <= ratio <= self.max_ratio:
+                anomalies.append(
+                    f"{day.project} on {day.download_date}: {day.rows:,} rows, "
+                    f"{ratio:.2f}x the {self.history_days}-day median"
+                )
+        if anomalies:
+            return "Daily row count anomalies: " + "; ".join(anomalies)
+        return None
+
+
+Rule = Annotated[
+    Union[
+        NullRateRule,
+        DomainRule,
+        TimestampRangeRule,
+        DuplicateRule,
+        RowCountAnomalyRule,
+    ],
+    Field(discriminator="rule"),
+]
+
+DEFAULT_RULES: List[QualityRule] = [
+    NullRateRule(column="timestamp"),
+    NullRateRule(column="project"),
+    DomainRule(column="country_code", pattern="[A-Z]{2}", max_pct=1.0),
+    TimestampRangeRule(),
+    DuplicateRule(),
+    RowCountAnomalyRule(),
+]
+
+
+def load_rules(path: str) -> List[QualityRule]:
+    """Read rules from a JSON list, e.g.
+    `[{"rule": "null_rate", "column": "project", "max_pct": 1}]`."""
+    with open(path) as f:
+        return TypeAdapter(List[Rule]).validate_python(json.load(f))
+
+
+def build_profile_sql(
+    relation: str,
+    rules: List[QualityRule],
+    timestamp_column: str,
+    start_date: str,
+    end_date: str,
+) -> tuple[str, List[str]]:
+    """
+    Compile the aggregates of every rule into one query grouped by day and
+    project, so all rules cost a single scan of `relation`. The same scan
+    sums the row hashes into the window checksum. Returns the query and the
+    names of the metric columns following the fixed ones.
+    """
+    aggregates: Dict[str, str] = {}
+    for rule in rules:
+        aggregates.update(rule.aggregates(timestamp_column, start_date, end_date))
+    metrics_sql = "".join(
+        f",\n            {sql} AS {name}" for name, sql in aggregates.items()
+    )
+    return (
+        f"""
+        SELECT
+            {timestamp_column}::DATE AS download_date,
+            project,
+            COUNT(*) AS rows,
+            MIN({timestamp_column}) AS min_timestamp,
+            MAX({timestamp_column}) AS max_timestamp,
+            SUM(hash(t)) AS row_hash{metrics_sql}
+        FROM {relation} AS t
+        GROUP BY ALL
+        """,
+        list(aggregates),
+    )
+
+
+def parse_profile_rows(rows: list[tuple], metrics: List[str]) -> List[DayProfile]:
+    return [
+        DayProfile(
+            download_date=row[0],
+            project=row[1],
+            rows=row[2],
+            min_timestamp=row[3],
+            max_timestamp=row[4],
+            row_hash=row[5],
+            metrics=dict(zip(metrics, row[6:], strict=True)),
+        )
+        for row in rows
+    ]
+
+
+def history_days(rules: List[QualityRule]) -> int:
+    """Days of profile history the rules compare against (0: none needed)."""
+    return max(
+        (r.history_days for r in rules if isinstance(r, RowCountAnomalyRule)),
+        default=0,
+    )
+
+
+def evaluate(profile: QualityProfile, rules: List[QualityRule]) -> List[str]:
+    """Run every rule on the profile; raise DataQualityError listing the failed
+    error-severity rules, return the messages of the failed warn-severity ones."""
+    if profile.rows == 0:
+        raise DataQualityError("No rows loaded from BigQuery")
+
+    errors, warnings = [], []
+    for rule in rules:
+        message = rule.check(profile)
+        if message:
+            (errors if rule.severity == "error" else warnings).append(message)
+    if errors:
+        raise DataQualityError("; ".join(errors))
+    return warnings
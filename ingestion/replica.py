@@ -0,0 +1,306 @@
+"""
+Local read replica of the daily stats, serving and sample tables.
+
+Readers (the dashboard in replica mode, analysts) query a local DuckDB file
+instead of MotherDuck. The replica is a directory of immutable snapshot
+files and a `CURRENT` file naming the live one:
+
+    replica/
+        CURRENT                    -> duckdb_stats-000042.duckdb
+        duckdb_stats-000041.duckdb
+        duckdb_stats-000042.duckdb
+
+A sync copies the current snapshot, pulls into the copy only the date
+partitions whose row count or content hash changed in MotherDuck, and then
+switches `CURRENT` with an atomic rename: readers open either the previous or
+the new snapshot, never a half-synced one. Every snapshot holds the tables
+under their MotherDuck names, so it can be attached as the source database:
+
+    ATTACH 'replica/duckdb_stats-000042.duckdb' AS duckdb_stats (READ_ONLY)
+
+    python -m ingestion.replica sync --path replica
+
+The serving tables are built by dbt, so a sync runs after the transform
+(`make pypi-transform pypi-replica-sync`), never after the ingestion alone.
+"""
+
+import os
+import re
+import shutil
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import duckdb
+import fire
+from loguru import logger
+
+from ingestion.session import LoaderSession
+
+CURRENT_FILE = "CURRENT"
+
+# Replicated tables and the date column they are synced by, None for the
+# small tables copied whole on every sync
+REPLICA_TABLES: Dict[str, Optional[str]] = {
+    "pypi_daily_stats": "download_date",
+    "pypi_daily_downloads": "download_date",
+    "pypi_weekly_downloads": "week_start_date",
+    "pypi_monthly_downloads": "month_start_date",
+    "pypi_dimension_daily_downloads": "download_date",
+    "pypi_dimension_monthly_downloads": "month_start_date",
+    "pypi_file_downloads_sample": "download_date",
+    "pypi_period_breakdowns": None,
+    "pypi_kpis": None,
+}
+
+
+class ReadReplica:
+    """
+    Versioned snapshots of a source database in the local directory `path`.
+    One sync at a time per directory; readers need no coordination.
+    """
+
+    def __init__(self, path: str, name: str = "duckdb_stats", keep: int = 3):
+        self.path = path
+        self.name = name
+        # Snapshots kept after a sync, for readers still on an older one
+        self.keep = keep
+        os.makedirs(path, exist_ok=True)
+
+    def current(self) -> Optional[str]:
+        """Path of the live snapshot, None before the first sync."""
+        try:
+            with open(os.path.join(self.path, CURRENT_FILE)) as f:
+                return os.path.join(self.path, f.read().strip())
+        except FileNotFoundError:
+            return None
+
+    def version(self) -> int:
+        current = self.current()
+        if current is None:
+            return 0
+        return int(re.search(r"-(\d+)\.duckdb$", current).group(1))
+
+    def connect(self) -> duckdb.DuckDBPyConnection:
+        """Read-only connection with the live snapshot attached under the
+        source database name."""
+        current = self.current()
+        if current is None:
+            raise ValueError(f"No snapshot in {self.path}, run a sync first")
+        conn = duckdb.connect(database=":memory:")
+        conn.execute(f"ATTACH '{current}' AS {self.name} (READ_ONLY)")
+        conn.execute(f"USE {self.name}")
+        return conn
+
+    def sync(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        source_database: str,
+        tables: Optional[Dict[str, Optional[str]]] = None,
+        since: Optional[str] = None,
+    ) -> Dict[str, int]:
+        """
+        Publish a new snapshot of `tables` (REPLICA_TABLES by default) of
+        `source_database`, attached to `conn`. Partitioned tables pull the
+        changed partitions only, from `since` on when given (older partitions
+        are then assumed unchanged). Source tables that do not exist are
+        skipped.
+
+        Returns:
+            Rows pulled per table
+        """
+        tables = REPLICA_TABLES if tables is None else tables
+        version = self.version() + 1
+        snapshot = f"{self.name}-{version:06d}.duckdb"
+        staging = os.path.join(self.path, f".{snapshot}.{os.getpid()}")
+        current = self.current()
+        if current:
+            shutil.copyfile(current, staging)
+
+        existing = {
+            row[0]
+            for row in conn.execute(
+                """
+                SELECT table_name FROM duckdb_tables()
+                WHERE database_name = ? AND schema_name = 'main'
+                """,
+                [source_database],
+            ).fetchall()
+        }
+        pulled = {}
+        conn.execute(f"ATTACH '{staging}' AS replica_staging")
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS replica_staging.main._replica_partitions (
+                    table_name VARCHAR,
+                    partition_date DATE,
+                    rows BIGINT,
+                    content_hash VARCHAR,
+                    PRIMARY KEY (table_name, partition_date)
+                )
+            """)
+            for table, date_column in tables.items():
+                if table not in existing:
+                    logger.warning(f"{source_database}.main.{table} not found, skipped")
+                    continue
+                source = f"{source_database}.main.{table}"
+                if date_column is None:
+                    pulled[table] = _copy_whole(conn, source, table)
+                else:
+                    pulled[table] = _sync_partitions(
+                        conn, source, table, date_column, since
+                    )
+            conn.execute(
+                """
+                CREATE OR REPLACE TABLE replica_staging.main._replica_snapshot AS
+                SELECT ? AS version, ? AS source_database, ? AS synced_at
+                """,
+                [version, source_database, datetime.now(timezone.utc)],
+            )
+            conn.execute("CHECKPOINT replica_staging")
+        except Exception:
+            conn.execute("DETACH replica_staging")
+            os.remove(staging)
+            raise
+        conn.execute("DETACH replica_staging")
+
+        os.replace(staging, os.path.join(self.path, snapshot))
+        pointer = os.path.join(self.path, f".{CURRENT_FILE}.{os.getpid()}")
+        with open(pointer, "w") as f:
+            f.write(snapshot)
+        os.replace(pointer, os.path.join(self.path, CURRENT_FILE))
+        logger.info(
+            f"Published replica snapshot {snapshot}: "
+            + ", ".join(f"{rows:,} rows of {table}" for table, rows in pulled.items())
+        )
+        self._prune(version)
+        return pulled
+
+    def _prune(self, version: int):
+        for file in os.listdir(self.path):
+            match = re.fullmatch(rf"{self.name}-(\d+)\.duckdb", file)
+            if match and int(match.group(1)) <= version - self.keep:
+                os.remove(os.path.join(self.path, file))
+
+
+def _copy_whole(conn: duckdb.DuckDBPyConnection, source: str, table: str) -> int:
+    result = conn.execute(f"""
+        CREATE OR REPLACE TABLE replica_staging.main.{table} AS
+        SELECT * FROM {source}
+    """).fetchone()
+    return result[0] if result else 0
+
+
+def _columns(conn: duckdb.DuckDBPyConnection, relation: str) -> List[tuple]:
+    return conn.execute(f"DESCRIBE {relation}").fetchall()
+
+
+def _sync_partitions(
+    conn: duckdb.DuckDBPyConnection,
+    source: str,
+    table: str,
+    date_column: str,
+    since: Optional[str] = None,
+) -> int:
+    """
+    Replace the partitions of the staging copy of `table` whose row count or
+    order-independent content hash differ from `source`, and drop those gone
+    from it. The fingerprints are computed where the source lives, only the
+    per-partition aggregates and the changed rows cross the network.
+    """
+    target = f"replica_staging.main.{table}"
+    fingerprints = "replica_staging.main._replica_partitions"
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {target} AS FROM {source} LIMIT 0")
+    if _columns(conn, target) != _columns(conn, source):
+        logger.info(f"Schema of {source} changed, pulling it whole")
+        conn.execute(f"DELETE FROM {fingerprints} WHERE table_name = ?", [table])
+        conn.execute(f"CREATE OR REPLACE TABLE {target} AS FROM {source} LIMIT 0")
+        since = None
+
+    since_filter = f"WHERE {date_column} >= '{since}'" if since else ""
+    remote = {
+        day: (rows, content_hash)
+        for day, rows, content_hash in conn.execute(f"""
+            SELECT {date_column}::DATE, COUNT(*), SUM(hash(t))::VARCHAR
+            FROM {source} AS t
+            {since_filter}
+            GROUP BY ALL
+        """).fetchall()
+    }
+    local = {
+        day: (rows, content_hash)
+        for day, rows, content_hash in conn.execute(
+            f"""
+            SELECT partition_date, rows, content_hash FROM {fingerprints}
+            WHERE table_name = ?
+            {f"AND partition_date >= '{since}'" if since else ""}
+            """,
+            [table],
+        ).fetchall()
+    }
+    changed = sorted(day for day, value in remote.items() if local.get(day) != value)
+    removed = sorted(day for day in local if day not in remote)
+    if not changed and not removed:
+        logger.info(f"{table} is up to date")
+        return 0
+
+    def in_list(days):
+        return ", ".join(f"'{day}'" for day in days)
+
+    rows = 0
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        conn.execute(f"""
+            DELETE FROM {target}
+            WHERE {date_column} IN ({in_list(changed + removed)})
+        """)
+        conn.execute(
+            f"""
+            DELETE FROM {fingerprints}
+            WHERE table_name = ? AND partition_date IN ({in_list(changed + removed)})
+            """,
+            [table],
+        )
+        if changed:
+            rows = conn.execute(f"""
+                INSERT INTO {target}
+                SELECT * FROM {source}
+                WHERE {date_column} IN ({in_list(changed)})
+                ORDER BY {date_column}
+            """).fetchone()[0]
+            conn.executemany(
+                f"INSERT INTO {fingerprints} VALUES (?, ?, ?, ?)",
+                [[table, day, *remote[day]] for day in changed],
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    logger.info(
+        f"{table}: pulled {len(changed)} changed partitions ({rows:,} rows), "
+        f"dropped {len(removed)}"
+    )
+    return rows
+
+
+def sync(
+    path: str = "replica",
+    database_name: str = "duckdb_stats",
+    since: Optional[str] = None,
+    keep: int = 3,
+    local_path: Optional[str] = None,
+):
+    """CLI: publish a new snapshot of the MotherDuck database, or of the local
+    DuckDB file `local_path`, to the replica directory `path`."""
+    with LoaderSession(
+        attach_motherduck=local_path is None, bigquery_extension=False
+    ) as session:
+        if local_path:
+            session.conn.execute(f"ATTACH '{local_path}' AS {database_name}")
+        ReadReplica(path, name=database_name, keep=keep).sync(
+            session.conn, database_name, since=since
+        )
+
+
+if __name__ == "__main__":
+    fire.Fire({"sync": sync})
@@ -0,0 +1,68 @@
+DAILY_ROLLUP_TABLE = "pypi_daily_stats"
+
+# Source expressions of the rollup dimensions for each ingestion profile, the
+# raw profile reads the nested structs, the lean and compact ones their
+# flattened columns (before encoding).
+_DIMENSIONS = {
+    "raw": {
+        "system_name": "details.system.name",
+        "system_release": "details.system.release",
+        "version": "file.version",
+        "cpu": "details.cpu",
+        "python": "details.python",
+    },
+    "lean": {
+        "system_name": "system_name",
+        "system_release": "system_release",
+        "version": "version",
+        "cpu": "cpu",
+        "python": "python",
+    },
+}
+_DIMENSIONS["compact"] = _DIMENSIONS["lean"]
+
+
+def build_daily_rollup_sql(source: str, profile: str = "raw") -> str:
+    """
+    SELECT statement aggregating download rows of `source` into the daily
+    rollup, with the same columns and `load_id` as the dbt `pypi_daily_stats`
+    model so that rows written here merge with the dbt incremental runs.
+    """
+    if profile not in _DIMENSIONS:
+        raise ValueError(f"Unknown ingestion profile '{profile}'")
+    dims = _DIMENSIONS[profile]
+    return f"""
+        WITH pre_aggregated_data AS (
+            SELECT
+                timestamp :: date AS download_date,
+                {dims["system_name"]} AS system_name,
+                {dims["system_release"]} AS system_release,
+                {dims["version"]} AS version,
+                project,
+                country_code,
+                {dims["cpu"]} AS cpu,
+                CASE
+                    WHEN {dims["python"]} IS NULL THEN NULL
+                    ELSE CONCAT(
+                        SPLIT_PART({dims["python"]}, '.', 1),
+                        '.',
+                        SPLIT_PART({dims["python"]}, '.', 2)
+                    )
+                END AS python_version
+            FROM {source}
+        )
+        SELECT
+            MD5(CONCAT_WS('|', download_date, system_name, system_release, version,
+                project, country_code, cpu, python_version)) AS load_id,
+            download_date,
+            system_name,
+            system_release,
+            version,
+            project,
+            country_code,
+            cpu,
+            python_version,
+            COUNT(*) AS daily_download_sum
+        FROM pre_aggregated_data
+        GROUP BY ALL
+    """
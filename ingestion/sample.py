@@ -0,0 +1,172 @@
+"""
+Stratified sample of the raw download rows.
+
+Questions on attributes that only the raw table keeps (installer, distro,
+openssl version, ... in `details`) would scan billions of rows. The loader can
+also write a sample of every load to `pypi_file_downloads_sample`: a fixed
+fraction of each (project, day, country) stratum, at least two rows of it,
+picked by row hash so that reloading a day keeps the same sample. Every row
+carries its stratum size, the stratum sample size and its weight (their
+ratio), so scaled aggregates are unbiased and their sampling error is known:
+
+    python -m ingestion.sample estimate \\
+        --group_by "details.installer.name" --where "project = 'duckdb'"
+
+`estimate` returns the Horvitz-Thompson total of a value per group, its
+standard error under stratified sampling without replacement and a normal
+confidence interval. Counts are the total of 1.
+"""
+
+from statistics import NormalDist
+from typing import List, Optional
+
+import duckdb
+import fire
+from loguru import logger
+
+from ingestion.models import SampleEstimate
+from ingestion.session import LoaderSession
+
+SAMPLE_TABLE = "pypi_file_downloads_sample"
+STRATUM_COLUMNS = ["project", "download_date", "country_code"]
+# Sample bookkeeping columns appended to the source columns
+SAMPLE_COLUMNS = ["download_date", "stratum_rows", "sample_rows", "sample_weight"]
+
+
+def build_sample_sql(
+    source: str, fraction: float, timestamp_column: str = "timestamp"
+) -> str:
+    """
+    SELECT statement sampling `fraction` of each (project, day, country) stratum
+    of `source`, with the stratum and sample sizes and the weight of each row.
+    Strata of one or two rows are kept whole.
+    """
+    if not 0 < fraction <= 1:
+        raise ValueError(f"Sample fraction must be in (0, 1], got {fraction}")
+    return f"""
+        SELECT * EXCLUDE (sample_rank)
+        FROM (
+            SELECT
+                *,
+                COUNT(*) OVER stratum AS stratum_rows,
+                LEAST(
+                    COUNT(*) OVER stratum,
+                    GREATEST(2, CEIL({fraction} * COUNT(*) OVER stratum))
+                )::BIGINT AS sample_rows,
+                stratum_rows / sample_rows AS sample_weight,
+                row_number() OVER (stratum ORDER BY hash(t)) AS sample_rank
+            FROM (
+                SELECT *, {timestamp_column}::DATE AS download_date FROM {source}
+            ) AS t
+            WINDOW stratum AS (PARTITION BY project, download_date, country_code)
+        )
+        WHERE sample_rank <= sample_rows
+    """
+
+
+def estimate(
+    conn: duckdb.DuckDBPyConnection,
+    table_ref: str,
+    group_by: Optional[List[str]] = None,
+    value: str = "1",
+    where: Optional[str] = None,
+    confidence: float = 0.95,
+) -> List[SampleEstimate]:
+    """
+    Estimated total of `value` (1 to count downloads) over the rows of the
+    sample `table_ref` matching `where`, per distinct `group_by` expressions,
+    largest first.
+
+    Each group is a domain of the population: its total is the sum over the
+    strata of weight times the sample total, and its variance the sum of
+    N^2 (1 - n/N) s^2 / n over the strata, with s^2 the sample variance of the
+    value in the stratum (0 outside the domain). Strata kept whole add none.
+    """
+    group_by = group_by or []
+    groups = [f'{expr} AS "{expr}"' for expr in group_by]
+    group_names = [f'"{expr}"' for expr in group_by]
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    rows = conn.execute(f"""
+        WITH cells AS (
+            SELECT
+                {"".join(f"{group}, " for group in groups)}
+                {", ".join(STRATUM_COLUMNS)},
+                ANY_VALUE(stratum_rows)::DOUBLE AS big_n,
+                ANY_VALUE(sample_rows)::DOUBLE AS n,
+                COUNT(*) AS matched_rows,
+                SUM(({value})::DOUBLE) AS total,
+                SUM(({value})::DOUBLE * ({value})::DOUBLE) AS total_squares
+            FROM {table_ref}
+            {f"WHERE {where}" if where else ""}
+            GROUP BY ALL
+        )
+        SELECT
+            {"".join(f"{name}, " for name in group_names)}
+            SUM(big_n / n * total) AS estimate,
+            SQRT(SUM(
+                CASE WHEN n > 1 THEN
+                    big_n * big_n * (1 - n / big_n) / n
+                    * GREATEST(total_squares - total * total / n, 0) / (n - 1)
+                ELSE 0 END
+            )) AS std_error,
+            SUM(matched_rows) AS sample_rows
+        FROM cells
+        {f"GROUP BY {', '.join(group_names)}" if group_names else ""}
+        ORDER BY estimate DESC
+    """).fetchall()
+
+    estimates = []
+    for row in rows:
+        groups, (total, std_error, sample_rows) = row[: len(group_by)], row[-3:]
+        estimates.append(
+            SampleEstimate(
+                group=dict(zip(group_by, groups, strict=True)),
+                estimate=total or 0.0,
+                std_error=std_error or 0.0,
+                lower=(total or 0.0) - z * (std_error or 0.0),
+                upper=(total or 0.0) + z * (std_error or 0.0),
+                sample_rows=sample_rows,
+            )
+        )
+    return estimates
+
+
+def estimate_cli(
+    group_by: Optional[str] = None,
+    value: str = "1",
+    where: Optional[str] = None,
+    confidence: float = 0.95,
+    database_name: str = "duckdb_stats",
+    table_name: str = SAMPLE_TABLE,
+    local_path: Optional[str] = None,
+    limit: int = 20,
+):
+    """CLI: print the estimates of the MotherDuck sample table, or of the local
+    DuckDB file `local_path`. `group_by` is comma separated."""
+    with LoaderSession(
+        attach_motherduck=local_path is None, bigquery_extension=False
+    ) as session:
+        if local_path:
+            session.conn.execute(f"ATTACH '{local_path}' AS {database_name}")
+        estimates = estimate(
+            session.conn,
+            f"{database_name}.main.{table_name}",
+            [expr.strip() for expr in group_by.split(",")] if group_by else None,
+            value,
+            where,
+            confidence,
+        )
+    for result in estimates[:limit]:
+        label = ", ".join(str(group) for group in result.group.values()) or "total"
+        margin = (result.upper - result.lower) / 2
+        relative = f" ({margin / result.estimate:.1%})" if result.estimate else ""
+        logger.info(
+            f"{label}: {result.estimate:,.0f} ± {margin:,.0f}{relative} "
+            f"from {result.sample_rows:,} sampled rows"
+        )
+    if len(estimates) > limit:
+        logger.info(f"... {len(estimates) - limit} more groups")
+
+
+if __name__ == "__main__":
+    fire.Fire({"estimate": estimate_cli})
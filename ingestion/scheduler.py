@@ -0,0 +1,387 @@
+import signal
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import date, datetime, timedelta, timezone
+
+import duckdb
+import fire
+from loguru import logger
+
+from ingestion.bigquery import split_date_range
+from ingestion.models import PypiJobParameters, QueueTask, SchedulerParameters
+from ingestion.pipeline import main
+from ingestion.session import LoaderSession
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class TaskQueue:
+    """
+    Persistent queue of (project, day) ingestion tasks, backed by a local DuckDB
+    file so that a restarted scheduler picks up where it stopped.
+
+    A task is pending, running, done or failed (out of attempts). Pending tasks
+    are claimed most recent day first once their `next_attempt_at` has passed.
+
+    The file is opened for each operation only, so that other processes (e.g.
+    `enqueue` of a backfill) can write to the queue of a running scheduler.
+    """
+
+    def __init__(self, path: str, lock_retries: int = 20):
+        self.path = path
+        self.lock_retries = lock_retries
+        self._execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                project VARCHAR,
+                day DATE,
+                status VARCHAR DEFAULT 'pending',
+                attempts INTEGER DEFAULT 0,
+                next_attempt_at TIMESTAMP DEFAULT '-infinity',
+                last_error VARCHAR,
+                enqueued_at TIMESTAMP,
+                completed_at TIMESTAMP,
+                PRIMARY KEY (project, day)
+            )
+        """)
+
+    def enqueue(
+        self,
+        projects: list[str],
+        start_date: str,
+        end_date: str,
+        force: bool = False,
+    ) -> int:
+        """Add a task per project and day of [start_date, end_date). Existing
+        tasks are kept as they are, or reset to pending with `force`."""
+        days = [start for start, _ in split_date_range(start_date, end_date)]
+        if not days or not projects:
+            return 0
+        conflict = (
+            "DO UPDATE SET status = 'pending', attempts = 0, "
+            "next_attempt_at = '-infinity', last_error = NULL"
+            if force
+            else "DO NOTHING"
+        )
+        values = ", ".join(
+            f"('{project}', DATE '{day}')" for project in projects for day in days
+        )
+        added = self._execute(
+            f"""
+            INSERT INTO tasks (project, day, enqueued_at)
+            SELECT project, day, ? FROM (VALUES {values}) AS t(project, day)
+            ON CONFLICT (project, day) {conflict}
+            """,
+            [utcnow()],
+        )[0][0]
+        if added:
+            logger.info(
+                f"Enqueued {added} new tasks for {', '.join(projects)} "
+                f"from {start_date} to {end_date}"
+            )
+        return added
+
+    def requeue_unsettled(self, since: date, settle_hours: int) -> int:
+        """Reset to pending the done days since `since` whose last load ran
+        before the day had `settle_hours` to collect late-arriving downloads,
+        once that time has passed."""
+        now = utcnow()
+        requeued = self._execute(
+            f"""
+            UPDATE tasks
+            SET status = 'pending', attempts = 0, next_attempt_at = '-infinity'
+            WHERE status = 'done'
+            AND day >= ?
+            AND completed_at < day + INTERVAL 1 DAY + INTERVAL {settle_hours} HOUR
+            AND day + INTERVAL 1 DAY + INTERVAL {settle_hours} HOUR <= ?
+            """,
+            [since, now],
+        )[0][0]
+        if requeued:
+            logger.info(f"Requeued {requeued} days to pick up late arrivals")
+        return requeued
+
+    def recover(self) -> int:
+        """Return the tasks left running by a stopped scheduler to the queue."""
+        recovered = self._execute(
+            "UPDATE tasks SET status = 'pending' WHERE status = 'running'"
+        )[0][0]
+        if recovered:
+            logger.info(f"Recovered {recovered} interrupted tasks")
+        return recovered
+
+    def claim(
+        self, limit: int, fresh_since: date, backfill_limit: int
+    ) -> list[QueueTask]:
+        """Mark as running and return up to `limit` ready tasks, most recent
+        day first, with at most `backfill_limit` of them before `fresh_since`."""
+        if limit <= 0:
+            return []
+        # One statement, so one transaction: a task selected here cannot be
+        # claimed by another process between the SELECT and the UPDATE
+        rows = self._execute(
+            """
+            WITH ready AS (
+                SELECT
+                    project,
+                    day,
+                    day >= ? AS fresh,
+                    row_number() OVER (
+                        PARTITION BY day >= ? ORDER BY day DESC, project
+                    ) AS rank
+                FROM tasks
+                WHERE status = 'pending' AND next_attempt_at <= ?
+            ),
+            claimed AS (
+                SELECT project, day FROM ready
+                WHERE fresh OR rank <= ?
+                ORDER BY day DESC, project
+                LIMIT ?
+            )
+            UPDATE tasks SET status = 'running'
+            FROM claimed
+            WHERE tasks.project = claimed.project AND tasks.day = claimed.day
+            RETURNING tasks.project, tasks.day, tasks.attempts
+            """,
+            [fresh_since, fresh_since, utcnow(), backfill_limit, limit],
+        )
+        return [
+            QueueTask(project=project, day=day, attempts=attempts)
+            for project, day, attempts in sorted(
+                rows, key=lambda row: (-row[1].toordinal(), row[0])
+            )
+        ]
+
+    def complete(self, task: QueueTask):
+        self._update(
+            task,
+            "status = 'done', last_error = NULL, completed_at = ?",
+            [utcnow()],
+        )
+
+    def fail(
+        self,
+        task: QueueTask,
+        error: str,
+        max_attempts: int,
+        backoff_seconds: int,
+        max_backoff_seconds: int,
+    ):
+        """Schedule a retry with exponential backoff, or give up on the task
+        after `max_attempts`."""
+        attempts = task.attempts + 1
+        if attempts >= max_attempts:
+            logger.error(
+                f"Task {task.project} {task.day} failed {attempts} times, giving up"
+            )
+            self._update(
+                task,
+                "status = 'failed', attempts = ?, last_error = ?",
+                [attempts, error],
+            )
+            return
+
+        delay = min(backoff_seconds * 2 ** (attempts - 1), max_backoff_seconds)
+        logger.warning(
+            f"Task {task.project} {task.day} failed (attempt {attempts}), "
+            f"retrying in {delay}s: {error}"
+        )
+        self._update(
+            task,
+            "status = 'pending', attempts = ?, last_error = ?, next_attempt_at = ?",
+            [attempts, error, utcnow() + timedelta(seconds=delay)],
+        )
+
+    def counts(self) -> dict[str, int]:
+        return dict(
+            self._execute(
+                "SELECT status, COUNT(*) FROM tasks GROUP BY status ORDER BY status"
+            )
+        )
+
+    def _update(self, task: QueueTask, assignments: str, values: list | None = None):
+        self._execute(
+            f"UPDATE tasks SET {assignments} WHERE project = ? AND day = ?",
+            [*(values or []), task.project, task.day],
+        )
+
+    def _execute(self, query: str, parameters: list | None = None) -> list[tuple]:
+        """Run a statement in its own connection, waiting for another process
+        holding the file lock to release it. A statement aborted by a
+        concurrent one updating the same tasks is run again on the new state."""
+        for attempt in range(self.lock_retries + 1):
+            try:
+                conn = duckdb.connect(database=self.path)
+            except duckdb.IOException as e:
+                if "lock" not in str(e) or attempt == self.lock_retries:
+                    raise
+                time.sleep(0.5)
+                continue
+            try:
+                return conn.execute(query, parameters).fetchall()
+            except duckdb.TransactionException as e:
+                if "Conflict" not in str(e) or attempt == self.lock_retries:
+                    raise
+            finally:
+                conn.close()
+
+
+class Scheduler:
+    """
+    Runs the queued (project, day) tasks through the pipeline, `workers` at a
+    time, on one shared loader session. Days within `fresh_days` of today are
+    enqueued on every tick and always claimed first; older (backfill) days
+    only ever use `backfill_workers` of the slots, so a long backfill never
+    delays the fresh days.
+    """
+
+    def __init__(
+        self,
+        params: PypiJobParameters,
+        scheduler_params: SchedulerParameters,
+        queue: TaskQueue,
+        session: LoaderSession | None = None,
+    ):
+        self.params = params
+        self.scheduler_params = scheduler_params
+        self.queue = queue
+        self.session = session
+        self._stop = threading.Event()
+
+    def stop(self, *args):
+        logger.info("Stopping the scheduler after the running tasks")
+        self._stop.set()
+
+    def run(self):
+        sp = self.scheduler_params
+        self.queue.recover()
+        running: dict[Future, QueueTask] = {}
+
+        with ThreadPoolExecutor(max_workers=sp.workers) as executor:
+            while not self._stop.is_set():
+                fresh_since = self._enqueue_fresh_days()
+                backfill_running = sum(
+                    task.day < fresh_since for task in running.values()
+                )
+                for task in self.queue.claim(
+                    sp.workers - len(running),
+                    fresh_since,
+                    sp.backfill_workers - backfill_running,
+                ):
+                    logger.info(f"Starting task {task.project} {task.day}")
+                    running[executor.submit(self._execute, task)] = task
+
+                if not running:
+                    if sp.once:
+                        break
+                    self._stop.wait(sp.poll_seconds)
+                    continue
+
+                done, _ = wait(
+                    running, timeout=sp.poll_seconds, return_when=FIRST_COMPLETED
+                )
+                for future in done:
+                    self._settle(future, running.pop(future))
+
+            for future in wait(running).done:
+                self._settle(future, running.pop(future))
+
+        logger.info(f"Queue status: {self.queue.counts()}")
+
+    def _enqueue_fresh_days(self) -> date:
+        """Enqueue the last `fresh_days` complete days and return the first one."""
+        sp = self.scheduler_params
+        today = utcnow().date()
+        fresh_since = today - timedelta(days=sp.fresh_days)
+        if sp.fresh_days > 0:
+            self.queue.enqueue(
+                self.params.projects, fresh_since.isoformat(), today.isoformat()
+            )
+            self.queue.requeue_unsettled(fresh_since, sp.settle_hours)
+        return fresh_since
+
+    def _execute(self, task: QueueTask):
+        task_params = self.params.model_copy(
+            update={
+                "pypi_project": task.project,
+                "start_date": task.day.isoformat(),
+                "end_date": (task.day + timedelta(days=1)).isoformat(),
+                "window_days": None,
+                "resume": False,
+                "incremental": False,
+            }
+        )
+        main(task_params, session=self.session)
+
+    def _settle(self, future: Future, task: QueueTask):
+        sp = self.scheduler_params
+        try:
+            future.result()
+        except Exception as e:
+            self.queue.fail(
+                task,
+                str(e),
+                sp.max_attempts,
+                sp.backoff_seconds,
+                sp.max_backoff_seconds,
+            )
+        else:
+            self.queue.complete(task)
+            logger.info(f"Completed task {task.project} {task.day}")
+
+
+def _split_params(kwargs: dict) -> tuple[PypiJobParameters, SchedulerParameters]:
+    scheduler_fields = set(SchedulerParameters.model_fields)
+    return (
+        PypiJobParameters(
+            **{k: v for k, v in kwargs.items() if k not in scheduler_fields}
+        ),
+        SchedulerParameters(
+            **{k: v for k, v in kwargs.items() if k in scheduler_fields}
+        ),
+    )
+
+
+def run(**kwargs):
+    """Run the scheduler. Takes the PypiJobParameters of the tasks (gcp_project,
+    pypi_project, destination, ...) and the SchedulerParameters."""
+    params, scheduler_params = _split_params(kwargs)
+    queue = TaskQueue(scheduler_params.queue_path)
+    session = LoaderSession(
+        attach_motherduck="md" in params.destinations, offline=params.offline
+    )
+    scheduler = Scheduler(params, scheduler_params, queue, session)
+    signal.signal(signal.SIGTERM, scheduler.stop)
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        scheduler.stop()
+    finally:
+        session.close()
+
+
+def enqueue(
+    start_date: str,
+    end_date: str,
+    pypi_project: str | list[str] = "duckdb",
+    queue_path: str = SchedulerParameters().queue_path,
+    force: bool = False,
+):
+    """Enqueue a backfill of [start_date, end_date) for one or several
+    comma separated projects, picked up by a running scheduler."""
+    if isinstance(pypi_project, (list, tuple)):
+        projects = list(pypi_project)
+    else:
+        projects = [p.strip() for p in pypi_project.split(",") if p.strip()]
+    TaskQueue(queue_path).enqueue(projects, start_date, end_date, force=force)
+
+
+def status(queue_path: str = SchedulerParameters().queue_path):
+    """Log the number of tasks per status."""
+    logger.info(f"Queue status: {TaskQueue(queue_path).counts()}")
+
+
+if __name__ == "__main__":
+    fire.Fire({"run": run, "enqueue": enqueue, "status": status})
@@ -0,0 +1,105 @@
+import itertools
+import os
+import threading
+
+import duckdb
+from loguru import logger
+
+from ingestion.instrumentation import RunRecorder
+
+
+class LoaderSession:
+    """
+    A DuckDB database with the bigquery extension loaded and MotherDuck
+    attached once, shared by the loaders of a driver script so that the
+    extension load and the MotherDuck handshake are paid once per process
+    rather than once per job:
+
+        with LoaderSession() as session:
+            for project in ["duckdb", "polars"]:
+                main(PypiJobParameters(pypi_project=project, ...), session=session)
+
+    Each loader gets its own cursor and temp table, so loads can run
+    concurrently. With `offline`, the extension is loaded from the local
+    extension cache and never installed (no network access).
+    """
+
+    def __init__(
+        self,
+        attach_motherduck: bool = True,
+        bigquery_extension: bool = True,
+        offline: bool = False,
+        recorder: RunRecorder | None = None,
+    ):
+        self.attach_motherduck = attach_motherduck
+        self.recorder = recorder or RunRecorder()
+        # Serializes CREATE ... IF NOT EXISTS of the loaders sharing the session
+        self.ddl_lock = threading.Lock()
+        self._databases: set[str] = set()
+        self._temp_tables = itertools.count()
+
+        self.conn = duckdb.connect(database=":memory:")
+        # BigQuery timestamps and the loaded [start_date, end_date) ranges are
+        # UTC. String bounds and ::DATE casts of TIMESTAMPTZ follow TimeZone,
+        # which defaults to the machine's: set it for every cursor.
+        self.conn.execute("SET GLOBAL TimeZone = 'UTC'")
+
+        if bigquery_extension:
+            with self.recorder.stage("extensions"):
+                self._load_bigquery_extension(offline)
+            self.conn.execute("SET bq_experimental_filter_pushdown = true")
+
+        self.conn.execute("SET preserve_insertion_order = FALSE")
+
+        if not attach_motherduck:
+            return
+
+        if not os.environ.get("motherduck_token"):
+            raise ValueError(
+                "MotherDuck token is required. Set the environment variable 'MOTHERDUCK_TOKEN'."
+            )
+
+        with self.recorder.stage("attach_motherduck"):
+            self.conn.execute("ATTACH 'md:'")
+
+    def _load_bigquery_extension(self, offline: bool):
+        if offline:
+            installed = self.conn.execute("""
+                SELECT installed FROM duckdb_extensions()
+                WHERE extension_name = 'bigquery'
+            """).fetchone()
+            if not (installed and installed[0]):
+                raise ValueError(
+                    "The bigquery extension is not in the local extension cache, "
+                    "run once without offline mode to install it"
+                )
+            logger.info("Loading the cached bigquery extension (offline)")
+        else:
+            self.conn.execute("INSTALL bigquery FROM community;")
+        self.conn.execute("LOAD bigquery;")
+
+    def create_database(self, database: str):
+        """Create a MotherDuck database once per session."""
+        with self.ddl_lock:
+            if database in self._databases:
+                return
+            self.conn.execute(f"CREATE DATABASE IF NOT EXISTS {database}")
+            self._databases.add(database)
+
+    def cursor(self) -> duckdb.DuckDBPyConnection:
+        """A new connection to the session database: extensions and attached
+        databases are shared, USE and profiling settings are not."""
+        return self.conn.cursor()
+
+    def temp_table(self) -> str:
+        """A temp table name not used by any other loader of the session."""
+        return f"memory.temp_table_{next(self._temp_tables)}"
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self) -> "LoaderSession":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,292 @@
+import os
+import threading
+from abc import ABC, abstractmethod
+
+import duckdb
+from loguru import logger
+from ingestion.layout import order_by
+from ingestion.models import PypiJobParameters
+
+
+class Sink(ABC):
+    """
+    A destination the loader writes a loaded date window to.
+
+    The loader reads from BigQuery once into a local relation and hands that
+    relation to every configured sink, so the scan is paid once regardless of
+    how many destinations are written.
+    """
+
+    name = "sink"
+
+    def setup(self, conn: duckdb.DuckDBPyConnection):
+        """Prepare the destination (attach databases, create secrets, ...).
+        Called once, before any window is written."""
+        pass
+
+    @abstractmethod
+    def write(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        source: str,
+        timestamp_column: str,
+        start_date: str,
+        end_date: str,
+    ) -> int:
+        """Replace the [start_date, end_date) range of the projects present in
+        `source` at the destination, and return the number of rows written."""
+
+
+class DuckDBTableSink(Sink):
+    """Write to a table of a database attached to the loader connection."""
+
+    name = "duckdb"
+
+    def __init__(self, database: str, table: str, layout: str = "project_date"):
+        self.database = database
+        self.table = table
+        self.layout = layout
+        self._ddl_lock = threading.Lock()
+
+    @property
+    def table_ref(self) -> str:
+        return f"{self.database}.main.{self.table}"
+
+    def write(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        source: str,
+        timestamp_column: str,
+        start_date: str,
+        end_date: str,
+    ) -> int:
+        with self._ddl_lock:
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self.table_ref} AS
+                SELECT * FROM {source} LIMIT 0
+            """)
+
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            conn.execute(f"""
+                DELETE FROM {self.table_ref}
+                WHERE {timestamp_column} >= '{start_date}'
+                AND {timestamp_column} < '{end_date}'
+                AND project IN (SELECT DISTINCT project FROM {source})
+            """)
+            result = conn.execute(f"""
+                INSERT INTO {self.table_ref}
+                SELECT * FROM {source}
+                {order_by(self.layout, timestamp_column)}
+            """).fetchone()
+            conn.execute("COMMIT")
+        except Exception as e:
+            logger.error(f"Error writing to {self.name} sink {self.table_ref}: {e}")
+            conn.execute("ROLLBACK")
+            raise
+
+        rows = result[0] if result else 0
+        logger.info(f"Wrote {rows:,} rows to {self.name} sink {self.table_ref}")
+        return rows
+
+
+class MotherDuckSink(DuckDBTableSink):
+    """Write to a MotherDuck table. Expects `md:` to be attached already, which
+    the loader does when created with `attach_motherduck=True`."""
+
+    name = "motherduck"
+
+    def setup(self, conn: duckdb.DuckDBPyConnection):
+        conn.execute(f"CREATE DATABASE IF NOT EXISTS {self.database}")
+
+
+class LocalDuckDBSink(DuckDBTableSink):
+    """Write to a table of a persistent local DuckDB file."""
+
+    name = "local"
+
+    def __init__(
+        self,
+        path: str,
+        table: str,
+        database: str = "local_sink",
+        layout: str = "project_date",
+    ):
+        super().__init__(database=database, table=table, layout=layout)
+        self.path = path
+
+    def setup(self, conn: duckdb.DuckDBPyConnection):
+        conn.execute(f"ATTACH IF NOT EXISTS '{self.path}' AS {self.database}")
+
+
+class ParquetSink(Sink):
+    """
+    Write hive-partitioned (year/month) ZSTD Parquet files, with the same layout
+    as the dbt `export_partition_data` macro: `{path}/{table}/year=Y/month=M/`.
+
+    Every year/month partition is one `data_0.parquet` file, as written by
+    `ingestion.export`. A window rewrites each partition it overlaps: the rows
+    of the partition outside the window or of other projects are kept, those
+    of the window's projects in the window are replaced by `source`. The new
+    file is swapped in with an atomic rename (a single object PUT on S3), so a
+    rerun with other window boundaries never leaves stale or duplicate rows.
+    Windows of the same partition are serialized.
+    """
+
+    name = "parquet"
+    filename = "data_0.parquet"
+
+    def __init__(
+        self,
+        path: str,
+        table: str,
+        row_group_size: int = 1000000,
+        layout: str = "project_date",
+    ):
+        self.path = path.rstrip("/")
+        self.table = table
+        self.row_group_size = row_group_size
+        self.layout = layout
+        self._locks: dict[tuple[int, int], threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    def setup(self, conn: duckdb.DuckDBPyConnection):
+        if self.path.startswith("s3://"):
+            conn.execute(
+                "CREATE SECRET IF NOT EXISTS (TYPE s3, PROVIDER credential_chain)"
+            )
+        else:
+            os.makedirs(self.path, exist_ok=True)
+
+    def write(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        source: str,
+        timestamp_column: str,
+        start_date: str,
+        end_date: str,
+    ) -> int:
+        target = f"{self.path}/{self.table}"
+        months = conn.execute(f"""
+            SELECT DISTINCT YEAR(day), MONTH(day)
+            FROM range(TIMESTAMP '{start_date}', TIMESTAMP '{end_date}',
+                INTERVAL 1 DAY) AS days(day)
+            ORDER BY ALL
+        """).fetchall()
+        try:
+            for year, month in months:
+                with self._partition_lock(year, month):
+                    self._replace_partition(
+                        conn,
+                        source,
+                        timestamp_column,
+                        start_date,
+                        end_date,
+                        year,
+                        month,
+                    )
+        except Exception as e:
+            logger.error(f"Error writing to parquet sink {target}: {e}")
+            raise
+
+        rows = conn.execute(f"SELECT COUNT(*) FROM {source}").fetchone()[0]
+        logger.info(f"Wrote {rows:,} rows to parquet sink {target}")
+        return rows
+
+    def _partition_lock(self, year: int, month: int) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault((year, month), threading.Lock())
+
+    def _replace_partition(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        source: str,
+        timestamp_column: str,
+        start_date: str,
+        end_date: str,
+        year: int,
+        month: int,
+    ):
+        directory = f"{self.path}/{self.table}/year={year}/month={month}"
+        local = "://" not in directory
+        existing = [
+            row[0]
+            for row in conn.execute(
+                f"SELECT file FROM glob('{directory}/*.parquet') ORDER BY file"
+            ).fetchall()
+        ]
+        new_rows = f"""
+            SELECT * FROM {source}
+            WHERE YEAR({timestamp_column}) = {year}
+            AND MONTH({timestamp_column}) = {month}
+        """
+        kept_rows = ""
+        if existing:
+            files = ", ".join(f"'{file}'" for file in existing)
+            kept_rows = f"""
+                SELECT * FROM read_parquet([{files}], hive_partitioning = false)
+                WHERE NOT (
+                    {timestamp_column} >= '{start_date}'
+                    AND {timestamp_column} < '{end_date}'
+                    AND project IN (SELECT DISTINCT project FROM {source})
+                )
+                UNION ALL BY NAME
+            """
+        elif conn.execute(f"SELECT COUNT(*) FROM ({new_rows})").fetchone()[0] == 0:
+            return
+
+        final = f"{directory}/{self.filename}"
+        # A local file cannot be read and overwritten by the same COPY, S3
+        # replaces the object only once the upload completes
+        output = (
+            f"{final}.{os.getpid()}.{threading.get_ident()}.tmp" if local else final
+        )
+        if local:
+            os.makedirs(directory, exist_ok=True)
+        conn.execute(f"""
+            COPY (
+                SELECT * FROM ({kept_rows} {new_rows})
+                {order_by(self.layout, timestamp_column)}
+            )
+            TO '{output}'
+            (FORMAT PARQUET, COMPRESSION 'ZSTD', ROW_GROUP_SIZE {self.row_group_size})
+        """)
+        stale = [file for file in existing if os.path.basename(file) != self.filename]
+        if local:
+            os.replace(output, final)
+            for file in stale:
+                os.remove(file)
+        elif stale:
+            logger.warning(
+                f"{len(stale)} files of an older layout left in {directory}, "
+                "delete them to avoid duplicate rows"
+            )
+
+
+def build_sinks(params: PypiJobParameters) -> list[Sink]:
+    """Map the job `destination` values (local, s3, md) to sinks."""
+    sinks = []
+    for destination in params.destinations:
+        if destination == "md":
+            sinks.append(
+                MotherDuckSink(params.database_name, params.table_name, params.layout)
+            )
+        elif destination == "local":
+            sinks.append(
+                LocalDuckDBSink(
+                    params.local_path or f"{params.database_name}.duckdb",
+                    params.table_name,
+                    layout=params.layout,
+                )
+            )
+        elif destination in ("s3", "parquet"):
+            sinks.append(
+                ParquetSink(
+                    params.parquet_path, params.table_name, layout=params.layout
+                )
+            )
+        else:
+            raise ValueError(
+                f"Unknown destination '{destination}', use local, s3 or md"
+            )
+    return sinks
@@ -0,0 +1,248 @@
+from unittest.mock import patch
+
+import duckdb
+import pytest
+from ingestion.benchmark import (
+    LocalSourceLoader,
+    bigquery_filter_to_duckdb,
+    generate_downloads,
+    run_benchmark,
+)
+from ingestion.models import PypiJobParameters
+
+
+@pytest.fixture(scope="module")
+def source_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("benchmark") / "file_downloads.parquet")
+    return generate_downloads(path, rows=20000, start_date="2023-01-01", days=3)
+
+
+def _params(tmp_path, **kwargs):
+    return PypiJobParameters(
+        start_date="2023-01-01",
+        end_date="2023-01-04",
+        gcp_project="offline-benchmark",
+        destination="md",
+        manifest_path=str(tmp_path / "manifest.duckdb"),
+        **kwargs,
+    )
+
+
+def test_generate_downloads_matches_pypi_schema(source_path):
+    conn = duckdb.connect()
+    conn.execute("SET TimeZone = 'UTC'")
+    rows, min_ts, max_ts, version, system_name, top_project = conn.execute(f"""
+        SELECT
+            COUNT(*),
+            MIN(timestamp)::VARCHAR,
+            MAX(timestamp)::VARCHAR,
+            ANY_VALUE(file.version),
+            ANY_VALUE(details.system.name),
+            MODE(project)
+        FROM read_parquet('{source_path}')
+    """).fetchone()
+    assert rows == 20000
+    assert min_ts >= "2023-01-01" and max_ts < "2023-01-04"
+    assert version and system_name
+    assert top_project == "duckdb"
+
+
+def test_bigquery_filter_to_duckdb():
+    assert bigquery_filter_to_duckdb(
+        'project IN ("duckdb", "pandas") '
+        'AND timestamp >= TIMESTAMP("2023-01-01") '
+        'AND timestamp < TIMESTAMP("2023-01-02 06:00:00")'
+    ) == (
+        "project IN ('duckdb', 'pandas') "
+        "AND timestamp >= TIMESTAMP '2023-01-01' "
+        "AND timestamp < TIMESTAMP '2023-01-02 06:00:00'"
+    )
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {},
+        {"window_days": 1, "workers": 3},
+        {"streaming": True},
+        {"ingestion_profile": "lean", "copy_mode": "chunked"},
+        {"ingestion_profile": "compact", "copy_mode": "chunked"},
+        {"ingestion_profile": "compact", "window_days": 1, "workers": 3},
+        {"adaptive": True, "window_days": 2, "workers": 2},
+    ],
+)
+def test_run_benchmark_loads_selected_project(source_path, tmp_path, kwargs):
+    destination_path = str(tmp_path / "destination.duckdb")
+    result = run_benchmark(source_path, destination_path, _params(tmp_path, **kwargs))
+
+    destination = duckdb.connect(destination_path)
+    loaded = destination.execute(
+        "SELECT COUNT(*) FROM pypi_file_downloads WHERE project = 'duckdb'"
+    ).fetchone()[0]
+    profiled = destination.execute(
+        "SELECT SUM(rows) FROM pypi_daily_profile WHERE project = 'duckdb'"
+    ).fetchone()[0]
+    assert result.rows == loaded == profiled > 0
+    assert result.rows_per_second > 0
+    assert result.report.status == "ok"
+    assert "bigquery_scan" in result.stage_seconds or "stream" in result.stage_seconds
+
+
+def test_run_benchmark_on_a_machine_outside_utc(source_path, tmp_path):
+    connect = duckdb.connect
+
+    def connect_in_los_angeles(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        conn.execute("SET GLOBAL TimeZone = 'America/Los_Angeles'")
+        return conn
+
+    destination_path = str(tmp_path / "destination.duckdb")
+    with patch("ingestion.session.duckdb.connect", connect_in_los_angeles):
+        result = run_benchmark(
+            source_path, destination_path, _params(tmp_path, window_days=1)
+        )
+
+    # The UTC days pass the timestamp range rule and keep their UTC boundaries
+    destination = duckdb.connect(destination_path)
+    profiled = destination.execute("""
+        SELECT download_date::VARCHAR, rows FROM pypi_daily_profile
+        WHERE project = 'duckdb' ORDER BY download_date
+    """).fetchall()
+    expected = destination.execute(f"""
+        SELECT (timestamp AT TIME ZONE 'UTC')::DATE::VARCHAR, COUNT(*)
+        FROM read_parquet('{source_path}')
+        WHERE project = 'duckdb' GROUP BY ALL ORDER BY 1
+    """).fetchall()
+    assert result.report.status == "ok"
+    assert profiled == expected
+
+
+def test_concurrent_windows_create_missing_destination(source_path, tmp_path):
+    destination_path = str(tmp_path / "destination.duckdb")
+    loader = LocalSourceLoader(
+        source_path, destination_path, "duckdb_stats", "pypi_file_downloads"
+    )
+    windows = [
+        (start, end, f"timestamp >= '{start}' AND timestamp < '{end}'")
+        for start, end in [
+            ("2023-01-01", "2023-01-02"),
+            ("2023-01-02", "2023-01-03"),
+            ("2023-01-03", "2023-01-04"),
+        ]
+    ]
+    # Every window starts before the destination table exists
+    stats = loader.load_partitioned(
+        table="file_downloads",
+        windows=windows,
+        columns=["timestamp", "project", "country_code"],
+        timestamp_column="timestamp",
+        workers=3,
+    )
+    loader.conn.close()
+
+    destination = duckdb.connect(destination_path)
+    loaded = destination.execute("SELECT COUNT(*) FROM pypi_file_downloads")
+    assert len(stats) == 3
+    assert loaded.fetchone()[0] == sum(s.rows for s in stats) == 20000
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"window_days": 1, "workers": 3}])
+def test_run_benchmark_writes_days_in_timestamp_order(source_path, tmp_path, kwargs):
+    destination_path = str(tmp_path / "destination.duckdb")
+    params = _params(tmp_path, layout="timestamp", **kwargs)
+    run_benchmark(source_path, destination_path, params)
+    # Replace the range again: the new rows are appended day by day
+    run_benchmark(source_path, destination_path, params)
+
+    destination = duckdb.connect(destination_path)
+    unsorted_rows, day_changes = destination.execute("""
+        SELECT
+            COUNT(*) FILTER (WHERE timestamp::DATE = previous::DATE
+                AND timestamp < previous),
+            COUNT(*) FILTER (WHERE timestamp::DATE <> previous::DATE)
+        FROM (
+            SELECT timestamp, lag(timestamp) OVER (ORDER BY rowid) AS previous
+            FROM pypi_file_downloads
+        )
+    """).fetchone()
+    assert unsorted_rows == 0
+    assert day_changes == 2
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"window_days": 1, "workers": 3}])
+def test_run_benchmark_writes_stratified_sample(source_path, tmp_path, kwargs):
+    destination_path = str(tmp_path / "destination.duckdb")
+    params = _params(tmp_path, sample_fraction=0.05, **kwargs)
+    run_benchmark(source_path, destination_path, params)
+    run_benchmark(source_path, destination_path, params)
+
+    destination = duckdb.connect(destination_path)
+    loaded, sampled, weights = destination.execute("""
+        SELECT
+            (SELECT COUNT(*) FROM pypi_file_downloads),
+            COUNT(*),
+            SUM(sample_weight)
+        FROM pypi_file_downloads_sample
+    """).fetchone()
+    assert sampled < loaded * 0.1
+    assert weights == pytest.approx(loaded)
+
+
+def test_run_benchmark_writes_in_project_date_order(source_path, tmp_path):
+    destination_path = str(tmp_path / "destination.duckdb")
+    params = _params(tmp_path, pypi_project="duckdb,boto3,pandas")
+    run_benchmark(source_path, destination_path, params)
+
+    destination = duckdb.connect(destination_path)
+    unsorted_rows, projects = destination.execute("""
+        SELECT COUNT(*) FILTER (WHERE key < previous), COUNT(DISTINCT key.project)
+        FROM (
+            SELECT key, lag(key) OVER (ORDER BY rowid) AS previous
+            FROM (
+                SELECT rowid, {
+                    'project': project,
+                    'day': timestamp::DATE,
+                    'timestamp': timestamp
+                } AS key
+                FROM pypi_file_downloads
+            )
+        )
+    """).fetchone()
+    assert unsorted_rows == 0
+    assert projects == 3
+
+
+def test_run_benchmark_compact_profile_decodes_to_lean(source_path, tmp_path):
+    lean_path = str(tmp_path / "lean.duckdb")
+    compact_path = str(tmp_path / "compact.duckdb")
+    run_benchmark(source_path, lean_path, _params(tmp_path, ingestion_profile="lean"))
+    params = _params(tmp_path, ingestion_profile="compact", copy_mode="merge")
+    run_benchmark(source_path, compact_path, params)
+    # A rerun finds every value in the dimensions and every row in the table
+    run_benchmark(source_path, compact_path, params)
+
+    conn = duckdb.connect()
+    conn.execute(f"ATTACH '{lean_path}' AS lean")
+    conn.execute(f"ATTACH '{compact_path}' AS compact")
+    columns = "timestamp, country_code, project, version, system_name, cpu, python"
+    assert (
+        conn.execute(f"""
+        SELECT COUNT(*) FROM (
+            SELECT {columns} FROM lean.main.pypi_file_downloads
+            EXCEPT ALL
+            SELECT {columns} FROM compact.main.pypi_file_downloads_decoded
+        )
+    """).fetchone()[0]
+        == 0
+    )
+    assert (
+        conn.execute(
+            "SELECT COUNT(*) FROM compact.main.pypi_file_downloads"
+        ).fetchone()[0]
+        == conn.execute(
+            "SELECT COUNT(*) FROM lean.main.pypi_file_downloads"
+        ).fetchone()[0]
+    )
+    assert conn.execute(
+        "SELECT COUNT(*), COUNT(DISTINCT value) FROM compact.main.pypi_dim_version"
+    ).fetchone() == (7, 7)
@@ -0,0 +1,138 @@
+import duckdb
+import pytest
+
+from ingestion.dimensions import (
+    create_dimensions,
+    decode_sql,
+    encode_sql,
+    latest_versions,
+    update_dimensions,
+)
+
+
+@pytest.fixture
+def conn():
+    conn = duckdb.connect(database=":memory:")
+    conn.execute("ATTACH ':memory:' AS md")
+    conn.execute("""
+        CREATE TABLE downloads (
+            timestamp TIMESTAMP,
+            project VARCHAR,
+            country_code VARCHAR,
+            version VARCHAR,
+            system_name VARCHAR,
+            system_release VARCHAR,
+            cpu VARCHAR,
+            python VARCHAR,
+            tls_protocol VARCHAR,
+            tls_cipher VARCHAR
+        )
+    """)
+    create_dimensions(conn, "md")
+    yield conn
+    conn.close()
+
+
+def _insert(conn, versions, country_code="US", python="3.11.4"):
+    for version in versions:
+        conn.execute(
+            """
+            INSERT INTO downloads VALUES (
+                TIMESTAMP '2024-01-01', 'duckdb', ?, ?, 'Linux', NULL, 'x86_64',
+                ?, 'TLSv1.3', NULL
+            )
+            """,
+            [country_code, version, python],
+        )
+
+
+def test_version_dimension_sorts_in_pep440_order(conn):
+    ordered = [
+        "0.9.2",
+        "0.10.0",
+        "1.0.dev1",
+        "1.0a1",
+        "1.0b2",
+        "1.0rc1.dev2",
+        "1.0rc1",
+        "1.0",
+        "1.0.post1.dev1",
+        "1.0.0.post1",
+        "1.1",
+        "2!0.1",
+    ]
+    _insert(conn, list(reversed(ordered)) + ["not-a-version"])
+    update_dimensions(conn, "memory.main.downloads", "md")
+
+    assert [
+        row[0]
+        for row in conn.execute(
+            "SELECT value FROM md.main.pypi_dim_version WHERE is_valid ORDER BY sort_key"
+        ).fetchall()
+    ] == ordered
+    assert conn.execute("""
+        SELECT epoch, release, major, minor, micro, pre_phase, pre_number,
+            post_number, dev_number, is_prerelease
+        FROM md.main.pypi_dim_version WHERE value = '1.0rc1.dev2'
+    """).fetchone() == (0, [1, 0], 1, 0, None, "rc", 1, None, 2, True)
+    assert conn.execute("""
+        SELECT is_valid, sort_key FROM md.main.pypi_dim_version
+        WHERE value = 'not-a-version'
+    """).fetchone() == (False, None)
+
+
+def test_update_dimensions_appends_new_values_only(conn):
+    _insert(conn, ["1.0", "1.1"])
+    assert update_dimensions(conn, "memory.main.downloads", "md") == {
+        "country_code": 1,
+        "version": 2,
+        "system_name": 1,
+        "cpu": 1,
+        "python": 1,
+        "tls_protocol": 1,
+    }
+    assert update_dimensions(conn, "memory.main.downloads", "md") == {}
+
+    _insert(conn, ["0.9"], country_code="FR", python="3.12.1")
+    assert update_dimensions(conn, "memory.main.downloads", "md") == {
+        "country_code": 1,
+        "version": 1,
+        "python": 1,
+    }
+    # Existing ids are kept, new values get the next ones
+    assert conn.execute(
+        "SELECT value, id FROM md.main.pypi_dim_version ORDER BY id"
+    ).fetchall() == [("1.0", 1), ("1.1", 2), ("0.9", 3)]
+    assert conn.execute(
+        "SELECT value, python_version FROM md.main.pypi_dim_python ORDER BY id"
+    ).fetchall() == [("3.11.4", "3.11"), ("3.12.1", "3.12")]
+
+
+def test_encode_and_decode_round_trip(conn):
+    _insert(conn, ["1.0", "1.1rc1", "0.9"])
+    update_dimensions(conn, "memory.main.downloads", "md")
+    conn.execute(f"""
+        CREATE TABLE md.main.encoded AS
+        {encode_sql("memory.main.downloads", "md")}
+    """)
+
+    assert conn.execute("""
+        SELECT column_name, data_type FROM duckdb_columns()
+        WHERE database_name = 'md' AND table_name = 'encoded'
+        AND column_name IN ('version_id', 'system_release_id')
+        ORDER BY column_name
+    """).fetchall() == [("system_release_id", "INTEGER"), ("version_id", "INTEGER")]
+    assert (
+        conn.execute(f"""
+        SELECT COUNT(*) FROM (
+            SELECT * FROM memory.main.downloads
+            EXCEPT ALL
+            SELECT * EXCLUDE (python_version) FROM ({decode_sql("md.main.encoded", "md")})
+        )
+    """).fetchone()[0]
+        == 0
+    )
+    assert latest_versions(conn, "md.main.encoded", "md", "duckdb", 2) == ["1.0", "0.9"]
+    assert latest_versions(
+        conn, "md.main.encoded", "md", "duckdb", 2, include_prereleases=True
+    ) == ["1.1rc1", "1.0"]
@@ -1,4 +1,5 @@
 import pytest
+from datetime import date, datetime
 from unittest.mock import patch, MagicMock, ANY
 from ingestion.duck import MotherDuckBigQueryLoader, DataQualityError
 
@@ -23,6 +24,25 @@ def loader(mock_duckdb):
         return loader
 
 
+def _profile_row(rows=1000, null_timestamps=0, null_projects=0, project="duckdb"):
+    """A day/project row of the quality profile query, with its row hash and
+    the metrics of the default rules: nulls_timestamp, nulls_project, out_of_domain_country_code, out_of_range,
+    duplicates."""
+    return (
+        date(2023, 1, 1),
+        project,
+        rows,
+        None,
+        None,
+        123,
+        null_timestamps,
+        null_projects,
+        0,
+        0,
+        0,
+    )
+
+
 def test_loader_initialization(loader, mock_duckdb):
     assert loader.motherduck_database == "test_db"
     assert loader.motherduck_table == "test_table"
@@ -68,10 +88,10 @@ def test_load_from_bigquery(loader, mock_duckdb):
 def test_load_from_bigquery_to_motherduck(loader, mock_duckdb):
     mock_duckdb.execute.return_value.fetchone.side_effect = [
         (1000,),  # _load_from_bigquery: row count
-        (1000, 1000, 1000, "2023-01-01", "2023-01-31"),  # _validate_data
         (True,),  # _delete_existing_data: table exists check
-        (1000,),  # _copy_to_motherduck: total rows
-    ] + [(None,)] * 20  # chunked inserts (extra for safety)
+        (1000,),  # _copy_to_motherduck: bulk INSERT row count
+    ]
+    mock_duckdb.execute.return_value.fetchall.return_value = [_profile_row()]
 
     result = loader.load_from_bigquery_to_motherduck(
         table="bigquery-public-data.pypi.file_downloads",
@@ -87,6 +107,198 @@ def test_load_from_bigquery_to_motherduck(loader, mock_duckdb):
     sql_calls = [str(call[0][0]) for call in mock_duckdb.execute.call_args_list]
     assert any("bigquery_scan" in c for c in sql_calls)
 
+    stages = {s.stage: s for s in loader.recorder.stages}
+    assert {"bigquery_scan", "validate", "delete", "copy"} <= set(stages)
+    assert stages["bigquery_scan"].rows == 1000
+    assert stages["copy"].rows == 1000
+
+
+def test_load_from_bigquery_to_motherduck_merge(loader, mock_duckdb):
+    mock_duckdb.execute.return_value.fetchone.side_effect = [
+        (1000,),  # _load_from_bigquery: row count
+        (120,),  # _merge_into_motherduck: rows inserted
+    ]
+    mock_duckdb.execute.return_value.fetchall.return_value = [_profile_row()]
+
+    result = loader.load_from_bigquery_to_motherduck(
+        table="bigquery-public-data.pypi.file_downloads",
+        filter_str='project = "duckdb"',
+        columns=["timestamp", "project"],
+        timestamp_column="timestamp",
+        start_date="2023-01-06 00:00:00",
+        end_date="2023-01-07",
+        copy_mode="merge",
+    )
+
+    assert result == 120
+    sql_calls = [str(call[0][0]) for call in mock_duckdb.execute.call_args_list]
+    assert not any("DELETE FROM" in c for c in sql_calls)
+    merge_calls = [c for c in sql_calls if "EXCEPT ALL" in c]
+    assert len(merge_calls) == 1
+    assert "INSERT INTO test_db.main.test_table" in merge_calls[0]
+    assert "timestamp >= '2023-01-06 00:00:00'" in merge_calls[0]
+
+
+def test_load_rollup_from_bigquery(loader, mock_duckdb):
+    mock_duckdb.execute.return_value.fetchone.return_value = (42,)
+
+    result = loader.load_rollup_from_bigquery(
+        table="bigquery-public-data.pypi.file_downloads",
+        filter_str='project = "duckdb"',
+        columns=["timestamp", "project"],
+        start_date="2023-01-01",
+        end_date="2023-01-08",
+        rollup_table="pypi_daily_stats",
+        projects=["duckdb"],
+    )
+
+    assert result == 42
+    sql_calls = [str(call[0][0]) for call in mock_duckdb.execute.call_args_list]
+    assert not any("temp_table" in c for c in sql_calls)
+    delete_calls = [c for c in sql_calls if "DELETE FROM" in c]
+    assert len(delete_calls) == 1
+    assert "test_db.main.pypi_daily_stats" in delete_calls[0]
+    assert "download_date >= '2023-01-01'" in delete_calls[0]
+    assert "AND project IN ('duckdb')" in delete_calls[0]
+    insert_calls = [c for c in sql_calls if "INSERT INTO" in c]
+    assert len(insert_calls) == 1
+    assert "bigquery_scan" in insert_calls[0]
+    assert "GROUP BY ALL" in insert_calls[0]
+
+
+def test_get_high_water_mark(loader, mock_duckdb):
+    mock_duckdb.execute.return_value.fetchone.side_effect = [
+        ("TIMESTAMP WITH TIME ZONE",),
+        ("2023-01-06 23:59:00",),
+    ]
+
+    assert loader.get_high_water_mark("timestamp", "duckdb") == "2023-01-06 23:59:00"
+    mock_duckdb.execute.assert_called_with(ANY, ["duckdb"])
+    query = mock_duckdb.execute.call_args[0][0]
+    assert "timezone('UTC', MAX(timestamp))" in query
+
+
+def test_get_high_water_mark_utc_in_sql():
+    loader = MotherDuckBigQueryLoader(
+        motherduck_database="memory",
+        motherduck_table="pypi_file_downloads",
+        project_id="test_project",
+        attach_motherduck=False,
+        bigquery_extension=False,
+    )
+    loader.conn.execute("SET TimeZone = 'America/New_York'")
+    loader.conn.execute("""
+        CREATE TABLE memory.main.pypi_file_downloads AS
+        SELECT TIMESTAMPTZ '2023-01-06 23:30:00+00' AS timestamp, 'duckdb' AS project
+    """)
+
+    assert loader.get_high_water_mark("timestamp", "duckdb") == datetime(
+        2023, 1, 6, 23, 30
+    )
+
+
+def test_get_high_water_mark_without_table(loader, mock_duckdb):
+    mock_duckdb.execute.return_value.fetchone.return_value = None
+
+    assert loader.get_high_water_mark("timestamp", "duckdb") is None
+
+
+def test_load_from_bigquery_to_sinks(loader, mock_duckdb):
+    mock_duckdb.execute.return_value.fetchone.side_effect = [
+        (1000,),  # _load_from_bigquery: row count
+    ]
+    mock_duckdb.execute.return_value.fetchall.return_value = [_profile_row()]
+    sinks = [MagicMock(), MagicMock()]
+
+    result = loader.load_from_bigquery_to_sinks(
+        table="bigquery-public-data.pypi.file_downloads",
+        filter_str='project = "duckdb"',
+        columns=["timestamp", "project"],
+        timestamp_column="timestamp",
+        start_date="2023-01-01",
+        end_date="2023-01-31",
+        sinks=sinks,
+    )
+
+    assert result == 1000
+    sql_calls = [str(call[0][0]) for call in mock_duckdb.execute.call_args_list]
+    assert len([c for c in sql_calls if "bigquery_scan" in c]) == 1
+    for sink in sinks:
+        sink.setup.assert_called_once_with(mock_duckdb)
+        sink.write.assert_called_once_with(
+            mock_duckdb, "memory.temp_table", "timestamp", "2023-01-01", "2023-01-31"
+        )
+
+
+def test_loader_initialization_without_motherduck(mock_duckdb):
+    with patch.dict("os.environ", {"HOME": "/tmp"}, clear=True):
+        MotherDuckBigQueryLoader(
+            motherduck_database="test_db",
+            motherduck_table="test_table",
+            project_id="test_project",
+            attach_motherduck=False,
+        )
+
+    sql_calls = [str(call[0][0]) for call in mock_duckdb.execute.call_args_list]
+    assert "LOAD bigquery;" in sql_calls
+    assert "ATTACH 'md:'" not in sql_calls
+
+
+def test_stream_from_bigquery_to_motherduck(loader, mock_duckdb):
+    mock_duckdb.execute.return_value.fetchone.side_effect = [
+        (True,),  # _delete_existing_data: table exists check
+        (1000,),  # INSERT ... SELECT row count
+    ]
+    mock_duckdb.execute.return_value.fetchall.return_value = [_profile_row()]
+
+    result = loader.stream_from_bigquery_to_motherduck(
+        table="bigquery-public-data.pypi.file_downloads",
+        filter_str='project = "duckdb"',
+        columns=["timestamp", "project"],
+        timestamp_column="timestamp",
+        start_date="2023-01-01",
+        end_date="2023-01-31",
+        memory_limit="2GB",
+        projects=["duckdb"],
+    )
+
+    assert result == 1000
+    sql_calls = [str(call[0][0]) for call in mock_duckdb.execute.call_args_list]
+    assert "SET memory_limit = '2GB'" in sql_calls
+    # Checks read back the streamed projects only
+    profile_calls = [c for c in sql_calls if "COUNT(*)" in c and "GROUP BY" in c]
+    assert profile_calls
+    assert all("project IN ('duckdb')" in c for c in profile_calls)
+    assert not any("temp_table" in c for c in sql_calls)
+    insert_calls = [c for c in sql_calls if "INSERT INTO" in c]
+    assert len(insert_calls) == 1
+    assert "bigquery_scan" in insert_calls[0]
+    assert sql_calls.index("BEGIN TRANSACTION") < sql_calls.index("COMMIT")
+
+
+def test_stream_rolls_back_on_failed_validation(loader, mock_duckdb):
+    mock_duckdb.execute.return_value.fetchone.side_effect = [
+        (True,),
+        (1000,),
+    ]
+    mock_duckdb.execute.return_value.fetchall.return_value = [
+        _profile_row(null_timestamps=200)
+    ]
+
+    with pytest.raises(DataQualityError, match="timestamp values are null"):
+        loader.stream_from_bigquery_to_motherduck(
+            table="bigquery-public-data.pypi.file_downloads",
+            filter_str='project = "duckdb"',
+            columns=["timestamp", "project"],
+            timestamp_column="timestamp",
+            start_date="2023-01-01",
+            end_date="2023-01-31",
+        )
+
+    sql_calls = [str(call[0][0]) for call in mock_duckdb.execute.call_args_list]
+    assert "ROLLBACK" in sql_calls
+    assert "COMMIT" not in sql_calls
+
 
 def test_delete_existing_data(loader, mock_duckdb):
     mock_duckdb.execute.return_value.fetchone.return_value = (True,)
@@ -105,6 +317,22 @@ def test_delete_existing_data(loader, mock_duckdb):
     assert any("timestamp < '2023-01-31'" in c for c in delete_calls)
 
 
+def test_delete_existing_data_scoped_to_projects(loader, mock_duckdb):
+    mock_duckdb.execute.return_value.fetchone.return_value = (True,)
+
+    loader._delete_existing_data(
+        timestamp_column="timestamp",
+        start_date="2023-01-01",
+        end_date="2023-01-31",
+        projects=["duckdb", "polars"],
+    )
+
+    sql_calls = [str(call[0][0]) for call in mock_duckdb.execute.call_args_list]
+    delete_calls = [c for c in sql_calls if "DELETE FROM" in c]
+    assert len(delete_calls) == 1
+    assert "AND project IN ('duckdb', 'polars')" in delete_calls[0]
+
+
 def test_delete_skips_when_table_missing(loader, mock_duckdb):
     mock_duckdb.execute.return_value.fetchone.return_value = (False,)
 
@@ -122,7 +350,7 @@ def test_delete_skips_when_table_missing(loader, mock_duckdb):
 def test_copy_to_motherduck(loader, mock_duckdb):
     mock_duckdb.execute.return_value.fetchone.return_value = (1000,)
 
-    result = loader._copy_to_motherduck(chunk_size=100)
+    result = loader._copy_to_motherduck(chunk_size=100, copy_mode="chunked")
 
     assert result == 1000
 
@@ -140,32 +368,55 @@ def test_copy_to_motherduck(loader, mock_duckdb):
 
     chunk_calls = [c for c in sql_calls if "rowid BETWEEN" in c]
     assert len(chunk_calls) == 10
+    assert all("ORDER BY project, timestamp::DATE, timestamp" in c for c in chunk_calls)
+
+
+def test_copy_to_motherduck_bulk(loader, mock_duckdb):
+    mock_duckdb.execute.return_value.fetchone.return_value = (1000,)
+
+    result = loader._copy_to_motherduck(chunk_size=100)
+
+    assert result == 1000
+
+    sql_calls = [str(call[0][0]) for call in mock_duckdb.execute.call_args_list]
+    insert_calls = [c for c in sql_calls if "INSERT INTO" in c]
+    assert len(insert_calls) == 1
+    assert "test_db.main.test_table" in insert_calls[0]
+    assert "rowid" not in insert_calls[0]
+    assert "ORDER BY project, timestamp::DATE, timestamp" in insert_calls[0]
+    assert not any("COUNT(*)" in c for c in sql_calls)
+
+
+def test_copy_to_motherduck_rejects_unknown_mode(loader):
+    with pytest.raises(ValueError, match="Unknown copy_mode"):
+        loader._copy_to_motherduck(chunk_size=100, copy_mode="arrow")
 
 
 def test_validate_data_passes(loader, mock_duckdb):
-    mock_duckdb.execute.return_value.fetchone.return_value = (
-        1000,  # total_rows
-        1000,  # non_null_timestamps
-        1000,  # non_null_projects
-        "2023-01-01 00:00:00",  # min_ts
-        "2023-01-31 23:59:59",  # max_ts
-    )
+    mock_duckdb.execute.return_value.fetchall.return_value = [
+        _profile_row(rows=600),
+        _profile_row(rows=400, project="pandas"),
+    ]
 
-    loader._validate_data(
+    profile = loader._validate_data(
         timestamp_column="timestamp",
         start_date="2023-01-01",
         end_date="2023-01-31",
     )
 
+    assert profile.rows == 1000
+    assert profile.project_rows() == {"duckdb": 600, "pandas": 400}
+    sql_calls = [str(call[0][0]) for call in mock_duckdb.execute.call_args_list]
+    profile_calls = [c for c in sql_calls if "GROUP BY ALL" in c]
+    assert len(profile_calls) == 1
+    assert "COUNT(DISTINCT hash(t))" in profile_calls[0]
+    assert "regexp_full_match(country_code" in profile_calls[0]
+
 
 def test_validate_data_fails_on_null_timestamps(loader, mock_duckdb):
-    mock_duckdb.execute.return_value.fetchone.return_value = (
-        1000,
-        900,  # 10% null timestamps
-        1000,
-        "2023-01-01",
-        "2023-01-31",
-    )
+    mock_duckdb.execute.return_value.fetchall.return_value = [
+        _profile_row(null_timestamps=100)  # 10% null timestamps
+    ]
 
     with pytest.raises(DataQualityError, match="timestamp values are null"):
         loader._validate_data(
@@ -176,13 +427,9 @@ def test_validate_data_fails_on_null_timestamps(loader, mock_duckdb):
 
 
 def test_validate_data_fails_on_null_projects(loader, mock_duckdb):
-    mock_duckdb.execute.return_value.fetchone.return_value = (
-        1000,
-        1000,
-        800,  # 20% null projects
-        "2023-01-01",
-        "2023-01-31",
-    )
+    mock_duckdb.execute.return_value.fetchall.return_value = [
+        _profile_row(null_projects=200)  # 20% null projects
+    ]
 
     with pytest.raises(DataQualityError, match="project values are null"):
         loader._validate_data(
@@ -193,7 +440,7 @@ def test_validate_data_fails_on_null_projects(loader, mock_duckdb):
 
 
 def test_validate_data_fails_on_zero_rows(loader, mock_duckdb):
-    mock_duckdb.execute.return_value.fetchone.return_value = (0, 0, 0, None, None)
+    mock_duckdb.execute.return_value.fetchall.return_value = []
 
     with pytest.raises(DataQualityError, match="No rows loaded"):
         loader._validate_data(
@@ -201,3 +448,59 @@ def test_validate_data_fails_on_zero_rows(loader, mock_duckdb):
             start_date="2023-01-01",
             end_date="2023-01-31",
         )
+
+
+def test_load_partitioned(loader, mock_duckdb):
+    cursor = mock_duckdb.cursor.return_value
+    cursor.execute.return_value.fetchone.side_effect = [
+        (1000,),  # _load_from_bigquery: row count
+        (10, 40),  # _temp_table_bytes: sampled rows and bytes
+        (True,),  # _delete_existing_data: table exists check
+        (1000,),  # _copy_to_motherduck: bulk INSERT row count
+    ]
+    cursor.execute.return_value.fetchall.return_value = [_profile_row()]
+
+    stats = loader.load_partitioned(
+        table="bigquery-public-data.pypi.file_downloads",
+        windows=[("2023-01-01", "2023-01-02", 'project = "duckdb"')],
+        columns=["timestamp", "project"],
+        timestamp_column="timestamp",
+        workers=2,
+    )
+
+    assert len(stats) == 1
+    assert stats[0].rows == 1000
+    assert stats[0].bytes == 4000
+    assert stats[0].checksum == "123"
+
+    sql_calls = [str(call[0][0]) for call in cursor.execute.call_args_list]
+    assert any("memory.temp_table_2023_01_01" in c for c in sql_calls)
+    assert "BEGIN TRANSACTION" in sql_calls
+    assert "COMMIT" in sql_calls
+    assert sql_calls.index("BEGIN TRANSACTION") < sql_calls.index("COMMIT")
+    assert any(
+        "DROP TABLE IF EXISTS memory.temp_table_2023_01_01" in c for c in sql_calls
+    )
+    cursor.close.assert_called_once()
+
+
+def test_load_partitioned_rolls_back_failed_window(loader, mock_duckdb):
+    cursor = mock_duckdb.cursor.return_value
+    cursor.execute.return_value.fetchone.side_effect = [
+        (1000,),
+        (10, 40),
+        RuntimeError("delete failed"),
+    ]
+    cursor.execute.return_value.fetchall.return_value = [_profile_row()]
+
+    with pytest.raises(RuntimeError, match="delete failed"):
+        loader.load_partitioned(
+            table="bigquery-public-data.pypi.file_downloads",
+            windows=[("2023-01-01", "2023-01-02", 'project = "duckdb"')],
+            columns=["timestamp", "project"],
+            timestamp_column="timestamp",
+        )
+
+    sql_calls = [str(call[0][0]) for call in cursor.execute.call_args_list]
+    assert "ROLLBACK" in sql_calls
+    assert "COMMIT" not in sql_calls
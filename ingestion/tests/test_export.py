@@ -0,0 +1,76 @@
+import json
+
+import duckdb
+import pytest
+from ingestion.export import export_table, partition_files, read_index
+
+
+@pytest.fixture
+def conn():
+    conn = duckdb.connect(database=":memory:")
+    conn.execute("""
+        CREATE TABLE daily AS
+        SELECT
+            DATE '2024-01-01' + INTERVAL (range % 91) DAY AS download_date,
+            CASE WHEN range % 3 = 0 THEN 'polars' ELSE 'duckdb' END AS project,
+            range AS daily_download_sum
+        FROM range(273)
+    """)
+    yield conn
+    conn.close()
+
+
+def _export(conn, path, **kwargs):
+    return export_table(
+        conn, "memory.main.daily", str(path), "daily", "download_date", **kwargs
+    )
+
+
+def test_export_writes_partitions_and_manifests(conn, tmp_path):
+    exported = _export(conn, tmp_path, workers=2)
+
+    assert [(m.year, m.month, m.rows) for m in exported] == [
+        (2024, 1, 93),
+        (2024, 2, 87),
+        (2024, 3, 93),
+    ]
+    manifest = json.loads(
+        (tmp_path / "daily" / "year=2024" / "month=2" / "_manifest.json").read_text()
+    )
+    assert manifest["rows"] == 87
+    assert manifest["min_date"] == "2024-02-01"
+    assert manifest["max_date"] == "2024-02-29"
+    assert manifest["files"][0]["size_bytes"] > 0
+
+    index = read_index(conn, str(tmp_path), "daily")
+    assert sorted(index) == [(2024, 1), (2024, 2), (2024, 3)]
+    files = partition_files(list(index.values()), "2024-02-10", "2024-03-01")
+    assert files == [
+        str(tmp_path / "daily" / "year=2024" / "month=2" / "data_0.parquet")
+    ]
+    assert (
+        conn.execute(f"SELECT COUNT(*) FROM read_parquet({files})").fetchone()[0] == 87
+    )
+
+
+def test_export_skips_unchanged_partitions(conn, tmp_path):
+    _export(conn, tmp_path)
+
+    assert _export(conn, tmp_path) == []
+
+    conn.execute("""
+        UPDATE daily SET daily_download_sum = daily_download_sum + 1
+        WHERE download_date = DATE '2024-03-15'
+    """)
+    exported = _export(conn, tmp_path)
+    assert [(m.year, m.month) for m in exported] == [(2024, 3)]
+    assert len(read_index(conn, str(tmp_path), "daily")) == 3
+
+    assert len(_export(conn, tmp_path, force=True)) == 3
+
+
+def test_export_limits_to_overlapping_months(conn, tmp_path):
+    exported = _export(conn, tmp_path, start_date="2024-02-10", end_date="2024-03-01")
+
+    assert [(m.year, m.month, m.rows) for m in exported] == [(2024, 2, 87)]
+    assert not (tmp_path / "daily" / "year=2024" / "month=1").exists()
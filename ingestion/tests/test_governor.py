@@ -0,0 +1,98 @@
+import duckdb
+import pytest
+from ingestion.governor import ResourceGovernor, detect_resources, parse_size
+from ingestion.models import HostResources, WindowStats
+
+GIB = 1024**3
+
+
+def _governor(memory_gib=8, cpus=4, **kwargs):
+    return ResourceGovernor(
+        resources=HostResources(memory_bytes=memory_gib * GIB, cpus=cpus), **kwargs
+    )
+
+
+def _stats(rows, days=1, bytes_per_row=100):
+    return WindowStats(
+        start_date="2023-01-01",
+        end_date=f"2023-01-{1 + days:02d}",
+        rows=rows,
+        bytes=rows * bytes_per_row,
+        elapsed_seconds=1.0,
+    )
+
+
+def test_parse_size():
+    assert parse_size("2GB") == 2 * 1000**3
+    assert parse_size("512 MiB") == 512 * 1024**2
+    assert parse_size("1.5GiB") == int(1.5 * GIB)
+    with pytest.raises(ValueError, match="Invalid size"):
+        parse_size("lots")
+
+
+def test_detect_resources():
+    resources = detect_resources()
+    assert resources.memory_bytes > 0
+    assert resources.cpus >= 1
+
+
+def test_memory_limit_from_fraction_or_setting():
+    assert _governor(memory_gib=8).memory_limit_bytes == 6 * GIB
+    assert _governor(memory_limit="2GiB").memory_limit_bytes == 2 * GIB
+
+
+def test_windows_start_at_one_day_then_follow_observed_rows():
+    governor = _governor(memory_limit="1GiB", max_window_days=31)
+    governor.bytes_per_row = 100
+    assert governor.window_days(workers=2) == 1
+
+    # 1M rows/day of 100 bytes, twice for the sort: 200MB a day, 512MiB a window
+    governor.observe(_stats(rows=1_000_000))
+    assert governor.window_days(workers=2) == 2
+    assert governor.window_days(workers=1) == 5
+
+    # Traffic doubles: the average moves halfway and windows shrink
+    governor.observe(_stats(rows=4_000_000, days=2))
+    assert governor.rows_per_day == 1_500_000
+    assert governor.window_days(workers=1) == 3
+
+
+def test_windows_are_capped():
+    governor = _governor(memory_limit="64GiB", max_window_days=7)
+    governor.observe(_stats(rows=1000))
+    assert governor.window_days(workers=4) == 7
+
+
+def test_workers_are_reduced_when_a_day_does_not_fit():
+    governor = _governor(memory_limit="1GiB")
+    governor.bytes_per_row = 100
+    assert governor.workers(8) == 8
+    governor.seed(2_000_000)
+    governor.observe(_stats(rows=2_000_000, bytes_per_row=100))
+    assert governor.workers(8) == 2
+    assert governor.window_days(governor.workers(8)) == 1
+
+
+def test_chunk_size_follows_bytes_per_row():
+    governor = _governor(memory_limit="1GiB", profile="lean")
+    assert governor.chunk_size() == int(0.1 * GIB / 250)
+    governor.observe(_stats(rows=1000, bytes_per_row=1000))
+    assert governor.chunk_size() < int(0.1 * GIB / 250)
+    assert _governor(memory_limit="1MiB").chunk_size() == 10_000
+
+
+def test_configure_sets_memory_threads_and_spill(tmp_path):
+    spill = str(tmp_path / "spill")
+    governor = _governor(memory_limit="512MiB", cpus=2, temp_directory=spill)
+    conn = duckdb.connect()
+    governor.configure(conn)
+    settings = dict(
+        conn.execute("""
+            SELECT name, value FROM duckdb_settings()
+            WHERE name IN ('memory_limit', 'threads', 'temp_directory')
+        """).fetchall()
+    )
+    assert settings["memory_limit"] == "512.0 MiB"
+    assert settings["threads"] == "2"
+    assert settings["temp_directory"] == spill
+    assert (tmp_path / "spill").is_dir()
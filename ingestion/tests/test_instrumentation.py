@@ -0,0 +1,59 @@
+import json
+import duckdb
+import pytest
+from ingestion.instrumentation import RunRecorder, append_report, write_report
+
+
+def test_recorder_stage_with_duckdb_profile():
+    conn = duckdb.connect(database=":memory:")
+    recorder = RunRecorder(profile_queries=True)
+    recorder.enable_profiling(conn)
+
+    with recorder.stage("bigquery_scan", conn=conn, window="2023-01-01") as metrics:
+        metrics.rows = conn.execute(
+            "CREATE TABLE t AS SELECT range AS i FROM range(1000)"
+        ).fetchone()[0]
+
+    [stage] = recorder.stages
+    assert stage.stage == "bigquery_scan"
+    assert stage.window == "2023-01-01"
+    assert stage.rows == 1000
+    assert stage.wall_seconds > 0
+    assert stage.process_peak_rss_bytes > 0
+    assert "latency" in stage.duckdb_profile
+    conn.close()
+
+
+def test_recorder_marks_failed_stage():
+    recorder = RunRecorder()
+
+    with pytest.raises(RuntimeError):
+        with recorder.stage("copy"):
+            raise RuntimeError("boom")
+
+    assert recorder.stages[0].status == "failed"
+    assert recorder.report({}, status="failed").status == "failed"
+
+
+def test_write_and_append_report(tmp_path):
+    recorder = RunRecorder()
+    with recorder.stage("validate") as metrics:
+        metrics.rows = 10
+    with recorder.stage("copy") as metrics:
+        metrics.rows = 10
+    report = recorder.report({"pypi_project": "duckdb"})
+
+    report_path = tmp_path / "report.json"
+    write_report(report, str(report_path))
+    payload = json.loads(report_path.read_text())
+    assert payload["run_id"] == recorder.run_id
+    assert [s["stage"] for s in payload["stages"]] == ["validate", "copy"]
+
+    metrics_db = str(tmp_path / "metrics.duckdb")
+    append_report(report, metrics_db)
+    append_report(recorder.report({"pypi_project": "duckdb"}), metrics_db)
+    conn = duckdb.connect(metrics_db)
+    assert conn.execute(
+        "SELECT stage, COUNT(*) FROM run_stages GROUP BY ALL ORDER BY stage"
+    ).fetchall() == [("copy", 2), ("validate", 2)]
+    conn.close()
@@ -0,0 +1,73 @@
+import duckdb
+import pytest
+from ingestion.layout import compact, order_by, sort_key
+
+
+@pytest.fixture
+def conn():
+    conn = duckdb.connect(database=":memory:")
+    # Three daily appends of two projects, as left by day-by-day loads
+    conn.execute("""
+        CREATE TABLE downloads (timestamp TIMESTAMP, project VARCHAR)
+    """)
+    for day in ("2023-01-03", "2023-01-01", "2023-01-02"):
+        conn.execute(f"""
+            INSERT INTO downloads
+            SELECT
+                TIMESTAMP '{day}' + INTERVAL (range) HOUR,
+                CASE WHEN range % 2 = 0 THEN 'polars' ELSE 'duckdb' END
+            FROM range(24)
+        """)
+    yield conn
+    conn.close()
+
+
+def _physical_order(conn: duckdb.DuckDBPyConnection) -> list[tuple]:
+    return conn.execute(
+        "SELECT project, timestamp FROM downloads ORDER BY rowid"
+    ).fetchall()
+
+
+def test_sort_key():
+    assert sort_key("project_date", "ts") == "project, ts::DATE, ts"
+    assert sort_key("timestamp", "ts") == "ts"
+    assert sort_key("none", "ts") is None
+    assert order_by("none", "ts") == ""
+    with pytest.raises(ValueError, match="Unknown layout"):
+        sort_key("zorder", "ts")
+
+
+def test_compact_whole_table(conn):
+    rows = compact(conn, "memory.main.downloads", "timestamp")
+
+    assert rows == 72
+    assert _physical_order(conn) == sorted(_physical_order(conn))
+
+
+def test_compact_range_keeps_other_rows(conn):
+    before = sorted(_physical_order(conn))
+
+    rows = compact(
+        conn,
+        "memory.main.downloads",
+        "timestamp",
+        layout="timestamp",
+        start_date="2023-01-01",
+        end_date="2023-01-03",
+    )
+
+    assert rows == 48
+    physical = _physical_order(conn)
+    assert sorted(physical) == before
+    # The untouched day stays first, the compacted range follows in order
+    assert [ts.day for _, ts in physical[:24]] == [3] * 24
+    compacted = [ts for _, ts in physical[24:]]
+    assert compacted == sorted(compacted)
+    assert not conn.execute(
+        "SELECT COUNT(*) FROM duckdb_tables() WHERE table_name LIKE '%compaction'"
+    ).fetchone()[0]
+
+
+def test_compact_rejects_unsorted_layout(conn):
+    with pytest.raises(ValueError, match="sorted layout"):
+        compact(conn, "memory.main.downloads", "timestamp", layout="none")
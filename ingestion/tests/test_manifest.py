@@ -0,0 +1,126 @@
+from datetime import date
+
+from ingestion.manifest import RunManifest
+from ingestion.models import WindowStats
+
+
+def _stats(start_date, end_date, rows=100, project="duckdb"):
+    return WindowStats(
+        start_date=start_date,
+        end_date=end_date,
+        rows=rows,
+        bytes=1024,
+        elapsed_seconds=1.0,
+        checksum="42",
+        project_rows={project: rows} if rows else {},
+    )
+
+
+def test_manifest_records_and_skips_completed(tmp_path):
+    manifest = RunManifest(str(tmp_path / "manifest.duckdb"), target="db.table")
+    manifest.record("duckdb", _stats("2023-01-01", "2023-01-02"))
+
+    windows = [("2023-01-01", "2023-01-02"), ("2023-01-02", "2023-01-03")]
+    assert manifest.pending("duckdb", windows) == [("2023-01-02", "2023-01-03")]
+    assert manifest.pending("polars", windows) == windows
+    manifest.close()
+
+
+def test_manifest_survives_reopen(tmp_path):
+    path = str(tmp_path / "manifest.duckdb")
+    manifest = RunManifest(path, target="db.table")
+    manifest.record("duckdb", _stats("2023-01-01", "2023-01-02", rows=100))
+    manifest.record("duckdb", _stats("2023-01-01", "2023-01-02", rows=200))
+    manifest.close()
+
+    reopened = RunManifest(path, target="db.table")
+    assert reopened.completed_days("duckdb") == {date(2023, 1, 1)}
+    assert reopened.conn.execute("SELECT rows FROM completed_windows").fetchall() == [
+        (200,)
+    ]
+    reopened.close()
+
+
+def test_manifest_is_scoped_by_target(tmp_path):
+    path = str(tmp_path / "manifest.duckdb")
+    manifest = RunManifest(path, target="db.table")
+    manifest.record("duckdb", _stats("2023-01-01", "2023-01-02"))
+    manifest.close()
+
+    other = RunManifest(path, target="other_db.table")
+    assert other.completed_days("duckdb") == set()
+    other.close()
+
+
+def test_manifest_pending_requires_every_project(tmp_path):
+    manifest = RunManifest(str(tmp_path / "manifest.duckdb"), target="db.table")
+    stats = _stats("2023-01-01", "2023-01-02", rows=300)
+    stats.project_rows = {"duckdb": 200, "polars": 100}
+    manifest.record("duckdb", stats)
+
+    windows = [("2023-01-01", "2023-01-02")]
+    assert manifest.pending(["duckdb", "polars"], windows) == windows
+
+    manifest.record("polars", stats)
+    assert manifest.pending(["duckdb", "polars"], windows) == []
+    assert manifest.conn.execute(
+        "SELECT project, rows FROM completed_windows ORDER BY project"
+    ).fetchall() == [("duckdb", 200), ("polars", 100)]
+    manifest.close()
+
+
+def test_manifest_rows_per_day(tmp_path):
+    manifest = RunManifest(str(tmp_path / "manifest.duckdb"), target="db.table")
+    assert manifest.rows_per_day(["duckdb"]) is None
+    manifest.record("duckdb", _stats("2023-01-01", "2023-01-02", rows=100))
+    manifest.record(
+        "pandas", _stats("2023-01-01", "2023-01-02", rows=50, project="pandas")
+    )
+    manifest.record("duckdb", _stats("2023-01-02", "2023-01-05", rows=600))
+    manifest.record("duckdb", _stats("2023-01-05", "2023-01-06", rows=1000))
+    assert manifest.rows_per_day(["duckdb"]) == 200
+    assert manifest.rows_per_day(["duckdb", "pandas"]) == 200
+    assert manifest.rows_per_day(["duckdb"], limit=1) == 1000
+    manifest.close()
+
+
+def test_manifest_records_rows_of_each_project(tmp_path):
+    manifest = RunManifest(str(tmp_path / "manifest.duckdb"), target="db.table")
+    # polars had no rows in this window
+    manifest.record("polars", _stats("2023-01-01", "2023-01-02", rows=300))
+    # Streaming windows do not count rows per project
+    streamed = _stats("2023-01-02", "2023-01-03", rows=300)
+    streamed.project_rows = {}
+    manifest.record("duckdb", streamed)
+    manifest.record("polars", streamed)
+
+    assert manifest.conn.execute(
+        "SELECT project, start_date::VARCHAR, rows FROM completed_windows ORDER BY ALL"
+    ).fetchall() == [
+        ("duckdb", "2023-01-02", None),
+        ("polars", "2023-01-01", 0),
+        ("polars", "2023-01-02", None),
+    ]
+    assert manifest.rows_per_day(["duckdb", "polars"]) == 0
+    assert manifest.rows_per_day(["duckdb"]) is None
+    manifest.close()
+
+
+def test_manifest_pending_matches_covered_days(tmp_path):
+    manifest = RunManifest(str(tmp_path / "manifest.duckdb"), target="db.table")
+    manifest.record("duckdb", _stats("2023-01-01", "2023-01-03"))
+    manifest.record("duckdb", _stats("2023-01-05", "2023-01-06"))
+
+    # Resumed with 1-day windows: the days of the 2-day window are skipped
+    windows = [(f"2023-01-0{day}", f"2023-01-0{day + 1}") for day in range(1, 7)]
+    assert manifest.pending("duckdb", windows) == [
+        ("2023-01-03", "2023-01-04"),
+        ("2023-01-04", "2023-01-05"),
+        ("2023-01-06", "2023-01-07"),
+    ]
+    # Resumed with a 7-day window: narrowed to its uncovered days
+    assert manifest.pending("duckdb", [("2023-01-01", "2023-01-08")]) == [
+        ("2023-01-03", "2023-01-05"),
+        ("2023-01-06", "2023-01-08"),
+    ]
+    manifest.close()
@@ -1,6 +1,12 @@
 import pytest
 from ingestion.models import PypiJobParameters
-from ingestion.bigquery import build_bigquery_filter, PYPI_PUBLIC_TABLE, COLUMNS
+from ingestion.bigquery import (
+    build_bigquery_filter,
+    get_columns,
+    split_date_range,
+    PYPI_PUBLIC_TABLE,
+    COLUMNS,
+)
 
 
 def test_pypi_job_parameters_defaults():
@@ -12,6 +18,8 @@ def test_pypi_job_parameters_defaults():
     assert params.table_name == "pypi_file_downloads"
     assert params.timestamp_column == "timestamp"
     assert params.destination == ["local"]
+    assert params.window_days is None
+    assert params.workers == 4
 
 
 def test_pypi_job_parameters_custom_values():
@@ -47,6 +55,22 @@ def test_pypi_job_parameters_destination_types():
     assert params_default.destination == ["local"]
 
 
+def test_pypi_job_parameters_destinations():
+    params_csv = PypiJobParameters(gcp_project="test_project", destination="local,md")
+    assert params_csv.destinations == ["local", "md"]
+
+    params_list = PypiJobParameters(gcp_project="test_project", destination=["s3"])
+    assert params_list.destinations == ["s3"]
+
+
+def test_pypi_job_parameters_copy_mode():
+    assert PypiJobParameters(gcp_project="p", copy_mode="merge").copy_mode == "merge"
+    with pytest.raises(ValueError, match="Unknown copy_mode 'arrow'"):
+        PypiJobParameters(gcp_project="p", copy_mode="arrow")
+    with pytest.raises(ValueError, match="merge only runs as a single scan"):
+        PypiJobParameters(gcp_project="p", copy_mode="merge", window_days=1)
+
+
 def test_build_bigquery_filter():
     params = PypiJobParameters(
         gcp_project="test_project",
@@ -62,6 +86,19 @@ def test_build_bigquery_filter():
     assert "timestamp <" in filter_str
 
 
+def test_build_bigquery_filter_multiple_projects():
+    params = PypiJobParameters(
+        gcp_project="test_project",
+        start_date="2023-01-01",
+        end_date="2023-02-01",
+        pypi_project="duckdb,polars",
+    )
+    assert params.projects == ["duckdb", "polars"]
+    filter_str = build_bigquery_filter(params)
+    assert filter_str.startswith('project IN ("duckdb", "polars") AND')
+    assert 'TIMESTAMP("2023-01-01")' in filter_str
+
+
 def test_build_bigquery_filter_custom_timestamp():
     params = PypiJobParameters(
         gcp_project="test_project",
@@ -83,5 +120,39 @@ def test_columns_list():
     assert "details" in COLUMNS
 
 
+def test_get_columns_profiles():
+    assert get_columns("raw") == COLUMNS
+    lean = get_columns("lean")
+    assert "details" not in lean
+    assert "file" not in lean
+    assert "file.version AS version" in lean
+    assert "details.python AS python" in lean
+    with pytest.raises(ValueError, match="Unknown ingestion profile"):
+        get_columns("wide")
+
+
 def test_pypi_public_table():
     assert PYPI_PUBLIC_TABLE == "bigquery-public-data.pypi.file_downloads"
+
+
+def test_split_date_range_daily():
+    windows = split_date_range("2023-01-30", "2023-02-02")
+    assert windows == [
+        ("2023-01-30", "2023-01-31"),
+        ("2023-01-31", "2023-02-01"),
+        ("2023-02-01", "2023-02-02"),
+    ]
+
+
+def test_split_date_range_truncates_last_window():
+    windows = split_date_range("2023-01-01", "2023-01-10", window_days=4)
+    assert windows == [
+        ("2023-01-01", "2023-01-05"),
+        ("2023-01-05", "2023-01-09"),
+        ("2023-01-09", "2023-01-10"),
+    ]
+
+
+def test_split_date_range_invalid_window():
+    with pytest.raises(ValueError, match="window_days"):
+        split_date_range("2023-01-01", "2023-01-10", window_days=0)
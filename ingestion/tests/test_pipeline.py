@@ -0,0 +1,31 @@
+from datetime import datetime
+from ingestion.models import PypiJobParameters
+from ingestion.pipeline import apply_high_water_mark
+
+
+def _params(**kwargs):
+    return PypiJobParameters(
+        gcp_project="test_project",
+        start_date="2023-01-01",
+        end_date="2023-01-08",
+        **kwargs,
+    )
+
+
+def test_apply_high_water_mark_without_data():
+    params = _params()
+    assert apply_high_water_mark(params, None) is params
+
+
+def test_apply_high_water_mark_moves_start_with_overlap():
+    params = apply_high_water_mark(
+        _params(overlap_hours=6),
+        datetime(2023, 1, 6, 23, 30),
+    )
+    assert params.start_date == "2023-01-06 17:30:00"
+    assert params.end_date == "2023-01-08"
+
+
+def test_apply_high_water_mark_never_before_start():
+    params = _params(overlap_hours=48)
+    assert apply_high_water_mark(params, datetime(2023, 1, 2)) is params
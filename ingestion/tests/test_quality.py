@@ -0,0 +1,144 @@
+import json
+from datetime import date
+
+import duckdb
+import pytest
+from ingestion.quality import (
+    DEFAULT_RULES,
+    DataQualityError,
+    DayProfile,
+    DomainRule,
+    NullRateRule,
+    QualityProfile,
+    QualityRule,
+    RowCountAnomalyRule,
+    build_profile_sql,
+    evaluate,
+    load_rules,
+    parse_profile_rows,
+)
+
+
+@pytest.fixture
+def conn():
+    conn = duckdb.connect()
+    conn.execute("""
+        CREATE TABLE downloads AS
+        SELECT * FROM (VALUES
+            (TIMESTAMP '2023-01-01 10:00:00', 'duckdb', 'FR'),
+            (TIMESTAMP '2023-01-01 10:00:00', 'duckdb', 'FR'),
+            (TIMESTAMP '2023-01-01 11:00:00', 'duckdb', 'fr'),
+            (TIMESTAMP '2023-01-02 09:00:00', 'duckdb', NULL),
+            (TIMESTAMP '2023-01-02 09:00:00', 'pandas', 'US'),
+            (TIMESTAMP '2023-01-03 00:00:00', 'pandas', 'US')
+        ) AS t(timestamp, project, country_code)
+    """)
+    return conn
+
+
+def _profile(conn, rules, start_date="2023-01-01", end_date="2023-01-03"):
+    query, metrics = build_profile_sql(
+        "downloads", rules, "timestamp", start_date, end_date
+    )
+    return QualityProfile(
+        timestamp_column="timestamp",
+        start_date=start_date,
+        end_date=end_date,
+        days=parse_profile_rows(conn.execute(query).fetchall(), metrics),
+    )
+
+
+def test_profile_computes_every_rule_per_day_and_project(conn):
+    profile = _profile(conn, DEFAULT_RULES)
+
+    days = {(d.download_date, d.project): d for d in profile.days}
+    assert len(days) == 4
+    first_day = days[(date(2023, 1, 1), "duckdb")]
+    assert first_day.rows == 3
+    assert first_day.metrics["duplicates"] == 1
+    assert first_day.metrics["out_of_domain_country_code"] == 1
+    assert profile.total("out_of_range") == 1
+    assert profile.project_rows() == {"duckdb": 4, "pandas": 2}
+    # Same checksum as a whole-table hash sum, from the same pass
+    assert profile.checksum == str(
+        conn.execute("SELECT SUM(hash(t)) FROM downloads AS t").fetchone()[0]
+    )
+
+
+def test_evaluate_raises_errors_and_returns_warnings(conn):
+    profile = _profile(conn, DEFAULT_RULES)
+
+    with pytest.raises(DataQualityError) as error:
+        evaluate(profile, DEFAULT_RULES)
+    assert "outside their domain" in str(error.value)
+    assert "outside [2023-01-01, 2023-01-03)" in str(error.value)
+
+    rules = [
+        NullRateRule(column="country_code", max_pct=10, severity="warn"),
+        DomainRule(column="country_code", values=["FR", "US"], max_pct=50),
+    ]
+    warnings = evaluate(_profile(conn, rules), rules)
+    assert warnings == ["16.7% of country_code values are null (threshold: 10%)"]
+
+
+def test_row_count_anomaly_uses_full_days_only():
+    rule = RowCountAnomalyRule(min_ratio=0.5, max_ratio=2)
+    profile = QualityProfile(
+        timestamp_column="timestamp",
+        start_date="2023-01-01 12:00:00",
+        end_date="2023-01-03",
+        days=[
+            DayProfile(download_date=date(2023, 1, 1), project="duckdb", rows=10),
+            DayProfile(download_date=date(2023, 1, 2), project="duckdb", rows=500),
+            DayProfile(download_date=date(2023, 1, 2), project="pandas", rows=1),
+        ],
+        history={"duckdb": 100.0},
+    )
+
+    assert [d.download_date for d in profile.full_days()] == [
+        date(2023, 1, 2),
+        date(2023, 1, 2),
+    ]
+    assert rule.check(profile) == (
+        "Daily row count anomalies: duckdb on 2023-01-02: 500 rows, "
+        "5.00x the 28-day median"
+    )
+
+
+def test_evaluate_rejects_empty_load():
+    profile = QualityProfile(
+        timestamp_column="timestamp",
+        start_date="2023-01-01",
+        end_date="2023-01-02",
+        days=[],
+    )
+    with pytest.raises(DataQualityError, match="No rows loaded"):
+        evaluate(profile, DEFAULT_RULES)
+
+
+def test_load_rules(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(
+        json.dumps(
+            [
+                {"rule": "null_rate", "column": "project", "max_pct": 1},
+                {"rule": "domain", "column": "country_code", "pattern": "[A-Z]{2}"},
+                {"rule": "row_count_anomaly", "history_days": 7, "severity": "error"},
+            ]
+        )
+    )
+
+    rules = load_rules(str(path))
+
+    assert isinstance(rules[0], NullRateRule) and rules[0].max_pct == 1
+    assert isinstance(rules[1], DomainRule)
+    assert isinstance(rules[2], RowCountAnomalyRule)
+    assert rules[2].history_days == 7 and rules[2].severity == "error"
+
+
+def test_rules_must_implement_check():
+    class NoCheckRule(QualityRule):
+        pass
+
+    with pytest.raises(TypeError, match="abstract"):
+        NoCheckRule()
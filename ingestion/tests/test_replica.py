@@ -0,0 +1,117 @@
+import os
+
+import duckdb
+import pytest
+
+from ingestion.replica import ReadReplica
+
+TABLES = {"pypi_daily_stats": "download_date", "pypi_kpis": None}
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = duckdb.connect(database=":memory:")
+    conn.execute(f"ATTACH '{tmp_path / 'source.duckdb'}' AS duckdb_stats")
+    conn.execute("""
+        CREATE TABLE duckdb_stats.main.pypi_daily_stats AS
+        SELECT
+            (DATE '2024-01-01' + INTERVAL (range % 5) DAY)::DATE AS download_date,
+            CASE WHEN range % 2 = 0 THEN 'polars' ELSE 'duckdb' END AS project,
+            range AS daily_download_sum
+        FROM range(50)
+    """)
+    conn.execute("""
+        CREATE TABLE duckdb_stats.main.pypi_kpis AS
+        SELECT DATE '2024-01-05' AS refresh_date, 1225 AS total_downloads
+    """)
+    yield conn
+    conn.close()
+
+
+def _read(replica: ReadReplica, query: str):
+    reader = replica.connect()
+    try:
+        return reader.execute(query).fetchall()
+    finally:
+        reader.close()
+
+
+def test_first_sync_publishes_a_snapshot(conn, tmp_path):
+    replica = ReadReplica(str(tmp_path / "replica"))
+
+    pulled = replica.sync(conn, "duckdb_stats", TABLES)
+
+    assert pulled == {"pypi_daily_stats": 50, "pypi_kpis": 1}
+    assert replica.current().endswith("duckdb_stats-000001.duckdb")
+    assert _read(
+        replica, "SELECT COUNT(*), SUM(daily_download_sum) FROM pypi_daily_stats"
+    ) == [(50, 1225)]
+    assert _read(
+        replica, "SELECT total_downloads FROM duckdb_stats.main.pypi_kpis"
+    ) == [(1225,)]
+
+
+def test_sync_pulls_changed_partitions_only(conn, tmp_path):
+    replica = ReadReplica(str(tmp_path / "replica"))
+    replica.sync(conn, "duckdb_stats", TABLES)
+    assert replica.sync(conn, "duckdb_stats", TABLES)["pypi_daily_stats"] == 0
+
+    conn.execute("""
+        UPDATE duckdb_stats.main.pypi_daily_stats
+        SET daily_download_sum = daily_download_sum + 1
+        WHERE download_date = DATE '2024-01-03'
+    """)
+    conn.execute("""
+        DELETE FROM duckdb_stats.main.pypi_daily_stats
+        WHERE download_date = DATE '2024-01-05'
+    """)
+    conn.execute("""
+        INSERT INTO duckdb_stats.main.pypi_daily_stats
+        VALUES (DATE '2024-01-06', 'duckdb', 7)
+    """)
+    pulled = replica.sync(conn, "duckdb_stats", TABLES)
+
+    # Day 3 (10 rows) changed and day 6 (1 row) is new, day 5 is dropped
+    assert pulled["pypi_daily_stats"] == 11
+    assert (
+        _read(
+            replica,
+            """
+        SELECT COUNT(*), SUM(daily_download_sum), MAX(download_date)::VARCHAR
+        FROM pypi_daily_stats
+        """,
+        )
+        == conn.execute("""
+        SELECT COUNT(*), SUM(daily_download_sum), MAX(download_date)::VARCHAR
+        FROM duckdb_stats.main.pypi_daily_stats
+    """).fetchall()
+    )
+
+
+def test_sync_keeps_previous_snapshots_readable(conn, tmp_path):
+    replica = ReadReplica(str(tmp_path / "replica"), keep=2)
+    replica.sync(conn, "duckdb_stats", TABLES)
+    reader = replica.connect()
+
+    conn.execute("DELETE FROM duckdb_stats.main.pypi_daily_stats")
+    replica.sync(conn, "duckdb_stats", TABLES)
+    replica.sync(conn, "duckdb_stats", TABLES)
+
+    # A reader keeps the snapshot it opened, new readers see the latest one
+    assert reader.execute("SELECT COUNT(*) FROM pypi_daily_stats").fetchone() == (50,)
+    assert _read(replica, "SELECT COUNT(*) FROM pypi_daily_stats") == [(0,)]
+    assert _read(replica, "SELECT version FROM _replica_snapshot") == [(3,)]
+    assert sorted(f for f in os.listdir(replica.path) if f.endswith(".duckdb")) == [
+        "duckdb_stats-000002.duckdb",
+        "duckdb_stats-000003.duckdb",
+    ]
+    reader.close()
+
+
+def test_sync_skips_missing_tables(conn, tmp_path):
+    replica = ReadReplica(str(tmp_path / "replica"))
+
+    pulled = replica.sync(conn, "duckdb_stats", {"pypi_weekly_downloads": "x"})
+
+    assert pulled == {}
+    assert replica.version() == 1
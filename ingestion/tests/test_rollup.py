@@ -0,0 +1,66 @@
+import duckdb
+import pytest
+from ingestion.rollup import build_daily_rollup_sql
+
+
+@pytest.fixture
+def conn():
+    conn = duckdb.connect(database=":memory:")
+    conn.execute("""
+        CREATE TABLE raw_downloads AS
+        SELECT
+            TIMESTAMP '2023-04-02 14:49:15' AS timestamp,
+            'US' AS country_code,
+            'duckdb' AS project,
+            {'version': '0.7.1'} AS file,
+            {
+                'python': python,
+                'system': {'name': 'Linux', 'release': '4.15.0-66-generic'},
+                'cpu': 'x86_64'
+            } AS details
+        FROM (VALUES ('3.8.2'), ('3.8.1'), (NULL)) t(python)
+    """)
+    yield conn
+    conn.close()
+
+
+def test_daily_rollup_matches_dbt_model(conn):
+    rows = conn.execute(f"""
+        SELECT download_date, python_version, daily_download_sum, load_id
+        FROM ({build_daily_rollup_sql("raw_downloads")})
+        ORDER BY python_version NULLS LAST
+    """).fetchall()
+
+    assert [(str(r[0]), r[1], r[2]) for r in rows] == [
+        ("2023-04-02", "3.8", 2),
+        ("2023-04-02", None, 1),
+    ]
+    expected_load_id = conn.execute("""
+        SELECT MD5(CONCAT_WS('|', DATE '2023-04-02', 'Linux', '4.15.0-66-generic',
+            '0.7.1', 'duckdb', 'US', 'x86_64', '3.8'))
+    """).fetchone()[0]
+    assert rows[0][3] == expected_load_id
+
+
+def test_daily_rollup_lean_profile(conn):
+    conn.execute("""
+        CREATE TABLE lean_downloads AS
+        SELECT timestamp, country_code, project, file.version AS version,
+            details.system.name AS system_name,
+            details.system.release AS system_release,
+            details.cpu AS cpu, details.python AS python
+        FROM raw_downloads
+    """)
+    raw = conn.execute(
+        f"SELECT * FROM ({build_daily_rollup_sql('raw_downloads')}) ORDER BY ALL"
+    ).fetchall()
+    lean = conn.execute(
+        f"SELECT * FROM ({build_daily_rollup_sql('lean_downloads', 'lean')}) "
+        "ORDER BY ALL"
+    ).fetchall()
+    assert raw == lean
+
+
+def test_daily_rollup_unknown_profile():
+    with pytest.raises(ValueError, match="Unknown ingestion profile"):
+        build_daily_rollup_sql("raw_downloads", "wide")
@@ -0,0 +1,93 @@
+import duckdb
+import pytest
+from ingestion.sample import build_sample_sql, estimate
+
+
+@pytest.fixture
+def conn():
+    conn = duckdb.connect()
+    conn.execute("""
+        CREATE TABLE downloads AS
+        SELECT
+            TIMESTAMP '2023-01-01' + to_seconds(range * 7 % 172800) AS timestamp,
+            CASE WHEN range % 3 = 0 THEN 'duckdb' ELSE 'pandas' END AS project,
+            CASE range % 5 WHEN 0 THEN 'US' WHEN 1 THEN NULL ELSE 'DE' END
+                AS country_code,
+            {'installer': {'name': CASE WHEN range % 4 = 0 THEN 'uv' ELSE 'pip' END}}
+                AS details
+        FROM range(100000)
+        UNION ALL
+        SELECT TIMESTAMP '2023-01-01 12:00', 'polars', 'FR', {'installer': {'name': 'pip'}}
+    """)
+    conn.execute(f"CREATE TABLE sample AS {build_sample_sql('downloads', 0.01)}")
+    yield conn
+    conn.close()
+
+
+def test_sample_keeps_a_fraction_of_each_stratum(conn):
+    strata = conn.execute("""
+        SELECT
+            project, download_date, country_code,
+            COUNT(*), ANY_VALUE(sample_rows), ANY_VALUE(stratum_rows),
+            SUM(sample_weight)
+        FROM sample
+        GROUP BY ALL
+    """).fetchall()
+    # 3 projects x 2 days x 3 countries, the polars stratum has one row
+    assert len(strata) == 13
+    for *_, sampled, sample_rows, stratum_rows, weights in strata:
+        assert (
+            sampled == sample_rows == max(min(stratum_rows, 2), -(-stratum_rows // 100))
+        )
+        assert weights == pytest.approx(stratum_rows)
+
+
+def test_sample_is_deterministic(conn):
+    again = conn.execute(f"""
+        SELECT COUNT(*) FROM (
+            SELECT * FROM sample
+            EXCEPT ALL
+            {build_sample_sql("downloads", 0.01)}
+        )
+    """).fetchone()[0]
+    assert again == 0
+
+
+def test_sample_fraction_is_validated():
+    with pytest.raises(ValueError, match="fraction"):
+        build_sample_sql("downloads", 0)
+
+
+def test_estimate_total_is_exact(conn):
+    (total,) = estimate(conn, "sample")
+    assert total.group == {}
+    assert total.estimate == pytest.approx(100001)
+    assert total.std_error == pytest.approx(0, abs=1e-6)
+
+
+def test_estimate_bounds_cover_the_true_counts(conn):
+    actual = dict(
+        conn.execute("""
+            SELECT details.installer.name, COUNT(*) FROM downloads
+            WHERE project = 'duckdb' GROUP BY ALL
+        """).fetchall()
+    )
+    estimates = estimate(
+        conn, "sample", ["details.installer.name"], where="project = 'duckdb'"
+    )
+    assert [e.group["details.installer.name"] for e in estimates] == ["pip", "uv"]
+    for e in estimates:
+        assert e.lower <= actual[e.group["details.installer.name"]] <= e.upper
+        assert 0 < e.std_error < 0.2 * e.estimate
+        assert e.sample_rows < actual[e.group["details.installer.name"]] / 50
+
+
+def test_estimate_sums_values(conn):
+    (total,) = estimate(
+        conn, "sample", value="CASE WHEN country_code = 'US' THEN 2 ELSE 0 END"
+    )
+    actual = conn.execute(
+        "SELECT 2 * COUNT(*) FROM downloads WHERE country_code = 'US'"
+    ).fetchone()[0]
+    # Country is a stratum: the total of a function of it is exact
+    assert total.estimate == pytest.approx(actual)
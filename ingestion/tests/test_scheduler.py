@@ -0,0 +1,124 @@
+import threading
+from datetime import date, timedelta
+from unittest.mock import patch
+
+import pytest
+from ingestion.models import PypiJobParameters, QueueTask, SchedulerParameters
+from ingestion.scheduler import Scheduler, TaskQueue, utcnow
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return TaskQueue(str(tmp_path / "queue.duckdb"))
+
+
+def test_enqueue_is_idempotent(queue):
+    assert queue.enqueue(["duckdb", "polars"], "2023-01-01", "2023-01-04") == 6
+    assert queue.enqueue(["duckdb"], "2023-01-01", "2023-01-05") == 1
+    assert queue.counts() == {"pending": 7}
+
+
+def test_claim_most_recent_days_first_with_backfill_limit(queue):
+    queue.enqueue(["duckdb"], "2023-01-01", "2023-01-08")
+
+    tasks = queue.claim(4, fresh_since=date(2023, 1, 6), backfill_limit=1)
+
+    assert [t.day for t in tasks] == [
+        date(2023, 1, 7),
+        date(2023, 1, 6),
+        date(2023, 1, 5),
+    ]
+    assert queue.counts() == {"pending": 4, "running": 3}
+    assert queue.recover() == 3
+    assert queue.counts() == {"pending": 7}
+
+
+def test_concurrent_claims_never_share_a_task(tmp_path):
+    path = str(tmp_path / "queue.duckdb")
+    TaskQueue(path).enqueue(["duckdb", "polars"], "2023-01-01", "2023-01-21")
+    claimed, errors = [], []
+
+    def claim_all():
+        queue = TaskQueue(path, lock_retries=200)
+        try:
+            while tasks := queue.claim(
+                3, fresh_since=date(2023, 1, 1), backfill_limit=0
+            ):
+                claimed.extend((t.project, t.day) for t in tasks)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=claim_all) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(claimed) == len(set(claimed)) == 40
+
+
+def test_enqueue_logs_only_new_tasks(queue):
+    queue.enqueue(["duckdb"], "2023-01-01", "2023-01-03")
+    with patch("ingestion.scheduler.logger") as logger:
+        assert queue.enqueue(["duckdb"], "2023-01-01", "2023-01-03") == 0
+    logger.info.assert_not_called()
+
+
+def test_fail_retries_with_backoff_then_gives_up(queue):
+    queue.enqueue(["duckdb"], "2023-01-01", "2023-01-02")
+    task = queue.claim(1, fresh_since=date(2023, 1, 1), backfill_limit=0)[0]
+
+    queue.fail(
+        task, "boom", max_attempts=2, backoff_seconds=3600, max_backoff_seconds=7200
+    )
+    assert queue.claim(1, fresh_since=date(2023, 1, 1), backfill_limit=0) == []
+    assert queue.counts() == {"pending": 1}
+
+    queue.fail(
+        QueueTask(project="duckdb", day=date(2023, 1, 1), attempts=1),
+        "boom again",
+        max_attempts=2,
+        backoff_seconds=3600,
+        max_backoff_seconds=7200,
+    )
+    assert queue.counts() == {"failed": 1}
+
+    queue.enqueue(["duckdb"], "2023-01-01", "2023-01-02", force=True)
+    assert queue.counts() == {"pending": 1}
+
+
+def test_requeue_unsettled_days(queue):
+    today = utcnow().date()
+    since = today - timedelta(days=4)
+    queue.enqueue(["duckdb"], since.isoformat(), today.isoformat())
+    for task in queue.claim(10, fresh_since=since, backfill_limit=0):
+        queue.complete(task)
+    # Every day loaded one hour after its end
+    queue._execute(
+        "UPDATE tasks SET completed_at = day + INTERVAL 1 DAY + INTERVAL 1 HOUR"
+    )
+
+    # Reloaded once 24h have passed since the end of the day, yesterday not yet
+    assert queue.requeue_unsettled(since, settle_hours=24) == 3
+    assert queue.counts() == {"done": 1, "pending": 3}
+
+
+def test_scheduler_runs_queue_and_retries(queue):
+    queue.enqueue(["duckdb"], "2023-01-01", "2023-01-03")
+    params = PypiJobParameters(gcp_project="test_project", destination="md")
+    scheduler_params = SchedulerParameters(
+        once=True, fresh_days=0, backoff_seconds=0, poll_seconds=1, workers=2
+    )
+    calls = []
+
+    def fake_main(task_params, session=None):
+        calls.append(task_params.start_date)
+        if task_params.start_date == "2023-01-02" and calls.count("2023-01-02") == 1:
+            raise RuntimeError("transient")
+
+    with patch("ingestion.scheduler.main", side_effect=fake_main):
+        Scheduler(params, scheduler_params, queue).run()
+
+    assert queue.counts() == {"done": 2}
+    assert sorted(calls) == ["2023-01-01", "2023-01-02", "2023-01-02"]
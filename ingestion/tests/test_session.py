@@ -0,0 +1,108 @@
+import duckdb
+import pytest
+from unittest.mock import patch, MagicMock
+from ingestion.benchmark import generate_downloads, run_benchmark
+from ingestion.duck import MotherDuckBigQueryLoader
+from ingestion.models import PypiJobParameters
+from ingestion.quality import TimestampRangeRule
+from ingestion.session import LoaderSession
+
+
+@pytest.fixture
+def mock_duckdb():
+    with patch("duckdb.connect") as mock_connect:
+        mock_conn = MagicMock()
+        mock_connect.return_value = mock_conn
+        yield mock_conn
+
+
+def _sql_calls(conn):
+    return [str(call[0][0]) for call in conn.execute.call_args_list]
+
+
+def test_session_is_shared_by_loaders(mock_duckdb):
+    with patch.dict("os.environ", {"motherduck_token": "test_token", "HOME": "/tmp"}):
+        session = LoaderSession()
+        loaders = [
+            MotherDuckBigQueryLoader(
+                motherduck_database="test_db",
+                motherduck_table=table,
+                project_id="test_project",
+                session=session,
+            )
+            for table in ("downloads", "downloads_lean")
+        ]
+
+    sql_calls = _sql_calls(mock_duckdb)
+    assert sql_calls.count("LOAD bigquery;") == 1
+    assert sql_calls.count("ATTACH 'md:'") == 1
+    assert sql_calls.count("CREATE DATABASE IF NOT EXISTS test_db") == 1
+    assert mock_duckdb.cursor.call_count == 2
+    assert loaders[0].temp_table != loaders[1].temp_table
+    assert loaders[0]._ddl_lock is loaders[1]._ddl_lock
+
+
+def test_offline_session_loads_cached_extension(mock_duckdb):
+    mock_duckdb.execute.return_value.fetchone.return_value = (True,)
+
+    LoaderSession(attach_motherduck=False, offline=True)
+
+    sql_calls = _sql_calls(mock_duckdb)
+    assert "LOAD bigquery;" in sql_calls
+    assert "INSTALL bigquery FROM community;" not in sql_calls
+
+
+def test_offline_session_requires_cached_extension(mock_duckdb):
+    mock_duckdb.execute.return_value.fetchone.return_value = (False,)
+
+    with pytest.raises(ValueError, match="not in the local extension cache"):
+        LoaderSession(attach_motherduck=False, offline=True)
+
+
+def test_jobs_share_a_session(tmp_path):
+    source_path = generate_downloads(
+        str(tmp_path / "file_downloads.parquet"), rows=5000, days=2
+    )
+    destination_path = str(tmp_path / "destination.duckdb")
+
+    with LoaderSession(attach_motherduck=False, bigquery_extension=False) as session:
+        for project in ("duckdb", "boto3"):
+            params = PypiJobParameters(
+                start_date="2023-01-01",
+                end_date="2023-01-03",
+                gcp_project="offline-benchmark",
+                destination="md",
+                pypi_project=project,
+            )
+            run_benchmark(source_path, destination_path, params, session=session)
+
+    loaded = dict(
+        duckdb.connect(destination_path)
+        .execute("SELECT project, COUNT(*) FROM pypi_file_downloads GROUP BY ALL")
+        .fetchall()
+    )
+    assert set(loaded) == {"duckdb", "boto3"}
+
+
+def test_session_reads_timestamps_in_utc():
+    connect = duckdb.connect
+
+    def connect_in_los_angeles(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        conn.execute("SET GLOBAL TimeZone = 'America/Los_Angeles'")
+        return conn
+
+    with patch("ingestion.session.duckdb.connect", connect_in_los_angeles):
+        session = LoaderSession(attach_motherduck=False, bigquery_extension=False)
+    cursor = session.cursor()
+    out_of_range = TimestampRangeRule().aggregates(
+        "timestamp", "2023-01-02", "2023-01-03"
+    )["out_of_range"]
+
+    # A whole UTC day, late evening included, is within its [start, end) range
+    assert cursor.execute(f"""
+        SELECT {out_of_range}, MIN(timestamp::DATE) = MAX(timestamp::DATE)
+        FROM (VALUES (TIMESTAMPTZ '2023-01-02 00:00:00+00'),
+            (TIMESTAMPTZ '2023-01-02 23:59:59+00')) AS t(timestamp)
+    """).fetchone() == (0, True)
+    session.close()
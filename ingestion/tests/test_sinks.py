@@ -0,0 +1,133 @@
+import duckdb
+import pytest
+from ingestion.models import PypiJobParameters
+from ingestion.sinks import (
+    LocalDuckDBSink,
+    MotherDuckSink,
+    ParquetSink,
+    build_sinks,
+)
+
+
+@pytest.fixture
+def conn():
+    conn = duckdb.connect(database=":memory:")
+    conn.execute("""
+        CREATE TABLE memory.temp_table AS
+        SELECT
+            TIMESTAMP '2023-01-31 12:00:00' + INTERVAL (range) HOUR AS timestamp,
+            'duckdb' AS project
+        FROM range(48)
+    """)
+    yield conn
+    conn.close()
+
+
+def test_local_duckdb_sink_replaces_window(conn, tmp_path):
+    sink = LocalDuckDBSink(str(tmp_path / "local.duckdb"), "pypi_file_downloads")
+    sink.setup(conn)
+
+    assert (
+        sink.write(conn, "memory.temp_table", "timestamp", "2023-01-31", "2023-02-03")
+        == 48
+    )
+    assert (
+        sink.write(conn, "memory.temp_table", "timestamp", "2023-01-31", "2023-02-03")
+        == 48
+    )
+
+    count = conn.execute(f"SELECT COUNT(*) FROM {sink.table_ref}").fetchone()[0]
+    assert count == 48
+
+
+def test_local_duckdb_sink_keeps_other_projects(conn, tmp_path):
+    sink = LocalDuckDBSink(str(tmp_path / "local.duckdb"), "pypi_file_downloads")
+    sink.setup(conn)
+    sink.write(conn, "memory.temp_table", "timestamp", "2023-01-31", "2023-02-03")
+
+    conn.execute("UPDATE memory.temp_table SET project = 'polars'")
+    sink.write(conn, "memory.temp_table", "timestamp", "2023-01-31", "2023-02-03")
+
+    counts = conn.execute(
+        f"SELECT project, COUNT(*) FROM {sink.table_ref} GROUP BY ALL ORDER BY 1"
+    ).fetchall()
+    assert counts == [("duckdb", 48), ("polars", 48)]
+
+
+def test_parquet_sink_writes_hive_partitions(conn, tmp_path):
+    sink = ParquetSink(str(tmp_path / "out"), "pypi_file_downloads")
+    sink.setup(conn)
+
+    rows = sink.write(
+        conn, "memory.temp_table", "timestamp", "2023-01-31", "2023-02-03"
+    )
+    # Rewriting the same window overwrites its own files
+    sink.write(conn, "memory.temp_table", "timestamp", "2023-01-31", "2023-02-03")
+
+    assert rows == 48
+    partitions = sorted(
+        p.relative_to(tmp_path / "out" / "pypi_file_downloads").parent.as_posix()
+        for p in (tmp_path / "out").rglob("*.parquet")
+    )
+    assert partitions == ["year=2023/month=1", "year=2023/month=2"]
+    count = conn.execute(
+        f"SELECT COUNT(*) FROM read_parquet('{tmp_path}/out/*/*/*/*.parquet')"
+    ).fetchone()[0]
+    assert count == 48
+
+
+def test_parquet_sink_replaces_rows_across_window_boundaries(conn, tmp_path):
+    sink = ParquetSink(str(tmp_path / "out"), "pypi_file_downloads")
+    sink.setup(conn)
+    conn.execute("""
+        CREATE TABLE memory.other AS
+        SELECT TIMESTAMP '2023-02-01 06:00:00' AS timestamp, 'polars' AS project
+    """)
+    sink.write(conn, "memory.other", "timestamp", "2023-02-01", "2023-02-02")
+    sink.write(conn, "memory.temp_table", "timestamp", "2023-01-31", "2023-02-03")
+    # Reloaded with one-day windows, which also write fewer rows
+    for start, end in [
+        ("2023-01-31", "2023-02-01"),
+        ("2023-02-01", "2023-02-02"),
+        ("2023-02-02", "2023-02-03"),
+    ]:
+        conn.execute(f"""
+            CREATE OR REPLACE TABLE memory.window AS
+            SELECT * FROM memory.temp_table
+            WHERE timestamp::DATE = '{start}' AND hour(timestamp) % 2 = 0
+        """)
+        sink.write(conn, "memory.window", "timestamp", start, end)
+
+    files = sorted(
+        p.relative_to(tmp_path / "out" / "pypi_file_downloads").as_posix()
+        for p in (tmp_path / "out").rglob("*")
+        if p.is_file()
+    )
+    assert files == [
+        "year=2023/month=1/data_0.parquet",
+        "year=2023/month=2/data_0.parquet",
+    ]
+    counts = conn.execute(f"""
+        SELECT project, COUNT(*)
+        FROM read_parquet('{tmp_path}/out/*/*/*/*.parquet')
+        GROUP BY ALL ORDER BY ALL
+    """).fetchall()
+    assert counts == [("duckdb", 24), ("polars", 1)]
+
+
+def test_build_sinks():
+    params = PypiJobParameters(
+        gcp_project="test_project", destination="local,s3,md", parquet_path="s3://b"
+    )
+    sinks = build_sinks(params)
+
+    assert [type(s) for s in sinks] == [LocalDuckDBSink, ParquetSink, MotherDuckSink]
+    assert sinks[0].path == "duckdb_stats.duckdb"
+    assert sinks[1].path == "s3://b"
+    assert sinks[2].table_ref == "duckdb_stats.main.pypi_file_downloads"
+
+
+def test_build_sinks_unknown_destination():
+    params = PypiJobParameters(gcp_project="test_project", destination="ftp")
+    with pytest.raises(ValueError, match="Unknown destination"):
+        build_sinks(params)
@@ -1,11 +1,20 @@
+{#
+    Re-export only the year/month partitions overlapping the [start_date,
+    end_date) window of the run, each one whole from the table. Partition
+    files keep the same names (data_0, ...), so they are overwritten and the
+    partitions of other months are left as they are.
+#}
 {% macro export_partition_data(date_column, table) %}
 {% set s3_path = env_var('TRANSFORM_S3_PATH_OUTPUT', 'my-bucket-path') %}
     COPY (
         SELECT *,
-            YEAR({{ date_column }}) AS year, 
-            MONTH({{ date_column }}) AS month 
+            YEAR({{ date_column }}) AS year,
+            MONTH({{ date_column }}) AS month
         FROM {{ table }}
-    ) 
+        WHERE {{ date_column }} >= DATE_TRUNC('month', DATE '{{ var("start_date") }}')
+        AND {{ date_column }} < DATE_TRUNC('month', DATE '{{ var("end_date") }}' - INTERVAL 1 DAY) + INTERVAL 1 MONTH
+        ORDER BY project, {{ date_column }}
+    )
     TO '{{ s3_path }}/{{ table }}'
      (FORMAT PARQUET, PARTITION_BY (year, month), OVERWRITE_OR_IGNORE 1, COMPRESSION 'ZSTD', ROW_GROUP_SIZE 1000000);
 {% endmacro %}
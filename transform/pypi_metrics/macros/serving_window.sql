@@ -0,0 +1,13 @@
+{#
+    Incremental runs of the serving rollups only recompute the periods (days,
+    weeks or months) overlapping the [start_date, end_date) window of the run.
+    With a unique_key on the period, delete+insert then replaces each of these
+    periods wholesale, so a run costs the size of the window, not of history.
+#}
+{% macro serving_window(date_column, grain='day') %}
+{% if is_incremental() %}
+WHERE
+    {{ date_column }} >= DATE_TRUNC('{{ grain }}', DATE '{{ var("start_date") }}')
+    AND {{ date_column }} < DATE_TRUNC('{{ grain }}', DATE '{{ var("end_date") }}' - INTERVAL 1 DAY) + INTERVAL 1 {{ grain }}
+{% endif %}
+{% endmacro %}
@@ -1,27 +1,64 @@
+{#
+    Incremental on every target: a run aggregates only the [start_date,
+    end_date) window and replaces those (project, download_date) pairs
+    wholesale (delete+insert) instead of merging on load_id against all
+    history. Keying on the project too keeps the days of the other projects,
+    e.g. those only written by the ingestion rollup. The range predicates let
+    the delete prune the row groups of other days. load_id is kept for the
+    rows written by the ingestion rollup.
+#}
+{{ config(
+    materialized='incremental',
+    incremental_strategy='delete+insert',
+    unique_key=['project', 'download_date'],
+    incremental_predicates=[
+        "download_date >= '" ~ var('start_date') ~ "'",
+        "download_date < '" ~ var('end_date') ~ "'",
+    ],
+) }}
+
 {% set database_name = var('database_name', 'duckdb_stats') %}
+{#
+    'lean' reads the flattened narrow table written by the ingestion lean
+    profile. 'compact' stores dimension ids instead of values and reads the
+    `_decoded` view of the table, which joins back the values under the lean
+    column names and takes python_version from the python dimension.
+#}
+{% set profile = var('ingestion_profile', 'raw') %}
+{% set lean = profile in ('lean', 'compact') %}
+{% set compact = profile == 'compact' %}
+{% set python_column = 'python' if lean else 'details.python' %}
 
 WITH pre_aggregated_data AS (
     SELECT
         timestamp :: date as download_date,
-        details.system.name AS system_name,
-        details.system.release AS system_release,
-        file.version AS version,
+        {{ 'system_name' if lean else 'details.system.name AS system_name' }},
+        {{ 'system_release' if lean else 'details.system.release AS system_release' }},
+        {{ 'version' if lean else 'file.version AS version' }},
         project,
         country_code,
-        details.cpu,
+        {{ 'cpu' if lean else 'details.cpu' }},
+        {% if compact %}
+        python_version
+        {% else %}
         CASE
-            WHEN details.python IS NULL THEN NULL
+            WHEN {{ python_column }} IS NULL THEN NULL
             ELSE CONCAT(
-                SPLIT_PART(details.python, '.', 1),
+                SPLIT_PART({{ python_column }}, '.', 1),
                 '.',
-                SPLIT_PART(details.python, '.', 2)
+                SPLIT_PART({{ python_column }}, '.', 2)
             )
         END AS python_version
+        {% endif %}
     FROM
+        {% if compact %}
+        {{ dbt_unit_testing.source(database_name, 'pypi_file_downloads_decoded') }}
+        {% else %}
         {{ dbt_unit_testing.source(
             'external_source' if var('data_source') == 'external_source' else database_name,
             'pypi_file_downloads'
         )}}
+        {% endif %}
     WHERE
         download_date >= '{{ var("start_date") }}'
         AND download_date < '{{ var("end_date") }}'
@@ -42,3 +79,8 @@ FROM
     pre_aggregated_data
 GROUP BY
     ALL
+{# Written sorted so the min/max statistics of each row group let project and
+   download_date filters skip the rest of the table #}
+ORDER BY
+    project,
+    download_date
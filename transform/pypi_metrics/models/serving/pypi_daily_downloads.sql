@@ -0,0 +1,14 @@
+{{ config(unique_key=['project', 'download_date']) }}
+
+SELECT
+    project,
+    download_date,
+    SUM(daily_download_sum) AS daily_downloads
+FROM
+    {{ dbt_unit_testing.ref('pypi_daily_stats') }}
+{{ serving_window('download_date') }}
+GROUP BY
+    ALL
+ORDER BY
+    project,
+    download_date
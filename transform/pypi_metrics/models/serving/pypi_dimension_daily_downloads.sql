@@ -0,0 +1,29 @@
+{{ config(unique_key=['project', 'download_date']) }}
+
+{# One row per day and value of each breakdown dimension, NULL values included
+   as the dashboard shows them as their own group #}
+SELECT
+    project,
+    download_date,
+    dimension,
+    value,
+    SUM(daily_download_sum) AS downloads
+FROM (
+    SELECT
+        project,
+        download_date,
+        version,
+        python_version,
+        country_code,
+        daily_download_sum
+    FROM
+        {{ dbt_unit_testing.ref('pypi_daily_stats') }}
+    {{ serving_window('download_date') }}
+) UNPIVOT INCLUDE NULLS (
+    value FOR dimension IN (version, python_version, country_code)
+)
+GROUP BY
+    ALL
+ORDER BY
+    project,
+    download_date
@@ -0,0 +1,16 @@
+{{ config(unique_key=['project', 'month_start_date']) }}
+
+SELECT
+    project,
+    DATE_TRUNC('month', download_date)::DATE AS month_start_date,
+    dimension,
+    value,
+    SUM(downloads) AS downloads
+FROM
+    {{ dbt_unit_testing.ref('pypi_dimension_daily_downloads') }}
+{{ serving_window('download_date', 'month') }}
+GROUP BY
+    ALL
+ORDER BY
+    project,
+    month_start_date
@@ -0,0 +1,51 @@
+{{ config(materialized='table') }}
+
+{# Single row of dashboard KPIs over all projects. The latest week (when in the
+   last 4 weeks) and the latest month are in progress and left out of the
+   last / previous comparisons. #}
+WITH weekly AS (
+    SELECT
+        week_start_date,
+        SUM(weekly_downloads) AS weekly_downloads
+    FROM {{ dbt_unit_testing.ref('pypi_weekly_downloads') }}
+    GROUP BY ALL
+),
+
+complete_weeks AS (
+    SELECT
+        *,
+        ROW_NUMBER() OVER (ORDER BY week_start_date DESC) AS week_rank
+    FROM weekly
+    WHERE week_start_date != (
+        SELECT MAX(week_start_date)
+        FROM weekly
+        WHERE week_start_date >= DATE_TRUNC('week', CURRENT_DATE - INTERVAL 4 WEEK)
+    )
+),
+
+monthly AS (
+    SELECT
+        month_start_date,
+        SUM(monthly_downloads) AS monthly_downloads
+    FROM {{ dbt_unit_testing.ref('pypi_monthly_downloads') }}
+    GROUP BY ALL
+),
+
+ranked_months AS (
+    SELECT
+        *,
+        ROW_NUMBER() OVER (ORDER BY month_start_date DESC) AS month_rank
+    FROM monthly
+)
+
+SELECT
+    (SELECT MAX(download_date) FROM {{ dbt_unit_testing.ref('pypi_daily_downloads') }}) AS refresh_date,
+    (SELECT SUM(monthly_downloads) FROM monthly) AS total_downloads,
+    (SELECT week_start_date FROM complete_weeks WHERE week_rank = 1) AS last_week_start_date,
+    (SELECT weekly_downloads FROM complete_weeks WHERE week_rank = 1) AS last_week_downloads,
+    (SELECT week_start_date FROM complete_weeks WHERE week_rank = 2) AS previous_week_start_date,
+    (SELECT weekly_downloads FROM complete_weeks WHERE week_rank = 2) AS previous_week_downloads,
+    (SELECT month_start_date FROM ranked_months WHERE month_rank = 2) AS last_month_start_date,
+    (SELECT monthly_downloads FROM ranked_months WHERE month_rank = 2) AS last_month_downloads,
+    (SELECT month_start_date FROM ranked_months WHERE month_rank = 3) AS previous_month_start_date,
+    (SELECT monthly_downloads FROM ranked_months WHERE month_rank = 3) AS previous_month_downloads
@@ -0,0 +1,14 @@
+{{ config(unique_key=['project', 'month_start_date']) }}
+
+SELECT
+    project,
+    DATE_TRUNC('month', download_date)::DATE AS month_start_date,
+    SUM(daily_downloads) AS monthly_downloads
+FROM
+    {{ dbt_unit_testing.ref('pypi_daily_downloads') }}
+{{ serving_window('download_date', 'month') }}
+GROUP BY
+    ALL
+ORDER BY
+    project,
+    month_start_date
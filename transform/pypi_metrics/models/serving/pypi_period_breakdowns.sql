@@ -0,0 +1,40 @@
+{{ config(materialized='table') }}
+
+{# Downloads per breakdown value over the dashboard periods: the last 7, 30
+   and 90 days (from the daily rollup) and all time (period_days 0, from the
+   monthly rollup). Rebuilt on every run as the periods move with the date. #}
+WITH periods AS (
+    SELECT UNNEST([7, 30, 90]) AS period_days
+),
+
+recent AS (
+    SELECT *
+    FROM {{ dbt_unit_testing.ref('pypi_dimension_daily_downloads') }}
+    WHERE download_date >= CURRENT_DATE - INTERVAL 90 DAY
+)
+
+SELECT
+    periods.period_days,
+    recent.project,
+    recent.dimension,
+    recent.value,
+    SUM(recent.downloads) AS downloads
+FROM
+    recent
+    JOIN periods
+        ON recent.download_date >= CURRENT_DATE - periods.period_days * INTERVAL 1 DAY
+GROUP BY
+    ALL
+
+UNION ALL
+
+SELECT
+    0 AS period_days,
+    project,
+    dimension,
+    value,
+    SUM(downloads) AS downloads
+FROM
+    {{ dbt_unit_testing.ref('pypi_dimension_monthly_downloads') }}
+GROUP BY
+    ALL
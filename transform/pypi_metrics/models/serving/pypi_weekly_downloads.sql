@@ -0,0 +1,14 @@
+{{ config(unique_key=['project', 'week_start_date']) }}
+
+SELECT
+    project,
+    DATE_TRUNC('week', download_date)::DATE AS week_start_date,
+    SUM(daily_downloads) AS weekly_downloads
+FROM
+    {{ dbt_unit_testing.ref('pypi_daily_downloads') }}
+{{ serving_window('download_date', 'week') }}
+GROUP BY
+    ALL
+ORDER BY
+    project,
+    week_start_date
@@ -0,0 +1,47 @@
+{{ config(tags=['unit-test', 'compact']) }}
+
+{# Only compiles against the compact model, run with ingestion_profile 'compact' #}
+{% if var('ingestion_profile', 'raw') == 'compact' %}
+{% call dbt_unit_testing.test('pypi_daily_stats', 'compact_profile_reads_the_decoded_view') %}
+
+  {% call dbt_unit_testing.mock_source(var('database_name', 'duckdb_stats'), 'pypi_file_downloads_decoded') %}
+    SELECT
+      '2023-04-02 14:49:15'::timestamp AS timestamp,
+      'duckdb' AS project,
+      'US' AS country_code,
+      '0.7.1' AS version,
+      'Linux' AS system_name,
+      '4.15.0-66-generic' AS system_release,
+      'x86_64' AS cpu,
+      '3.8.2' AS python,
+      'TLSv1.2' AS tls_protocol,
+      'ECDHE-RSA-AES128-GCM-SHA256' AS tls_cipher,
+      '3.8' AS python_version
+    UNION ALL
+    SELECT
+      '2023-04-02 16:02:41'::timestamp AS timestamp,
+      'duckdb' AS project,
+      'US' AS country_code,
+      '0.7.1' AS version,
+      'Linux' AS system_name,
+      '4.15.0-66-generic' AS system_release,
+      'x86_64' AS cpu,
+      '3.8.1' AS python,
+      'TLSv1.2' AS tls_protocol,
+      'ECDHE-RSA-AES128-GCM-SHA256' AS tls_cipher,
+      '3.8' AS python_version
+  {% endcall %}
+
+{% call dbt_unit_testing.expect() %}
+    SELECT
+      '2023-04-02'::date AS download_date,
+      'duckdb' AS project,
+      '0.7.1' AS version,
+      '3.8' AS python_version,
+      'x86_64' AS cpu,
+      'Linux' AS system_name,
+      2 AS daily_download_sum
+  {% endcall %}
+
+{% endcall %}
+{% endif %}
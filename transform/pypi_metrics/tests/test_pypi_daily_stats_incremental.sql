@@ -0,0 +1,43 @@
+{{ config(tags=['unit-test']) }}
+
+{#
+    A run emits one row per aggregated (project, download_date, dimensions)
+    of its window, only for the projects of the source: these are the keys
+    the (project, download_date) delete+insert replaces.
+#}
+{% call dbt_unit_testing.test('pypi_daily_stats', 'window_emits_only_source_project_days') %}
+
+  {% call dbt_unit_testing.mock_source('external_source', 'pypi_file_downloads') %}
+    SELECT
+      '2023-04-02 14:49:15'::timestamp AS timestamp,
+      'US' AS country_code,
+      'duckdb' AS project,
+      STRUCT_PACK(version := '0.7.1') AS file,
+      STRUCT_PACK(
+          python := '3.8.2',
+          system := STRUCT_PACK(name := 'Linux', release := '4.15.0-66-generic'),
+          cpu := 'x86_64'
+      ) AS details
+    UNION ALL
+    SELECT
+      '2023-04-05 09:12:03'::timestamp AS timestamp,
+      'US' AS country_code,
+      'duckdb' AS project,
+      STRUCT_PACK(version := '0.7.1') AS file,
+      STRUCT_PACK(
+          python := '3.8.2',
+          system := STRUCT_PACK(name := 'Linux', release := '4.15.0-66-generic'),
+          cpu := 'x86_64'
+      ) AS details
+  {% endcall %}
+
+{% call dbt_unit_testing.expect() %}
+    SELECT
+      '2023-04-02'::date AS download_date,
+      'duckdb' AS project,
+      '0.7.1' AS version,
+      '3.8' AS python_version,
+      1 AS daily_download_sum
+  {% endcall %}
+
+{% endcall %}
@@ -0,0 +1,35 @@
+{{ config(tags=['unit-test']) }}
+
+{% call dbt_unit_testing.test ('pypi_dimension_daily_downloads','unpivots_dimensions_keeping_nulls') %}
+
+  {% call dbt_unit_testing.mock_ref('pypi_daily_stats') %}
+    SELECT
+      '2023-04-02'::date AS download_date,
+      'duckdb' AS project,
+      '0.7.1' AS version,
+      '3.8' AS python_version,
+      'US' AS country_code,
+      2 AS daily_download_sum
+    UNION ALL
+    SELECT
+      '2023-04-02'::date AS download_date,
+      'duckdb' AS project,
+      '0.7.1' AS version,
+      NULL AS python_version,
+      'FR' AS country_code,
+      3 AS daily_download_sum
+  {% endcall %}
+
+{% call dbt_unit_testing.expect() %}
+    SELECT '2023-04-02'::date AS download_date, 'duckdb' AS project, 'version' AS dimension, '0.7.1' AS value, 5 AS downloads
+    UNION ALL
+    SELECT '2023-04-02'::date, 'duckdb', 'python_version', '3.8', 2
+    UNION ALL
+    SELECT '2023-04-02'::date, 'duckdb', 'python_version', NULL, 3
+    UNION ALL
+    SELECT '2023-04-02'::date, 'duckdb', 'country_code', 'US', 2
+    UNION ALL
+    SELECT '2023-04-02'::date, 'duckdb', 'country_code', 'FR', 3
+  {% endcall %}
+
+{% endcall %}